@@ -0,0 +1,121 @@
+"""Анализ позиции: итеративное углубление с несколькими главными вариантами (multi-PV).
+
+Результаты отдаются по мере готовности каждой глубины:
+
+    for info in analyse(game, multipv=3, max_depth=4):
+        print(info['depth'], [line['pv_notation'] for line in info['lines']])
+
+Остановить анализ можно в любой момент: выйти из цикла (генератор закроется),
+установить stop_event или задать лимиты времени и узлов.
+"""
+import threading
+import time
+
+from chess import ChessGame
+from engine import MATE_SCORE, SearchStopped, Searcher, order_moves
+
+# Оценки ближе этого порога к MATE_SCORE считаются матовыми
+MATE_THRESHOLD = MATE_SCORE - 1000
+
+
+def format_move(game, move):
+    """Ход в длинной алгебраической нотации: e2e4, e7e8q"""
+    from_pos, to_pos = move[0], move[1]
+    text = game.position_to_notation(from_pos) + game.position_to_notation(to_pos)
+    piece = game.get_piece_at(from_pos)
+    if piece.lower() == 'p' and to_pos[0] in (0, 7):
+        text += (move[2] if len(move) > 2 and move[2] else 'q').lower()
+    return text
+
+
+def format_pv(game, pv):
+    """Главный вариант в длинной нотации (ходы проигрываются на копии позиции)"""
+    work = copy_game(game)
+    moves = []
+    for move in pv:
+        moves.append(format_move(work, move))
+        work._apply_move(move[0], move[1], move[2] if len(move) > 2 and move[2] else 'Q')
+    return moves
+
+
+def mate_distance(score):
+    """Число ходов до мата (отрицательное - мат нам) или None"""
+    if abs(score) < MATE_THRESHOLD:
+        return None
+    plies = MATE_SCORE - abs(score)
+    moves = (plies + 1) // 2
+    return moves if score > 0 else -moves
+
+
+def copy_game(game):
+    """Независимая копия позиции для поиска (история ходов не копируется)"""
+    work = ChessGame()
+    work.set_position(game.get_position())
+    work.halfmove_clock = game.halfmove_clock
+    return work
+
+
+def analyse(game, multipv=3, max_depth=None, node_limit=None, movetime=None, stop_event=None):
+    """Итеративное углубление: после каждой завершенной глубины отдается словарь
+
+    {'depth', 'lines': [{'score', 'mate', 'pv', 'pv_notation'}], 'nodes', 'time', 'nps'}.
+    Поиск идет на копии позиции, поэтому game можно использовать параллельно.
+    """
+    work = copy_game(game)
+    deadline = time.perf_counter() + movetime if movetime is not None else None
+    searcher = Searcher(node_limit=node_limit, deadline=deadline, stop_event=stop_event)
+
+    root_moves = order_moves(work, work.generate_moves(work.current_player))
+    if not root_moves:
+        return
+
+    start = time.perf_counter()
+    depth = 0
+    while max_depth is None or depth < max_depth:
+        depth += 1
+        try:
+            lines = searcher.search_root(work, depth, multipv, root_moves)
+        except SearchStopped:
+            return
+
+        # На следующей глубине лучшие ходы ищутся первыми
+        best = [line['move'] for line in lines]
+        root_moves = best + [move for move in root_moves if move not in best]
+
+        elapsed = time.perf_counter() - start
+        yield {
+            'depth': depth,
+            'lines': [
+                {
+                    'score': line['score'],
+                    'mate': mate_distance(line['score']),
+                    'pv': line['pv'],
+                    'pv_notation': format_pv(work, line['pv']),
+                }
+                for line in lines
+            ],
+            'nodes': searcher.nodes,
+            'time': elapsed,
+            'nps': int(searcher.nodes / elapsed) if elapsed > 0 else 0,
+        }
+
+        # Во всех вариантах найден форсированный мат - углубляться дальше незачем
+        if all(mate_distance(line['score']) is not None for line in lines):
+            return
+
+
+async def analyse_async(game, **kwargs):
+    """Асинхронная версия analyse: каждая глубина считается в отдельном потоке"""
+    # asyncio импортируется только здесь: он заметно замедляет запуск UCI и игры с движком
+    import asyncio
+
+    stop_event = kwargs.pop('stop_event', None) or threading.Event()
+    iterator = analyse(game, stop_event=stop_event, **kwargs)
+    try:
+        while True:
+            info = await asyncio.to_thread(next, iterator, None)
+            if info is None:
+                return
+            yield info
+    finally:
+        stop_event.set()
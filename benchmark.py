@@ -0,0 +1,498 @@
+"""Набор бенчмарков операций ChessGame: время на вызов, пик памяти и сравнение с базовой линией.
+
+Каждая операция выполняется на фиксированных сценарных партиях и позициях: сначала
+прогрев, затем серия повторов (в отчет идут медиана и минимум), и отдельный прогон
+под tracemalloc для пика памяти. Минимальное время делится на время калибровочного
+цикла, поэтому базовые линии с разных машин и версий Python сравнимы между собой.
+
+    python benchmark.py --save baseline.json
+    python benchmark.py --compare baseline.json --threshold 0.15
+    python chess.py --bench --only make_move undo_move
+    python benchmark.py --startup --budget 0.05
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from chess import BoardRenderer, ChessGame, Position, tables_cache_path
+from instrumentation import SCRIPTED_GAMES
+
+# Версия набора: меняется при изменении сценариев, иначе сравнение с базовой линией некорректно
+BENCHMARK_VERSION = 1
+
+# Позиции для операций, не зависящих от истории партии
+BENCHMARK_POSITIONS = {
+    'startpos': "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    'kiwipete': "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    'middlegame': "r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP2BPPP/R2QKB1R w KQ - 0 8",
+    'endgame': "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+}
+
+# Сценарная партия для операций с историей
+BENCHMARK_GAME = SCRIPTED_GAMES['opera_game']
+
+DEFAULT_WARMUP = 2
+DEFAULT_REPEAT = 7
+DEFAULT_THRESHOLD = 0.20
+
+# Разница пика памяти меньше этого порога (байт) не считается регрессией
+MEMORY_NOISE = 4096
+
+# Бюджет холодного старта (с): импорт chess и создание первой партии, без запуска интерпретатора
+STARTUP_BUDGET = 0.05
+STARTUP_SCRIPT = ("import time; start = time.perf_counter(); import chess; imported = time.perf_counter(); "
+                  "chess.ChessGame(); print(imported - start, time.perf_counter() - imported)")
+
+# Зарегистрированные бенчмарки: имя -> (подготовка, число вызовов за повтор)
+BENCHMARKS = {}
+
+
+def benchmark(name, number=1):
+    """Регистрация бенчмарка: функция получает временный каталог и возвращает
+    подготовленную функцию без аргументов, которая выполняет операцию number раз"""
+    def register(setup):
+        BENCHMARKS[name] = (setup, number)
+        return setup
+    return register
+
+
+def _played_game(notation=BENCHMARK_GAME):
+    """Партия со сделанными ходами сценария"""
+    game = ChessGame()
+    for move in ChessGame.parse_game_text(notation):
+        from_pos, to_pos, promotion = game.parse_move_notation(move, game.current_player)
+        game._apply_move(from_pos, to_pos, promotion or 'Q')
+    return game
+
+
+def _position_games():
+    games = []
+    for fen in BENCHMARK_POSITIONS.values():
+        game = ChessGame()
+        game.load_fen(fen)
+        games.append(game)
+    return games
+
+
+def _game_file(tmp_dir):
+    path = os.path.join(tmp_dir, 'benchmark_game.txt')
+    if not os.path.exists(path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(BENCHMARK_GAME + "\n")
+    return path
+
+
+@benchmark('parse_move_notation')
+def _bench_parse_move_notation(tmp_dir):
+    # Разбор каждого хода партии в позиции перед ним
+    cases = []
+    game = ChessGame()
+    for move in ChessGame.parse_game_text(BENCHMARK_GAME):
+        work = ChessGame()
+        work.set_position(game.get_position())
+        cases.append((work, move))
+        from_pos, to_pos, promotion = game.parse_move_notation(move, game.current_player)
+        game._apply_move(from_pos, to_pos, promotion or 'Q')
+
+    def run():
+        for work, move in cases:
+            work.parse_move_notation(move, work.current_player)
+    return run
+
+
+@benchmark('make_move')
+def _bench_make_move(tmp_dir):
+    moves = []
+    game = ChessGame()
+    for move in ChessGame.parse_game_text(BENCHMARK_GAME):
+        parsed = game.parse_move_notation(move, game.current_player)
+        moves.append(parsed)
+        game._apply_move(parsed[0], parsed[1], parsed[2] or 'Q')
+    fresh = ChessGame()
+
+    def run():
+        for from_pos, to_pos, promotion in moves:
+            fresh.make_move(from_pos, to_pos, promotion or 'Q')
+    return run
+
+
+@benchmark('undo_move')
+def _bench_undo_move(tmp_dir):
+    # Откат всей партии одним вызовом
+    game = _played_game()
+
+    def run():
+        game.undo_move(len(game.move_history))
+    return run
+
+
+@benchmark('redo')
+def _bench_redo(tmp_dir):
+    # Повтор всей откаченной партии одним вызовом
+    game = _played_game()
+    game.undo_move(len(game.move_history))
+
+    def run():
+        game.redo(len(game.redo_stack))
+    return run
+
+
+@benchmark('save_game_to_file')
+def _bench_save_game_to_file(tmp_dir):
+    game = _played_game()
+    path = os.path.join(tmp_dir, 'benchmark_saved.txt')
+
+    def run():
+        game.save_game_to_file(path)
+    return run
+
+
+@benchmark('load_game_from_file')
+def _bench_load_game_from_file(tmp_dir):
+    game = ChessGame()
+    path = _game_file(tmp_dir)
+
+    def run():
+        game.load_game_from_file(path)
+    return run
+
+
+@benchmark('replay_next')
+def _bench_replay_next(tmp_dir):
+    # Просмотр всей загруженной партии вперед
+    game = ChessGame()
+    game.load_game_from_file(_game_file(tmp_dir))
+
+    def run():
+        while game.replay_next():
+            pass
+    return run
+
+
+@benchmark('replay_prev')
+def _bench_replay_prev(tmp_dir):
+    # Просмотр всей партии назад от последнего хода
+    game = ChessGame()
+    game.load_game_from_file(_game_file(tmp_dir))
+    while game.replay_next():
+        pass
+
+    def run():
+        while game.replay_prev():
+            pass
+    return run
+
+
+@benchmark('get_move_notations', number=10)
+def _bench_get_move_notations(tmp_dir):
+    game = _played_game()
+
+    def run():
+        for _ in range(10):
+            game.get_move_notations()
+    return run
+
+
+@benchmark('get_threatened_pieces', number=10)
+def _bench_get_threatened_pieces(tmp_dir):
+    # Кэш позиции сбрасывается перед каждым вызовом: меряется расчет, а не попадание в кэш
+    games = _position_games()
+
+    def run():
+        for _ in range(10):
+            for game in games:
+                game._invalidate_position_cache()
+                game.get_threatened_pieces(game.current_player)
+    return run
+
+
+@benchmark('get_hanging_pieces', number=10)
+def _bench_get_hanging_pieces(tmp_dir):
+    games = _position_games()
+
+    def run():
+        for _ in range(10):
+            for game in games:
+                game._invalidate_position_cache()
+                game.get_hanging_pieces(game.current_player)
+    return run
+
+
+@benchmark('generate_moves', number=10)
+def _bench_generate_moves(tmp_dir):
+    games = _position_games()
+
+    def run():
+        for _ in range(10):
+            for game in games:
+                game.generate_moves(game.current_player)
+    return run
+
+
+@benchmark('get_legal_moves_by_origin', number=10)
+def _bench_get_legal_moves_by_origin(tmp_dir):
+    games = _position_games()
+
+    def run():
+        for _ in range(10):
+            for game in games:
+                game._invalidate_position_cache()
+                game.get_legal_moves_by_origin(game.current_player)
+    return run
+
+
+@benchmark('is_checkmate', number=10)
+def _bench_is_checkmate(tmp_dir):
+    games = _position_games()
+
+    def run():
+        for _ in range(10):
+            for game in games:
+                game._invalidate_position_cache()
+                game.is_checkmate(game.current_player)
+    return run
+
+
+@benchmark('fen', number=100)
+def _bench_fen(tmp_dir):
+    # Чтение и запись FEN
+    game = ChessGame()
+    fens = list(BENCHMARK_POSITIONS.values())
+
+    def run():
+        for _ in range(100):
+            for fen in fens:
+                game.load_fen(fen)
+                game.get_fen()
+    return run
+
+
+@benchmark('position_apply', number=100)
+def _bench_position_apply(tmp_dir):
+    game = _played_game()
+    steps = [(state['position'], (state['from_pos'], state['to_pos'], state.get('promotion')))
+             for state in game.move_history]
+
+    def run():
+        for _ in range(100):
+            for position, move in steps:
+                position.apply(move)
+    return run
+
+
+@benchmark('print_board', number=100)
+def _bench_print_board(tmp_dir):
+    game = _played_game()
+    game.renderer = BoardRenderer(io.StringIO())
+    highlighted = [(row, col) for row in range(2, 6) for col in range(8)]
+    threatened = [(0, 4), (7, 4)]
+
+    def run():
+        for _ in range(100):
+            game.renderer.output = io.StringIO()
+            game.print_board(highlighted, threatened)
+    return run
+
+
+def calibrate(repeat=10):
+    """Время фиксированного цикла на чистом Python: делитель для сравнения между машинами"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        total = 0
+        for i in range(200000):
+            total += i * i % 7
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def measure(name, tmp_dir, warmup=DEFAULT_WARMUP, repeat=DEFAULT_REPEAT):
+    """Замер одной операции: время на вызов (медиана, минимум, среднее) и пик памяти"""
+    setup, number = BENCHMARKS[name]
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for index in range(warmup + repeat):
+            run = setup(tmp_dir)
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            if index >= warmup:
+                timings.append(elapsed / number)
+
+        # Пик памяти - в отдельном прогоне: tracemalloc замедляет выполнение
+        run = setup(tmp_dir)
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'number': number,
+        'median': statistics.median(timings),
+        'min': min(timings),
+        'mean': statistics.fmean(timings),
+        'peak_memory': peak,
+    }
+
+
+def run_benchmarks(names=None, warmup=DEFAULT_WARMUP, repeat=DEFAULT_REPEAT):
+    """Выполнить бенчмарки и вернуть отчет для сохранения в JSON"""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in names or BENCHMARKS:
+            results[name] = measure(name, tmp_dir, warmup, repeat)
+    # Калибровка после прогона, когда частота процессора уже установилась
+    calibration = calibrate()
+    for result in results.values():
+        # Минимум меньше всего зависит от фоновой нагрузки
+        result['normalized'] = result['min'] / calibration
+    return {
+        'version': BENCHMARK_VERSION,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'calibration': calibration,
+        'warmup': warmup,
+        'repeat': repeat,
+        'created_at': time.time(),
+        'results': results,
+    }
+
+
+def compare(report, baseline, threshold=DEFAULT_THRESHOLD):
+    """Сравнение с базовой линией по нормированному времени и пику памяти.
+
+    Возвращает {имя: {'time_ratio', 'memory_ratio', 'regression', 'improvement'}}.
+    """
+    comparison = {}
+    for name, result in report['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            continue
+        time_ratio = result['normalized'] / base['normalized'] if base['normalized'] else 1.0
+        memory_ratio = result['peak_memory'] / base['peak_memory'] if base['peak_memory'] else 1.0
+        memory_regression = (memory_ratio > 1 + threshold and
+                             result['peak_memory'] - base['peak_memory'] > MEMORY_NOISE)
+        comparison[name] = {
+            'time_ratio': time_ratio,
+            'memory_ratio': memory_ratio,
+            'regression': time_ratio > 1 + threshold or memory_regression,
+            'improvement': time_ratio < 1 - threshold,
+        }
+    return comparison
+
+
+def format_report(report, comparison=None):
+    """Текстовый отчет по операциям"""
+    lines = [
+        f"Python {report['python']} ({report['implementation']}), {report['platform']}",
+        f"Калибровка: {report['calibration'] * 1e3:.2f} мс, прогрев {report['warmup']}, "
+        f"повторов {report['repeat']}",
+        "",
+        f"{'Операция':<28}{'Медиана, мкс':>14}{'Мин., мкс':>12}{'Норм.':>9}{'Пик, КБ':>10}{'К базе':>10}",
+        "-" * 83,
+    ]
+    for name, result in report['results'].items():
+        verdict = ''
+        if comparison is not None and name in comparison:
+            entry = comparison[name]
+            verdict = f"{(entry['time_ratio'] - 1) * 100:+.0f}%"
+            if entry['regression']:
+                verdict += ' !'
+        lines.append(
+            f"{name:<28}{result['median'] * 1e6:>14.1f}{result['min'] * 1e6:>12.1f}"
+            f"{result['normalized']:>9.3f}{result['peak_memory'] / 1024:>10.1f}{verdict:>10}"
+        )
+    lines.append("-" * 83)
+    if comparison is not None:
+        regressions = [name for name, entry in comparison.items() if entry['regression']]
+        improvements = [name for name, entry in comparison.items() if entry['improvement']]
+        lines.append(f"Регрессии: {', '.join(regressions) or 'нет'}")
+        lines.append(f"Ускорения: {', '.join(improvements) or 'нет'}")
+    return "\n".join(lines)
+
+
+def measure_startup(repeat=DEFAULT_REPEAT):
+    """Холодный старт в новых процессах: {'import', 'first_game', 'total', 'import_no_cache'}.
+
+    Первый запуск идет без кэша таблиц (он удаляется и строится заново), остальные - с кэшем.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+
+    def run():
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=directory,
+                                capture_output=True, text=True, check=True).stdout
+        return tuple(map(float, output.split()))
+
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(tables_cache_path())
+    no_cache = run()
+    import_time, first_game = min((run() for _ in range(repeat)), key=sum)
+    return {
+        'import': import_time,
+        'first_game': first_game,
+        'total': import_time + first_game,
+        'import_no_cache': no_cache[0],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки операций ChessGame")
+    parser.add_argument('--only', nargs='*', choices=sorted(BENCHMARKS), help="выбранные операции")
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--save', metavar='FILE', help="сохранить результаты как базовую линию (JSON)")
+    parser.add_argument('--compare', metavar='FILE', help="сравнить с базовой линией")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="допустимое замедление (доля), например 0.1")
+    parser.add_argument('--startup', action='store_true', help="проверить только время холодного старта")
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET, help="бюджет холодного старта (с)")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        startup = measure_startup(args.repeat)
+        print(f"Импорт chess: {startup['import'] * 1e3:.1f} мс (без кэша таблиц: "
+              f"{startup['import_no_cache'] * 1e3:.1f} мс), первая партия: {startup['first_game'] * 1e3:.1f} мс")
+        print(f"Холодный старт: {startup['total'] * 1e3:.1f} мс, бюджет {args.budget * 1e3:.0f} мс")
+        if startup['total'] > args.budget:
+            print("Бюджет превышен")
+            return 1
+        return 0
+
+    report = run_benchmarks(args.only, args.warmup, args.repeat)
+
+    comparison = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('version') != BENCHMARK_VERSION:
+            print(f"Внимание: базовая линия от версии набора {baseline.get('version')}, "
+                  f"текущая {BENCHMARK_VERSION}")
+        comparison = compare(report, baseline, args.threshold)
+
+    print(format_report(report, comparison))
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Базовая линия сохранена: {args.save}")
+
+    # Код возврата 1 при регрессии - для проверки в CI
+    if comparison is not None and any(entry['regression'] for entry in comparison.values()):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,6 +1,605 @@
-import json
-import re
-from copy import deepcopy
+import os
+import struct
+import sys
+from array import array
+from functools import lru_cache
+
+# Права на рокировку в упакованных флагах позиции
+CASTLE_WHITE_KINGSIDE = 1 << 1
+CASTLE_WHITE_QUEENSIDE = 1 << 2
+CASTLE_BLACK_KINGSIDE = 1 << 3
+CASTLE_BLACK_QUEENSIDE = 1 << 4
+CASTLE_ALL = CASTLE_WHITE_KINGSIDE | CASTLE_WHITE_QUEENSIDE | CASTLE_BLACK_KINGSIDE | CASTLE_BLACK_QUEENSIDE
+
+# Раскладка флагов: бит 0 - очередь хода (1 - черные), биты 1-4 - рокировки,
+# бит 5 - есть цель взятия на проходе, биты 6-8 - её вертикаль
+FLAG_BLACK_TO_MOVE = 1
+FLAG_EN_PASSANT = 1 << 5
+EN_PASSANT_FILE_SHIFT = 6
+
+# Права каждой стороны в порядке полей флагов
+CASTLING_RIGHTS = (CASTLE_WHITE_KINGSIDE, CASTLE_WHITE_QUEENSIDE, CASTLE_BLACK_KINGSIDE, CASTLE_BLACK_QUEENSIDE)
+WHITE_CASTLING = CASTLE_WHITE_KINGSIDE | CASTLE_WHITE_QUEENSIDE
+BLACK_CASTLING = CASTLE_BLACK_KINGSIDE | CASTLE_BLACK_QUEENSIDE
+
+# Для каждого права: горизонталь, вертикаль ладьи в классической расстановке и
+# вертикали короля и ладьи после рокировки (в шахматах Фишера те же: g/f и c/d)
+CASTLING_ROW = {CASTLE_WHITE_KINGSIDE: 7, CASTLE_WHITE_QUEENSIDE: 7,
+                CASTLE_BLACK_KINGSIDE: 0, CASTLE_BLACK_QUEENSIDE: 0}
+STANDARD_ROOK_FILES = (7, 0, 7, 0)
+CASTLING_KING_TARGET = {CASTLE_WHITE_KINGSIDE: 6, CASTLE_WHITE_QUEENSIDE: 2,
+                        CASTLE_BLACK_KINGSIDE: 6, CASTLE_BLACK_QUEENSIDE: 2}
+CASTLING_ROOK_TARGET = {CASTLE_WHITE_KINGSIDE: 5, CASTLE_WHITE_QUEENSIDE: 3,
+                        CASTLE_BLACK_KINGSIDE: 5, CASTLE_BLACK_QUEENSIDE: 3}
+
+# Вертикали ладей для рокировки во флагах позиции: биты 9-20, по 3 бита на право
+# в порядке CASTLING_RIGHTS, XOR с классической вертикалью (для обычных позиций - нули)
+ROOK_FILES_SHIFT = 9
+
+
+@lru_cache(maxsize=None)
+def castling_masks(white_king_file=4, black_king_file=4, rook_files=STANDARD_ROOK_FILES):
+    """Маска прав на рокировку для каждой клетки: ход с клетки или на клетку
+    короля/ладьи снимает соответствующие права (rook_files - в порядке CASTLING_RIGHTS)"""
+    masks = [CASTLE_ALL] * 64
+    for right, rook_file in zip(CASTLING_RIGHTS, rook_files):
+        row = CASTLING_ROW[right] * 8
+        masks[row + (white_king_file if right & WHITE_CASTLING else black_king_file)] &= ~right
+        masks[row + rook_file] &= ~right
+    return tuple(masks)
+
+
+CASTLING_RIGHTS_MASK = castling_masks()
+
+# Обозначения результата партии
+GAME_RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+# Стоимость фигур в сантипешках
+PIECE_VALUES = {'p': 100, 'n': 320, 'b': 330, 'r': 500, 'q': 900, 'k': 0}
+
+# Стоимость фигур в эндшпиле
+ENDGAME_PIECE_VALUES = {'p': 120, 'n': 300, 'b': 320, 'r': 520, 'q': 940, 'k': 0}
+
+# Вес фигур для определения стадии партии (24 - все фигуры на доске)
+PHASE_WEIGHTS = {'p': 0, 'n': 1, 'b': 1, 'r': 2, 'q': 4, 'k': 0}
+MAX_PHASE = 24
+
+# Таблицы «фигура-поле» для белых: строка 0 - восьмая горизонталь, как на доске
+_PST_MIDDLEGAME = {
+    'p': [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0,
+    ],
+    'n': [
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ],
+    'b': [
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ],
+    'r': [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0,
+    ],
+    'q': [
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20,
+    ],
+    'k': [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20,
+    ],
+}
+
+_PST_ENDGAME = dict(_PST_MIDDLEGAME)
+_PST_ENDGAME['p'] = [
+    0, 0, 0, 0, 0, 0, 0, 0,
+    80, 80, 80, 80, 80, 80, 80, 80,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    30, 30, 30, 30, 30, 30, 30, 30,
+    20, 20, 20, 20, 20, 20, 20, 20,
+    10, 10, 10, 10, 10, 10, 10, 10,
+    5, 5, 5, 5, 5, 5, 5, 5,
+    0, 0, 0, 0, 0, 0, 0, 0,
+]
+_PST_ENDGAME['k'] = [
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10, 0, 0, -10, -20, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -30, 0, 0, 0, 0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50,
+]
+
+
+def _build_eval_tables(values, tables):
+    """Материал плюс позиционный бонус для каждой фигуры и клетки; черные со знаком минус"""
+    result = {}
+    for piece_type, table in tables.items():
+        white = [values[piece_type] + table[sq] for sq in range(64)]
+        # Для черных таблица отражается по горизонтали
+        black = [-(values[piece_type] + table[(7 - sq // 8) * 8 + sq % 8]) for sq in range(64)]
+        result[piece_type.upper()] = white
+        result[piece_type] = black
+    return result
+
+
+# Для размена король дороже любого материала
+SEE_PIECE_VALUES = dict(PIECE_VALUES, k=20000)
+
+# Общая линия двух клеток
+LINE_NONE = 0
+LINE_ORTHOGONAL = 1
+LINE_DIAGONAL = 2
+
+
+def _build_line_tables():
+    """Таблицы для пар клеток (индекс row * 8 + col): тип общей линии и клетки строго между ними"""
+    line_type = [[LINE_NONE] * 64 for _ in range(64)]
+    between = [[()] * 64 for _ in range(64)]
+    for from_sq in range(64):
+        from_row, from_col = divmod(from_sq, 8)
+        for to_sq in range(64):
+            to_row, to_col = divmod(to_sq, 8)
+            row_diff, col_diff = to_row - from_row, to_col - from_col
+            if from_sq == to_sq:
+                continue
+            if row_diff == 0 or col_diff == 0:
+                line_type[from_sq][to_sq] = LINE_ORTHOGONAL
+            elif abs(row_diff) == abs(col_diff):
+                line_type[from_sq][to_sq] = LINE_DIAGONAL
+            else:
+                continue
+
+            row_step = (row_diff > 0) - (row_diff < 0)
+            col_step = (col_diff > 0) - (col_diff < 0)
+            squares = []
+            row, col = from_row + row_step, from_col + col_step
+            while (row, col) != (to_row, to_col):
+                squares.append((row, col))
+                row += row_step
+                col += col_step
+            between[from_sq][to_sq] = tuple(squares)
+    return line_type, between
+
+
+# Клетка по индексу: заранее созданные кортежи, чтобы декодирование ходов не создавало объектов
+SQUARE_POS = tuple((sq // 8, sq % 8) for sq in range(64))
+
+ORTHOGONAL_DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+DIAGONAL_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_OFFSETS = ORTHOGONAL_DIRECTIONS + DIAGONAL_DIRECTIONS
+
+
+def _build_step_table(offsets):
+    """Для каждой клетки - кортеж клеток, достижимых одним шагом из offsets"""
+    table = []
+    for row, col in SQUARE_POS:
+        table.append(tuple(
+            (row + dr) * 8 + col + dc for dr, dc in offsets
+            if 0 <= row + dr < 8 and 0 <= col + dc < 8
+        ))
+    return tuple(table)
+
+
+def _build_ray_table(directions):
+    """Для каждой клетки - лучи по направлениям (кортежи клеток (row, col) от ближней к дальней)"""
+    table = []
+    for row, col in SQUARE_POS:
+        rays = []
+        for dr, dc in directions:
+            ray = []
+            r, c = row + dr, col + dc
+            while 0 <= r < 8 and 0 <= c < 8:
+                ray.append(SQUARE_POS[r * 8 + c])
+                r += dr
+                c += dc
+            if ray:
+                rays.append(tuple(ray))
+        table.append(tuple(rays))
+    return tuple(table)
+
+
+# Таблицы атак и оценки заполняет load_tables() при импорте - из кэша в __pycache__
+# (если он построен по текущей версии этого файла) или заново. Загрузка при импорте, а не
+# при создании партии: партия, распакованная pickle в другом процессе, __init__ не вызывает
+TABLE_NAMES = ('LINE_TYPE', 'BETWEEN_SQUARES', 'KNIGHT_TARGETS', 'KING_TARGETS',
+               'ORTHOGONAL_RAYS', 'DIAGONAL_RAYS', 'EVAL_MIDDLEGAME', 'EVAL_ENDGAME')
+LINE_TYPE = BETWEEN_SQUARES = None
+KNIGHT_TARGETS = KING_TARGETS = ORTHOGONAL_RAYS = DIAGONAL_RAYS = None
+EVAL_MIDDLEGAME = EVAL_ENDGAME = None
+
+
+def _build_tables():
+    """Все таблицы в порядке TABLE_NAMES"""
+    line_type, between = _build_line_tables()
+    return (line_type, between,
+            _build_step_table(KNIGHT_OFFSETS), _build_step_table(KING_OFFSETS),
+            _build_ray_table(ORTHOGONAL_DIRECTIONS), _build_ray_table(DIAGONAL_DIRECTIONS),
+            _build_eval_tables(PIECE_VALUES, _PST_MIDDLEGAME),
+            _build_eval_tables(ENDGAME_PIECE_VALUES, _PST_ENDGAME))
+
+
+def tables_cache_path():
+    """Файл кэша таблиц (формат marshal зависит от версии интерпретатора)"""
+    directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '__pycache__')
+    return os.path.join(directory, f"chess_tables.{sys.implementation.cache_tag}.marshal")
+
+
+def load_tables():
+    """Заполнить таблицы атак и оценки из кэша или построить их и сохранить кэш"""
+    import marshal
+
+    path = tables_cache_path()
+    try:
+        stat = os.stat(__file__)
+        source = [stat.st_mtime_ns, stat.st_size]
+    except OSError:
+        source = None
+
+    tables = None
+    try:
+        with open(path, 'rb') as f:
+            cached_source, cached = marshal.loads(f.read())
+        if source is not None and cached_source == source:
+            tables = cached
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    if tables is None:
+        tables = _build_tables()
+        if source is not None:
+            # Запись через временный файл; без прав на запись таблицы просто не кэшируются
+            temp = f"{path}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(temp, 'wb') as f:
+                    f.write(marshal.dumps([source, tables]))
+                os.replace(temp, path)
+            except OSError:
+                pass
+    globals().update(zip(TABLE_NAMES, tables))
+
+
+load_tables()
+
+# Упакованный ход (16 бит): биты 0-5 - откуда, 6-11 - куда,
+# 12-13 - фигура превращения, 14-15 - тип хода
+MOVE_NORMAL = 0
+MOVE_PROMOTION = 1
+MOVE_EN_PASSANT = 2
+MOVE_CASTLING = 3
+PROMOTION_PIECES = 'NBRQ'
+
+
+def encode_move(from_pos, to_pos, promotion=None, flag=None):
+    """Упаковать ход в 16-битное число"""
+    move = from_pos[0] * 8 + from_pos[1] | (to_pos[0] * 8 + to_pos[1]) << 6
+    if promotion:
+        move |= PROMOTION_PIECES.index(promotion.upper()) << 12 | MOVE_PROMOTION << 14
+    elif flag:
+        move |= flag << 14
+    return move
+
+
+def decode_move(move):
+    """Распаковать ход в (откуда, куда, превращение или None)"""
+    promotion = PROMOTION_PIECES[move >> 12 & 3] if move >> 14 == MOVE_PROMOTION else None
+    return SQUARE_POS[move & 63], SQUARE_POS[move >> 6 & 63], promotion
+
+
+def move_from_tuple(move):
+    """Ход из кортежного API ((r, c), (r, c)[, превращение]) в упакованный вид"""
+    return encode_move(move[0], move[1], move[2] if len(move) > 2 else None)
+
+# Компактная запись позиции: занятость клеток (64 бита) и флаги, затем по 4 бита на фигуру
+PACKED_PIECES = 'PNBRQKpnbrqk'
+PACKED_HEADER = struct.Struct('<QI')
+# Счетчики партии после позиции: полуходы для правила 50 ходов и номер полухода
+PACKED_CLOCKS = struct.Struct('<BH')
+
+_EMPTY = ord(' ')
+_PAWNS = (ord('P'), ord('p'))
+_KINGS = (ord('K'), ord('k'))
+_ROOKS = (ord('R'), ord('r'))
+
+
+class Position:
+    """Неизменяемая позиция: 64 байта доски и упакованные флаги.
+
+    Дешево копируется, хэшируется и сериализуется (pickle, компактно - pack), поэтому
+    подходит как ключ кэшей и для передачи между потоками и процессами.
+    """
+
+    __slots__ = ('board', 'flags', '_hash')
+
+    def __init__(self, board, flags):
+        object.__setattr__(self, 'board', bytes(board))
+        object.__setattr__(self, 'flags', flags)
+        object.__setattr__(self, '_hash', hash((self.board, flags)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Position неизменяема")
+
+    def __delattr__(self, name):
+        raise AttributeError("Position неизменяема")
+
+    def __reduce__(self):
+        return (Position, (self.board, self.flags))
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if not isinstance(other, Position):
+            return NotImplemented
+        return self.flags == other.flags and self.board == other.board
+
+    def __repr__(self):
+        return f"Position({self.board.decode('ascii')!r}, {self.flags:#x})"
+
+    @classmethod
+    def from_board(cls, board, current_player='white', castling=CASTLE_ALL, en_passant_target=None,
+                   rook_files=STANDARD_ROOK_FILES):
+        """Создать позицию из доски 8x8 и параметров (rook_files - вертикали ладей
+        для рокировок в порядке CASTLING_RIGHTS, для шахмат Фишера)"""
+        flags = castling & CASTLE_ALL
+        for index, right in enumerate(CASTLING_RIGHTS):
+            if flags & right:
+                flags |= (rook_files[index] ^ STANDARD_ROOK_FILES[index]) << (ROOK_FILES_SHIFT + index * 3)
+        if current_player == 'black':
+            flags |= FLAG_BLACK_TO_MOVE
+        if en_passant_target is not None:
+            flags |= FLAG_EN_PASSANT | (en_passant_target[1] << EN_PASSANT_FILE_SHIFT)
+        return cls(''.join(''.join(row) for row in board).encode('ascii'), flags)
+
+    @classmethod
+    def initial(cls):
+        """Начальная позиция"""
+        return cls.from_board(ChessGame.initialize_board())
+
+    @property
+    def current_player(self):
+        return 'black' if self.flags & FLAG_BLACK_TO_MOVE else 'white'
+
+    @property
+    def castling(self):
+        return self.flags & CASTLE_ALL
+
+    @property
+    def rook_files(self):
+        """Вертикали ладей для рокировок в порядке CASTLING_RIGHTS"""
+        return tuple(STANDARD_ROOK_FILES[index] ^ (self.flags >> (ROOK_FILES_SHIFT + index * 3)) & 7
+                     for index in range(4))
+
+    @property
+    def en_passant_target(self):
+        if not self.flags & FLAG_EN_PASSANT:
+            return None
+        row = 5 if self.flags & FLAG_BLACK_TO_MOVE else 2
+        return (row, (self.flags >> EN_PASSANT_FILE_SHIFT) & 7)
+
+    def piece_at(self, pos):
+        """Фигура на клетке"""
+        return chr(self.board[pos[0] * 8 + pos[1]])
+
+    def king_position(self, color):
+        """Клетка короля указанного цвета"""
+        index = self.board.find(b'K' if color == 'white' else b'k')
+        return (index // 8, index % 8) if index >= 0 else None
+
+    def stable_hash(self):
+        """64-битный хэш, одинаковый во всех процессах (для хранения на диске)"""
+        import hashlib
+
+        # Для классической расстановки флаги умещаются в 2 байта - хэши прежних записей не меняются
+        length = 2 if self.flags < 1 << 16 else 3
+        digest = hashlib.blake2b(self.board + self.flags.to_bytes(length, 'little'), digest_size=8).digest()
+        return int.from_bytes(digest, 'little', signed=True)
+
+    def pack(self):
+        """Компактная запись (до 28 байт): занятость клеток, флаги и 4-битные коды фигур"""
+        occupancy = 0
+        codes = []
+        for square, piece in enumerate(self.board):
+            if piece != _EMPTY:
+                occupancy |= 1 << square
+                codes.append(PACKED_PIECES.index(chr(piece)))
+        if len(codes) % 2:
+            codes.append(0)
+        return PACKED_HEADER.pack(occupancy, self.flags) + bytes(
+            codes[i] | codes[i + 1] << 4 for i in range(0, len(codes), 2))
+
+    @classmethod
+    def unpack(cls, data, offset=0):
+        """Позиция из записи pack(); возвращает (позиция, смещение за концом записи)"""
+        occupancy, flags = PACKED_HEADER.unpack_from(data, offset)
+        offset += PACKED_HEADER.size
+        board = bytearray(b' ' * 64)
+        index = 0
+        for square in range(64):
+            if occupancy >> square & 1:
+                code = data[offset + index // 2] >> (index % 2 * 4) & 15
+                board[square] = ord(PACKED_PIECES[code])
+                index += 1
+        return cls(board, flags), offset + (index + 1) // 2
+
+    def to_board(self):
+        """Изменяемая доска 8x8 (список списков)"""
+        text = self.board.decode('ascii')
+        return [list(text[row * 8:row * 8 + 8]) for row in range(8)]
+
+    def apply(self, move):
+        """Новая позиция после хода ((r, c), (r, c)[, превращение]) без проверки легальности"""
+        from_pos, to_pos = move[0], move[1]
+        promotion = move[2] if len(move) > 2 and move[2] else 'Q'
+        from_sq = from_pos[0] * 8 + from_pos[1]
+        to_sq = to_pos[0] * 8 + to_pos[1]
+
+        board = bytearray(self.board)
+        piece = board[from_sq]
+        flags = self.flags
+        castling = flags & CASTLE_ALL
+
+        if castling:
+            rook_files = self.rook_files
+            masks = castling_masks(self.board.find(b'K') % 8, self.board.find(b'k') % 8, rook_files)
+            castling &= masks[from_sq] & masks[to_sq]
+
+        if piece in _PAWNS:
+            # Взятие на проходе: снимаем пешку рядом с исходной клеткой
+            if flags & FLAG_EN_PASSANT and to_pos == self.en_passant_target:
+                board[from_pos[0] * 8 + to_pos[1]] = _EMPTY
+        elif piece in _KINGS and (abs(to_pos[1] - from_pos[1]) == 2 or
+                                  board[to_sq] == (_ROOKS[0] if piece == _KINGS[0] else _ROOKS[1])):
+            # Рокировка: король на две клетки или на клетку своей ладьи (шахматы Фишера)
+            kingside = to_pos[1] > from_pos[1]
+            right = ((CASTLE_WHITE_KINGSIDE if kingside else CASTLE_WHITE_QUEENSIDE) if piece == _KINGS[0]
+                     else (CASTLE_BLACK_KINGSIDE if kingside else CASTLE_BLACK_QUEENSIDE))
+            row = from_pos[0] * 8
+            rook_sq = row + rook_files[CASTLING_RIGHTS.index(right)]
+            rook = board[rook_sq]
+            board[from_sq] = board[rook_sq] = _EMPTY
+            board[row + CASTLING_ROOK_TARGET[right]] = rook
+            from_sq = to_sq = row + CASTLING_KING_TARGET[right]
+
+        board[to_sq] = piece
+        if from_sq != to_sq:
+            board[from_sq] = _EMPTY
+
+        if piece in _PAWNS and to_pos[0] in (0, 7):
+            board[to_sq] = ord(promotion.upper() if piece == _PAWNS[0] else promotion.lower())
+
+        new_flags = castling | ((flags & FLAG_BLACK_TO_MOVE) ^ FLAG_BLACK_TO_MOVE)
+        for index, right in enumerate(CASTLING_RIGHTS):
+            if castling & right:
+                new_flags |= flags & 7 << (ROOK_FILES_SHIFT + index * 3)
+        if piece in _PAWNS and abs(to_pos[0] - from_pos[0]) == 2:
+            # Цель взятия на проходе - только при пешке соперника рядом, как в _apply_move
+            enemy = _PAWNS[1] if piece == _PAWNS[0] else _PAWNS[0]
+            col = to_pos[1]
+            if (col > 0 and board[to_sq - 1] == enemy) or (col < 7 and board[to_sq + 1] == enemy):
+                new_flags |= FLAG_EN_PASSANT | (from_pos[1] << EN_PASSANT_FILE_SHIFT)
+
+        return Position(board, new_flags)
+
+
+# Отображение клеток доски (по 2 символа): пустая, обычная, ход, угроза
+_CELL_TEXT = {piece: (piece if piece != ' ' else '.').center(2) for piece in ' PNBRQKpnbrqk'}
+_CELL_HIGHLIGHTED = {piece: f"*{piece if piece != ' ' else '.'}" for piece in ' PNBRQKpnbrqk'}
+_CELL_THREATENED = {piece: f"[{piece if piece != ' ' else '.'}" for piece in ' PNBRQKpnbrqk'}
+
+BOARD_HEADER = "  A B C D E F G H"
+
+# Строк экрана, занятых кадром доски (пустая, заголовок, 8 горизонталей, подвал, пустая)
+BOARD_LINES = 12
+
+
+class BoardRenderer:
+    """Отрисовка доски: кадр собирается в одну строку и выводится одной записью.
+
+    В режиме ANSI доска занимает верх экрана, остальной вывод прокручивается под ней,
+    а следующие кадры перерисовывают только изменившиеся клетки.
+    """
+
+    def __init__(self, output=None, ansi=False):
+        self.output = output
+        self.ansi = ansi
+        self._cells = None
+
+    @staticmethod
+    def cells(board, highlighted=(), threatened=()):
+        """Отображение 64 клеток: угрозы важнее подсветки ходов"""
+        highlighted = set(highlighted)
+        threatened = set(threatened)
+        cells = []
+        for i, row in enumerate(board):
+            for j, piece in enumerate(row):
+                if threatened and (i, j) in threatened:
+                    cells.append(_CELL_THREATENED[piece])
+                elif highlighted and (i, j) in highlighted:
+                    cells.append(_CELL_HIGHLIGHTED[piece])
+                else:
+                    cells.append(_CELL_TEXT[piece])
+        return cells
+
+    @staticmethod
+    def frame(cells):
+        """Полный кадр доски одной строкой"""
+        rows = [f"{8 - i} {''.join(cells[i * 8:i * 8 + 8])} {8 - i}" for i in range(8)]
+        return "\n".join(["", BOARD_HEADER] + rows + [BOARD_HEADER, "", ""])
+
+    def render(self, board, highlighted=(), threatened=()):
+        """Вывести доску: полный кадр или (в режиме ANSI) только изменения"""
+        cells = self.cells(board, highlighted, threatened)
+        if not self.ansi:
+            text = self.frame(cells)
+        elif self._cells is None:
+            import shutil
+
+            # Первый кадр: очистка экрана, доска сверху, прокрутка - только под доской
+            height = shutil.get_terminal_size().lines
+            text = (f"\x1b[2J\x1b[H{self.frame(cells)}"
+                    f"\x1b[{BOARD_LINES};{height}r\x1b[{BOARD_LINES};1H")
+        else:
+            # Курсор сохраняется, изменившиеся клетки пишутся по абсолютным координатам
+            changes = [f"\x1b[{index // 8 + 3};{index % 8 * 2 + 3}H{cell}"
+                       for index, (cell, previous) in enumerate(zip(cells, self._cells)) if cell != previous]
+            text = f"\x1b7{''.join(changes)}\x1b8" if changes else ''
+        self._cells = cells
+
+        if text:
+            output = self.output or sys.stdout
+            output.write(text)
+            output.flush()
+
+    def reset(self):
+        """Забыть предыдущий кадр: следующий будет нарисован полностью"""
+        if self.ansi and self._cells is not None:
+            output = self.output or sys.stdout
+            output.write("\x1b[r")
+            output.flush()
+        self._cells = None
 
 
 class ChessGame:
@@ -8,20 +607,20 @@ class ChessGame:
         self.board = self.initialize_board()
         self.current_player = 'white'
         self.move_count = 0
+        self.halfmove_clock = 0
         self.white_king_pos = (7, 4)
         self.black_king_pos = (0, 4)
         self.game_over = False
 
-        # История для отката ходов
+        # История для отката ходов и отмененные ходы для повтора (последний отмененный - в конце)
         self.move_history = []
+        self.redo_stack = []
 
-        # Рокировка
-        self.white_king_moved = False
-        self.white_rook_a_moved = False
-        self.white_rook_h_moved = False
-        self.black_king_moved = False
-        self.black_rook_a_moved = False
-        self.black_rook_h_moved = False
+        # Рокировка: битовая маска прав CASTLE_*, вертикали ладей (в порядке
+        # CASTLING_RIGHTS, для шахмат Фишера) и маски снятия прав по клеткам
+        self.castling_rights = CASTLE_ALL
+        self.castling_rook_files = STANDARD_ROOK_FILES
+        self._castling_masks = CASTLING_RIGHTS_MASK
 
         # Взятие на проходе
         self.en_passant_target = None
@@ -31,7 +630,35 @@ class ChessGame:
         self.replay_moves = []
         self.replay_position = 0
 
-    def initialize_board(self):
+        # Инкрементальная оценка (белые минус черные): материал и таблицы
+        # «фигура-поле» для миттельшпиля и эндшпиля, стадия партии
+        self.recompute_evaluation()
+
+        # Вывод доски
+        self.renderer = BoardRenderer()
+
+        # Игроки и хранилище завершенных партий (см. game_store.py)
+        self.white_player = None
+        self.black_player = None
+        self.game_store = None
+        # Журнал ходов для восстановления после сбоя (см. move_log.py)
+        self.move_log = None
+
+        # Кэш легальных ходов и атакованных полей для текущей позиции
+        self._position_cache_key = None
+        self._position_cache = {}
+
+    def __getstate__(self):
+        """Состояние для pickle без хранилища и журнала: соединение SQLite не сериализуется,
+        а копия дескриптора журнала писала бы в чужой файл. Обертки методов на экземпляре
+        (instrumentation.py) - локальные функции, копия получает исходные методы класса"""
+        state = {name: value for name, value in self.__dict__.items() if not hasattr(type(self), name)}
+        state['game_store'] = None
+        state['move_log'] = None
+        return state
+
+    @staticmethod
+    def initialize_board():
         """Инициализация шахматной доски"""
         board = [[' ' for _ in range(8)] for _ in range(8)]
 
@@ -47,30 +674,7 @@ class ChessGame:
 
     def print_board(self, highlighted_squares=None, threatened_pieces=None):
         """Вывод доски на экран с подсветкой"""
-        if highlighted_squares is None:
-            highlighted_squares = []
-        if threatened_pieces is None:
-            threatened_pieces = []
-
-        print("\n  A B C D E F G H")
-        for i in range(8):
-            row_num = 8 - i
-            print(f"{row_num} ", end="")
-            for j in range(8):
-                pos = (i, j)
-                piece = self.board[i][j]
-                display = piece if piece != ' ' else '.'
-
-                # Подсветка угрожаемых фигур
-                if pos in threatened_pieces:
-                    display = f"[{display}]"[0:3]  # Ограничение длины
-                # Подсветка доступных ходов
-                elif pos in highlighted_squares:
-                    display = f"*{display}*"[0:3]
-
-                print(display.center(2), end="")
-            print(f" {row_num}")
-        print("  A B C D E F G H\n")
+        self.renderer.render(self.board, highlighted_squares or (), threatened_pieces or ())
 
     def parse_position(self, pos):
         """Преобразование позиции из формата 'e2' в координаты"""
@@ -114,10 +718,12 @@ class ChessGame:
             direction = -1
             start_row = 6
             promotion_row = 0
+            en_passant_row = 2
         else:
             direction = 1
             start_row = 1
             promotion_row = 7
+            en_passant_row = 5
 
         # Движение вперед на одну клетку
         if from_col == to_col and to_row == from_row + direction and target == ' ':
@@ -133,32 +739,32 @@ class ChessGame:
         if check_capture and (abs(from_col - to_col) == 1 and to_row == from_row + direction):
             if target != ' ' and self.is_white_piece(piece) != self.is_white_piece(target):
                 return True
-            # Взятие на проходе
-            if to_pos == self.en_passant_target:
+            # Взятие на проходе (цель всегда за пешкой соперника)
+            if to_pos == self.en_passant_target and to_row == en_passant_row:
                 return True
 
         return False
 
+    def is_path_clear(self, from_pos, to_pos):
+        """Свободны ли клетки строго между двумя клетками одной линии"""
+        board = self.board
+        for row, col in BETWEEN_SQUARES[from_pos[0] * 8 + from_pos[1]][to_pos[0] * 8 + to_pos[1]]:
+            if board[row][col] != ' ':
+                return False
+        return True
+
     def is_valid_rook_move(self, from_pos, to_pos):
         """Проверка корректности хода ладьи"""
-        from_row, from_col = from_pos
-        to_row, to_col = to_pos
-
-        if from_row != to_row and from_col != to_col:
+        from_sq = from_pos[0] * 8 + from_pos[1]
+        to_sq = to_pos[0] * 8 + to_pos[1]
+        if LINE_TYPE[from_sq][to_sq] != LINE_ORTHOGONAL:
             return False
 
         # Проверка пути
-        if from_row == to_row:
-            step = 1 if to_col > from_col else -1
-            for col in range(from_col + step, to_col, step):
-                if self.board[from_row][col] != ' ':
-                    return False
-        else:
-            step = 1 if to_row > from_row else -1
-            for row in range(from_row + step, to_row, step):
-                if self.board[row][from_col] != ' ':
-                    return False
-
+        board = self.board
+        for row, col in BETWEEN_SQUARES[from_sq][to_sq]:
+            if board[row][col] != ' ':
+                return False
         return True
 
     def is_valid_knight_move(self, from_pos, to_pos):
@@ -169,27 +775,29 @@ class ChessGame:
 
     def is_valid_bishop_move(self, from_pos, to_pos):
         """Проверка корректности хода слона"""
-        from_row, from_col = from_pos
-        to_row, to_col = to_pos
-
-        if abs(from_row - to_row) != abs(from_col - to_col):
+        from_sq = from_pos[0] * 8 + from_pos[1]
+        to_sq = to_pos[0] * 8 + to_pos[1]
+        if LINE_TYPE[from_sq][to_sq] != LINE_DIAGONAL:
             return False
 
-        row_step = 1 if to_row > from_row else -1
-        col_step = 1 if to_col > from_col else -1
-
-        row, col = from_row + row_step, from_col + col_step
-        while row != to_row and col != to_col:
-            if self.board[row][col] != ' ':
+        board = self.board
+        for row, col in BETWEEN_SQUARES[from_sq][to_sq]:
+            if board[row][col] != ' ':
                 return False
-            row += row_step
-            col += col_step
-
         return True
 
     def is_valid_queen_move(self, from_pos, to_pos):
         """Проверка корректности хода ферзя"""
-        return self.is_valid_rook_move(from_pos, to_pos) or self.is_valid_bishop_move(from_pos, to_pos)
+        from_sq = from_pos[0] * 8 + from_pos[1]
+        to_sq = to_pos[0] * 8 + to_pos[1]
+        if LINE_TYPE[from_sq][to_sq] == LINE_NONE:
+            return False
+
+        board = self.board
+        for row, col in BETWEEN_SQUARES[from_sq][to_sq]:
+            if board[row][col] != ' ':
+                return False
+        return True
 
     def is_valid_king_move(self, from_pos, to_pos):
         """Проверка корректности хода короля (без рокировки)"""
@@ -197,64 +805,71 @@ class ChessGame:
         col_diff = abs(from_pos[1] - to_pos[1])
         return row_diff <= 1 and col_diff <= 1
 
-    def is_valid_castling(self, from_pos, to_pos):
-        """Проверка возможности рокировки"""
-        from_row, from_col = from_pos
-        to_row, to_col = to_pos
-
-        # Проверяем, что это король
-        piece = self.get_piece_at(from_pos)
-        if piece.lower() != 'k':
-            return False
-
-        # Проверяем, что король движется на 2 клетки по горизонтали
-        if from_row != to_row or abs(to_col - from_col) != 2:
-            return False
+    def _castling_right(self, from_pos, to_pos):
+        """Право рокировки (CASTLE_*), которой соответствует ход короля, или 0.
 
-        is_white = self.is_white_piece(piece)
+        Рокировка записывается ходом короля на две клетки (король на вертикали e, ладья
+        в углу) или ходом короля на клетку своей ладьи (шахматы Фишера). В классической
+        позиции ход короля на свою ладью (e1h1) рокировкой не считается.
+        """
+        piece = self.board[from_pos[0]][from_pos[1]]
+        if piece == 'K':
+            rights = self.castling_rights & WHITE_CASTLING
+        elif piece == 'k':
+            rights = self.castling_rights & BLACK_CASTLING
+        else:
+            return 0
+        if not rights or to_pos[0] != from_pos[0]:
+            return 0
+
+        for index, right in enumerate(CASTLING_RIGHTS):
+            if rights & right and from_pos[0] == CASTLING_ROW[right]:
+                if self._castling_by_rook(index, from_pos[1]):
+                    if to_pos[1] == self.castling_rook_files[index]:
+                        return right
+                elif to_pos[1] == CASTLING_KING_TARGET[right]:
+                    return right
+        return 0
+
+    def _castling_by_rook(self, index, king_col):
+        """Записывается ли рокировка index (в порядке CASTLING_RIGHTS) ходом короля на ладью"""
+        return king_col != 4 or self.castling_rook_files[index] != STANDARD_ROOK_FILES[index]
+
+    def _castling_move(self, right):
+        """Ход короля (откуда, куда) для рокировки с правом right или None, если права нет"""
+        if not self.castling_rights & right:
+            return None
+        king_pos = self.white_king_pos if right & WHITE_CASTLING else self.black_king_pos
+        row = CASTLING_ROW[right]
+        index = CASTLING_RIGHTS.index(right)
+        if self._castling_by_rook(index, king_pos[1]):
+            return king_pos, (row, self.castling_rook_files[index])
+        return king_pos, (row, CASTLING_KING_TARGET[right])
 
-        # Проверяем, что король не двигался
-        if is_white and self.white_king_moved:
-            return False
-        if not is_white and self.black_king_moved:
+    def is_valid_castling(self, from_pos, to_pos):
+        """Проверка возможности рокировки (классической и по правилам шахмат Фишера)"""
+        right = self._castling_right(from_pos, to_pos)
+        if not right:
             return False
 
-        # Проверяем, что король не под шахом
-        enemy_color = 'black' if is_white else 'white'
-        if self.is_square_attacked(from_pos, enemy_color):
-            return False
+        row, king_col = from_pos
+        rook_col = self.castling_rook_files[CASTLING_RIGHTS.index(right)]
+        king_target = CASTLING_KING_TARGET[right]
+        rook_target = CASTLING_ROOK_TARGET[right]
 
-        # Короткая рокировка (O-O)
-        if to_col > from_col:
-            rook_col = 7
-            if is_white and self.white_rook_h_moved:
-                return False
-            if not is_white and self.black_rook_h_moved:
+        # Все клетки, через которые проходят король и ладья, свободны (кроме них самих)
+        for col in range(min(king_col, rook_col, king_target, rook_target),
+                         max(king_col, rook_col, king_target, rook_target) + 1):
+            if col != king_col and col != rook_col and self.board[row][col] != ' ':
                 return False
 
-            # Проверяем путь
-            for col in range(from_col + 1, rook_col):
-                if self.board[from_row][col] != ' ':
-                    return False
-                # Проверяем, что король не проходит через битое поле
-                if col <= from_col + 2 and self.is_square_attacked((from_row, col), enemy_color):
-                    return False
-        # Длинная рокировка (O-O-O)
-        else:
-            rook_col = 0
-            if is_white and self.white_rook_a_moved:
-                return False
-            if not is_white and self.black_rook_a_moved:
+        # Король не под шахом, не проходит через битое поле и не встает под шах
+        enemy_color = 'black' if right & WHITE_CASTLING else 'white'
+        step = 1 if king_target >= king_col else -1
+        for col in range(king_col, king_target + step, step):
+            if self.is_square_attacked((row, col), enemy_color):
                 return False
 
-            # Проверяем путь
-            for col in range(rook_col + 1, from_col):
-                if self.board[from_row][col] != ' ':
-                    return False
-                # Проверяем, что король не проходит через битое поле
-                if col >= from_col - 2 and self.is_square_attacked((from_row, col), enemy_color):
-                    return False
-
         return True
 
     def is_valid_move(self, from_pos, to_pos, for_threat_check=False):
@@ -269,13 +884,19 @@ class ChessGame:
             if self.current_player == 'black' and not self.is_black_piece(piece):
                 return False, "Это не ваша фигура!"
 
+        piece_lower = piece.lower()
+
+        # Рокировка проверяется отдельно: в шахматах Фишера король идет на клетку своей ладьи
+        if piece_lower == 'k' and (abs(to_pos[1] - from_pos[1]) == 2 or self._castling_right(from_pos, to_pos)):
+            if for_threat_check or not self.is_valid_castling(from_pos, to_pos):
+                return False, "Рокировка невозможна!"
+            return True, ""
+
         # Проверка, что целевая клетка не занята своей фигурой
         if target != ' ':
             if self.is_white_piece(piece) == self.is_white_piece(target):
                 return False, "На целевой клетке стоит ваша фигура!"
 
-        piece_lower = piece.lower()
-
         # Проверка правил для каждой фигуры
         if piece_lower == 'p':
             if not self.is_valid_pawn_move(from_pos, to_pos, piece):
@@ -293,11 +914,7 @@ class ChessGame:
             if not self.is_valid_queen_move(from_pos, to_pos):
                 return False, "Неверный ход для ферзя!"
         elif piece_lower == 'k':
-            # Проверяем рокировку
-            if abs(to_pos[1] - from_pos[1]) == 2:
-                if not self.is_valid_castling(from_pos, to_pos):
-                    return False, "Рокировка невозможна!"
-            elif not self.is_valid_king_move(from_pos, to_pos):
+            if not self.is_valid_king_move(from_pos, to_pos):
                 return False, "Неверный ход для короля!"
 
         # Проверка, не приводит ли ход к шаху своему королю
@@ -308,42 +925,143 @@ class ChessGame:
 
     def is_square_attacked(self, pos, by_color):
         """Проверка, атакована ли клетка фигурами определенного цвета"""
-        for row in range(8):
-            for col in range(8):
-                piece = self.board[row][col]
-                if piece == ' ':
-                    continue
-
-                if by_color == 'white' and not self.is_white_piece(piece):
-                    continue
-                if by_color == 'black' and not self.is_black_piece(piece):
-                    continue
+        board = self.board
+        white = by_color == 'white'
+        sq = pos[0] * 8 + pos[1]
+
+        # Смотрим из клетки наружу: кони, король и пешки по таблицам, дальнобойные - по лучам
+        knight, king, pawn = ('N', 'K', 'P') if white else ('n', 'k', 'p')
+        for target_sq in KNIGHT_TARGETS[sq]:
+            row, col = SQUARE_POS[target_sq]
+            if board[row][col] == knight:
+                return True
+        for target_sq in KING_TARGETS[sq]:
+            row, col = SQUARE_POS[target_sq]
+            if board[row][col] == king:
+                return True
 
-                from_pos = (row, col)
-                piece_lower = piece.lower()
+        # Белая пешка бьет вверх, поэтому стоит на строку ниже клетки
+        pawn_row = pos[0] + (1 if white else -1)
+        if 0 <= pawn_row < 8:
+            if pos[1] > 0 and board[pawn_row][pos[1] - 1] == pawn:
+                return True
+            if pos[1] < 7 and board[pawn_row][pos[1] + 1] == pawn:
+                return True
 
-                if piece_lower == 'p':
-                    direction = -1 if self.is_white_piece(piece) else 1
-                    if (pos[0] == row + direction and abs(pos[1] - col) == 1):
-                        return True
-                elif piece_lower == 'n':
-                    if self.is_valid_knight_move(from_pos, pos):
-                        return True
-                elif piece_lower == 'b':
-                    if self.is_valid_bishop_move(from_pos, pos):
+        rook, bishop, queen = ('R', 'B', 'Q') if white else ('r', 'b', 'q')
+        for ray in ORTHOGONAL_RAYS[sq]:
+            for row, col in ray:
+                piece = board[row][col]
+                if piece != ' ':
+                    if piece == rook or piece == queen:
                         return True
-                elif piece_lower == 'r':
-                    if self.is_valid_rook_move(from_pos, pos):
-                        return True
-                elif piece_lower == 'q':
-                    if self.is_valid_queen_move(from_pos, pos):
-                        return True
-                elif piece_lower == 'k':
-                    if self.is_valid_king_move(from_pos, pos):
+                    break
+        for ray in DIAGONAL_RAYS[sq]:
+            for row, col in ray:
+                piece = board[row][col]
+                if piece != ' ':
+                    if piece == bishop or piece == queen:
                         return True
+                    break
+
+        return False
+
+    def _piece_attacks_square(self, piece, from_pos, pos):
+        """Атакует ли фигура piece, стоящая на from_pos, клетку pos"""
+        if from_pos == pos:
+            return False
 
+        piece_lower = piece.lower()
+        if piece_lower == 'p':
+            direction = -1 if self.is_white_piece(piece) else 1
+            return pos[0] == from_pos[0] + direction and abs(pos[1] - from_pos[1]) == 1
+        elif piece_lower == 'n':
+            return self.is_valid_knight_move(from_pos, pos)
+        elif piece_lower == 'b':
+            return self.is_valid_bishop_move(from_pos, pos)
+        elif piece_lower == 'r':
+            return self.is_valid_rook_move(from_pos, pos)
+        elif piece_lower == 'q':
+            return self.is_valid_queen_move(from_pos, pos)
+        elif piece_lower == 'k':
+            return self.is_valid_king_move(from_pos, pos)
         return False
 
+    def get_attackers(self, pos, by_color):
+        """Список клеток фигур цвета by_color, которые атакуют клетку pos"""
+        attackers = []
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece == ' ':
+                    continue
+                if (by_color == 'white') != self.is_white_piece(piece):
+                    continue
+                if self._piece_attacks_square(piece, (row, col), pos):
+                    attackers.append((row, col))
+        return attackers
+
+    def _least_valuable_attacker(self, pos, by_color):
+        """Клетка самой дешевой фигуры цвета by_color, атакующей pos (или None)"""
+        best_pos = None
+        best_value = None
+        for from_pos in self.get_attackers(pos, by_color):
+            value = SEE_PIECE_VALUES[self.get_piece_at(from_pos).lower()]
+            if best_value is None or value < best_value:
+                best_pos, best_value = from_pos, value
+        return best_pos
+
+    def static_exchange_evaluation(self, pos, by_color, first_attacker=None):
+        """Статическая оценка размена (SEE) на клетке pos для цвета by_color.
+
+        Стороны по очереди бьют на pos самой дешевой фигурой и могут остановиться
+        в любой момент. Возвращает выигрыш by_color в сантипешках (0, если бить
+        невыгодно или нечем). first_attacker задает фигуру, которая бьет первой.
+        """
+        target = self.get_piece_at(pos)
+        if target == ' ':
+            return 0
+
+        attacker_pos = first_attacker or self._least_valuable_attacker(pos, by_color)
+        if attacker_pos is None:
+            return 0
+
+        gains = [SEE_PIECE_VALUES[target.lower()]]
+        removed = []
+        side = by_color
+        try:
+            while attacker_pos is not None:
+                attacker = self.get_piece_at(attacker_pos)
+                # Фигура встает на pos и сама становится целью следующего взятия
+                gains.append(SEE_PIECE_VALUES[attacker.lower()] - gains[-1])
+                removed.append((attacker_pos, attacker))
+                self.board[attacker_pos[0]][attacker_pos[1]] = ' '
+                side = 'black' if side == 'white' else 'white'
+                attacker_pos = self._least_valuable_attacker(pos, side)
+        finally:
+            for square, piece in removed:
+                self.board[square[0]][square[1]] = piece
+
+        # Последнее значение - выигрыш соперника, если он сможет ответить взятием
+        gains.pop()
+        while len(gains) > 1:
+            last = gains.pop()
+            gains[-1] = -max(-gains[-1], last)
+        return gains[0] if first_attacker else max(gains[0], 0)
+
+    def get_hanging_pieces(self, color):
+        """Фигуры цвета color, которые соперник может выгодно взять (SEE > 0)"""
+        cache = self._get_position_cache()
+        cache_key = ('hanging', color)
+        if cache_key not in cache:
+            enemy_color = 'black' if color == 'white' else 'white'
+            cache[cache_key] = [
+                pos for pos in self.get_threatened_pieces(color)
+                if self.get_piece_at(pos).lower() != 'k'
+                and self.static_exchange_evaluation(pos, enemy_color) > 0
+            ]
+        return list(cache[cache_key])
+
     def would_be_in_check(self, from_pos, to_pos):
         """Проверка, будет ли король под шахом после хода"""
         piece = self.board[from_pos[0]][from_pos[1]]
@@ -351,9 +1069,9 @@ class ChessGame:
 
         # Обработка взятия на проходе
         en_passant_capture = None
-        if piece.lower() == 'p' and to_pos == self.en_passant_target:
-            direction = 1 if self.is_white_piece(piece) else -1
-            en_passant_capture = (to_pos[0] - direction, to_pos[1])
+        if piece.lower() == 'p' and to_pos == self.en_passant_target and from_pos[1] != to_pos[1]:
+            # Взятая пешка стоит рядом с исходной клеткой
+            en_passant_capture = (from_pos[0], to_pos[1])
             captured_piece = self.board[en_passant_capture[0]][en_passant_capture[1]]
             self.board[en_passant_capture[0]][en_passant_capture[1]] = ' '
 
@@ -382,40 +1100,337 @@ class ChessGame:
         enemy_color = 'black' if color == 'white' else 'white'
         return self.is_square_attacked(king_pos, enemy_color)
 
-    def get_all_legal_moves(self, color):
-        """Получить все возможные легальные ходы для указанного цвета"""
-        legal_moves = []
+    def get_castling_rights(self):
+        """Права на рокировку в виде битовой маски CASTLE_*"""
+        return self.castling_rights
+
+    def get_position(self):
+        """Неизменяемый снимок текущей позиции"""
+        return Position.from_board(self.board, self.current_player, self.castling_rights,
+                                   self.en_passant_target, self.castling_rook_files)
+
+    def set_position(self, position):
+        """Установить позицию из снимка Position (история ходов сбрасывается)"""
+        self.board = position.to_board()
+        self.current_player = position.current_player
+        self.en_passant_target = position.en_passant_target
+        self.white_king_pos = position.king_position('white')
+        self.black_king_pos = position.king_position('black')
+
+        self.castling_rights = position.castling
+        self.castling_rook_files = position.rook_files
+        self._castling_masks = castling_masks(self.white_king_pos[1] if self.white_king_pos else 4,
+                                              self.black_king_pos[1] if self.black_king_pos else 4,
+                                              self.castling_rook_files)
 
-        for from_row in range(8):
-            for from_col in range(8):
-                piece = self.board[from_row][from_col]
-                if piece == ' ':
-                    continue
-
-                if color == 'white' and not self.is_white_piece(piece):
-                    continue
-                if color == 'black' and not self.is_black_piece(piece):
-                    continue
+        self.move_history = []
+        self.redo_stack = []
+        self.game_over = False
+        self.recompute_evaluation()
+        self._invalidate_position_cache()
+        if self.move_log is not None:
+            self.move_log.record_reset(self)
+
+    def serialize(self, moves=False):
+        """Компактная запись партии для передачи между процессами (около 30 байт).
+
+        Без moves - только текущая позиция со счетчиками. С moves - исходная позиция
+        и упакованные ходы истории (по 2 байта), чтобы получатель восстановил историю.
+        """
+        history = self.move_history
+        if moves and history:
+            start = history[0]
+            position, halfmove_clock, move_count = start['position'], start['halfmove_clock'], start['move_count']
+        else:
+            position, halfmove_clock, move_count = self.get_position(), self.halfmove_clock, self.move_count
+        data = position.pack() + PACKED_CLOCKS.pack(min(halfmove_clock, 255), move_count)
+        if moves and history:
+            packed = array('H', (encode_move(state['from_pos'], state['to_pos'], state.get('promotion'))
+                                 for state in history))
+            if sys.byteorder == 'big':
+                packed.byteswap()
+            data += packed.tobytes()
+        return data
+
+    @classmethod
+    def deserialize(cls, data):
+        """Партия из записи serialize(); ходы, если они есть, проигрываются без вывода"""
+        position, offset = Position.unpack(data)
+        halfmove_clock, move_count = PACKED_CLOCKS.unpack_from(data, offset)
+        game = cls()
+        game.set_position(position)
+        game.halfmove_clock = halfmove_clock
+        game.move_count = move_count
+
+        packed = array('H', data[offset + PACKED_CLOCKS.size:])
+        if sys.byteorder == 'big':
+            packed.byteswap()
+        for move in packed:
+            game._apply_packed_move(move)
+        return game
+
+    def load_fen(self, fen):
+        """Установить позицию из FEN; при ошибке формата - ValueError"""
+        parts = fen.split()
+        if len(parts) < 4:
+            raise ValueError(f"Неверный FEN: {fen}")
+        placement, side, castling_text, en_passant = parts[:4]
+
+        board = []
+        for rank in placement.split('/'):
+            row = []
+            for char in rank:
+                if char.isdigit():
+                    row.extend([' '] * int(char))
+                elif char.lower() in 'pnbrqk':
+                    row.append(char)
+                else:
+                    raise ValueError(f"Неверный FEN: {fen}")
+            board.append(row)
+        if len(board) != 8 or any(len(row) != 8 for row in board) or side not in ('w', 'b'):
+            raise ValueError(f"Неверный FEN: {fen}")
+
+        castling, rook_files = self._parse_fen_castling(board, castling_text)
+        if castling is None:
+            raise ValueError(f"Неверный FEN: {fen}")
+
+        en_passant_target = None
+        if en_passant != '-':
+            en_passant_target = self.parse_position(en_passant)
+            if en_passant_target is None:
+                raise ValueError(f"Неверный FEN: {fen}")
+            # Цель без пешки, способной бить на проходе, отбрасывается - как после хода в партии
+            row = 3 if side == 'w' else 4
+            pawn = 'P' if side == 'w' else 'p'
+            col = en_passant_target[1]
+            if not ((col > 0 and board[row][col - 1] == pawn) or (col < 7 and board[row][col + 1] == pawn)):
+                en_passant_target = None
+
+        # Счетчики - до установки позиции, чтобы журнал ходов записал позицию вместе с ними
+        self.halfmove_clock = int(parts[4]) if len(parts) > 4 else 0
+        fullmove = int(parts[5]) if len(parts) > 5 else 1
+        self.move_count = (fullmove - 1) * 2 + (1 if side == 'b' else 0)
+        self.set_position(Position.from_board(board, 'white' if side == 'w' else 'black',
+                                              castling, en_passant_target, rook_files))
+
+    @staticmethod
+    def _parse_fen_castling(board, text):
+        """Права на рокировку из FEN: KQkq (крайняя ладья со стороны короля) или
+        вертикали ладей AHah (Shredder-FEN/X-FEN). Возвращает (права, вертикали ладей);
+        права, не соответствующие расстановке, отбрасываются; (None, None) при ошибке"""
+        castling = 0
+        rook_files = list(STANDARD_ROOK_FILES)
+        if text == '-':
+            return castling, tuple(rook_files)
+
+        for char in text:
+            upper = char.upper()
+            if upper not in 'KQABCDEFGH':
+                return None, None
+            white = char.isupper()
+            row = board[7 if white else 0]
+            king, rook = ('K', 'R') if white else ('k', 'r')
+            if king not in row:
+                continue
+            king_col = row.index(king)
 
-                from_pos = (from_row, from_col)
+            if upper == 'K':
+                rook_col = next((col for col in range(7, king_col, -1) if row[col] == rook), None)
+            elif upper == 'Q':
+                rook_col = next((col for col in range(king_col) if row[col] == rook), None)
+            else:
+                rook_col = ord(upper) - ord('A')
+            if rook_col is None or row[rook_col] != rook:
+                continue
 
-                for to_row in range(8):
-                    for to_col in range(8):
-                        to_pos = (to_row, to_col)
+            if white:
+                right = CASTLE_WHITE_KINGSIDE if rook_col > king_col else CASTLE_WHITE_QUEENSIDE
+            else:
+                right = CASTLE_BLACK_KINGSIDE if rook_col > king_col else CASTLE_BLACK_QUEENSIDE
+            castling |= right
+            rook_files[CASTLING_RIGHTS.index(right)] = rook_col
+        return castling, tuple(rook_files)
+
+    def get_fen(self):
+        """Текущая позиция в нотации FEN"""
+        ranks = []
+        for row in self.board:
+            rank = ''
+            empty = 0
+            for piece in row:
+                if piece == ' ':
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece
+            ranks.append(rank + (str(empty) if empty else ''))
+
+        # Права на рокировку: KQkq, если ладья крайняя со своей стороны, иначе вертикаль (X-FEN)
+        castling = ''
+        for index, (char, right) in enumerate((('K', CASTLE_WHITE_KINGSIDE), ('Q', CASTLE_WHITE_QUEENSIDE),
+                                               ('k', CASTLE_BLACK_KINGSIDE), ('q', CASTLE_BLACK_QUEENSIDE))):
+            if not self.castling_rights & right:
+                continue
+            row = self.board[CASTLING_ROW[right]]
+            rook_col = self.castling_rook_files[index]
+            outer = range(rook_col + 1, 8) if char in 'Kk' else range(rook_col)
+            if any(row[col] == row[rook_col] for col in outer):
+                char = chr(ord('A' if char.isupper() else 'a') + rook_col)
+            castling += char
+        castling = castling or '-'
+        en_passant = self.position_to_notation(self.en_passant_target) if self.en_passant_target else '-'
+        side = 'w' if self.current_player == 'white' else 'b'
+        return (f"{'/'.join(ranks)} {side} {castling} {en_passant} "
+                f"{self.halfmove_clock} {self.move_count // 2 + 1}")
+
+    def parse_uci_move(self, text):
+        """Разобрать ход в нотации UCI (e2e4, e7e8q) в (откуда, куда, превращение) или None"""
+        if len(text) not in (4, 5):
+            return None
+        from_pos = self.parse_position(text[:2])
+        to_pos = self.parse_position(text[2:4])
+        if from_pos is None or to_pos is None:
+            return None
+        promotion = text[4].upper() if len(text) == 5 else None
+        if promotion is not None and promotion not in 'QRBN':
+            return None
+        return from_pos, to_pos, promotion
+
+    def get_position_key(self):
+        """Хэшируемый ключ позиции (снимок Position)"""
+        return self.get_position()
+
+    def _invalidate_position_cache(self):
+        """Сбросить кэш ходов (вызывается при изменении позиции)"""
+        self._position_cache_key = None
+        self._position_cache = {}
+
+    def _get_position_cache(self):
+        """Кэш текущей позиции; сбрасывается, если позиция изменилась"""
+        key = self.get_position_key()
+        if key != self._position_cache_key:
+            self._position_cache_key = key
+            self._position_cache = {}
+        return self._position_cache
+
+    def get_legal_moves_by_origin(self, color):
+        """Все легальные ходы цвета, сгруппированные по исходной клетке (с кэшированием)"""
+        cache = self._get_position_cache()
+        cache_key = ('legal', color)
+        if cache_key not in cache:
+            cache[cache_key] = self._generate_legal_moves_by_origin(color)
+        return cache[cache_key]
+
+    def _generate_legal_moves_by_origin(self, color):
+        """Генерация легальных ходов цвета, сгруппированных по исходной клетке"""
+        moves_by_origin = {}
+        for move in self.generate_moves(color):
+            # Превращения различаются только фигурой - клетку назначения учитываем один раз
+            if move >> 14 == MOVE_PROMOTION and move >> 12 & 3 != 3:
+                continue
+            moves_by_origin.setdefault(SQUARE_POS[move & 63], []).append(SQUARE_POS[move >> 6 & 63])
+        return moves_by_origin
 
-                        if from_pos == to_pos:
-                            continue
+    def generate_moves(self, color, buffer=None):
+        """Легальные ходы цвета в упакованном виде; buffer (array('H')) очищается и переиспользуется"""
+        if buffer is None:
+            buffer = array('H')
+        else:
+            del buffer[:]
 
-                        original_player = self.current_player
-                        self.current_player = color
+        board = self.board
+        white = color == 'white'
+        append = buffer.append
+        original_player = self.current_player
+        self.current_player = color
+        try:
+            for from_sq in range(64):
+                from_pos = SQUARE_POS[from_sq]
+                piece = board[from_pos[0]][from_pos[1]]
+                if piece == ' ' or piece.isupper() != white:
+                    continue
+                kind = piece.lower()
 
-                        valid, _ = self.is_valid_move(from_pos, to_pos)
+                if kind == 'p':
+                    self._generate_pawn_moves(from_pos, white, append)
+                    continue
 
-                        self.current_player = original_player
+                if kind == 'n' or kind == 'k':
+                    for to_sq in (KNIGHT_TARGETS if kind == 'n' else KING_TARGETS)[from_sq]:
+                        to_pos = SQUARE_POS[to_sq]
+                        target = board[to_pos[0]][to_pos[1]]
+                        if (target == ' ' or target.isupper() != white) and \
+                                not self.would_be_in_check(from_pos, to_pos):
+                            append(from_sq | to_sq << 6)
+                    if kind == 'k' and self.castling_rights & (WHITE_CASTLING if white else BLACK_CASTLING):
+                        for right in CASTLING_RIGHTS:
+                            if right & (WHITE_CASTLING if white else BLACK_CASTLING):
+                                move = self._castling_move(right)
+                                if move is not None and self.is_valid_castling(*move):
+                                    to_pos = move[1]
+                                    append(from_sq | (to_pos[0] * 8 + to_pos[1]) << 6 | MOVE_CASTLING << 14)
+                    continue
 
-                        if valid:
-                            legal_moves.append((from_pos, to_pos))
+                rays = ()
+                if kind != 'b':
+                    rays += ORTHOGONAL_RAYS[from_sq]
+                if kind != 'r':
+                    rays += DIAGONAL_RAYS[from_sq]
+                for ray in rays:
+                    for to_pos in ray:
+                        target = board[to_pos[0]][to_pos[1]]
+                        if target != ' ' and target.isupper() == white:
+                            break
+                        if not self.would_be_in_check(from_pos, to_pos):
+                            append(from_sq | (to_pos[0] * 8 + to_pos[1]) << 6)
+                        if target != ' ':
+                            break
+        finally:
+            self.current_player = original_player
+        return buffer
+
+    def _generate_pawn_moves(self, from_pos, white, append):
+        """Ходы пешки: вперед, взятия, взятие на проходе и превращения"""
+        board = self.board
+        row, col = from_pos
+        direction = -1 if white else 1
+        to_row = row + direction
+        from_sq = row * 8 + col
+        last_row = 0 if white else 7
+
+        targets = []
+        if board[to_row][col] == ' ':
+            targets.append((to_row, col, MOVE_NORMAL))
+            if row == (6 if white else 1) and board[to_row + direction][col] == ' ':
+                targets.append((to_row + direction, col, MOVE_NORMAL))
+        for to_col in (col - 1, col + 1):
+            if not 0 <= to_col < 8:
+                continue
+            target = board[to_row][to_col]
+            if target != ' ' and target.isupper() != white:
+                targets.append((to_row, to_col, MOVE_NORMAL))
+            elif target == ' ' and (to_row, to_col) == self.en_passant_target and \
+                    to_row == (2 if white else 5):
+                targets.append((to_row, to_col, MOVE_EN_PASSANT))
+
+        for target_row, target_col, flag in targets:
+            if self.would_be_in_check(from_pos, SQUARE_POS[target_row * 8 + target_col]):
+                continue
+            move = from_sq | (target_row * 8 + target_col) << 6
+            if target_row == last_row:
+                for promotion in range(4):
+                    append(move | promotion << 12 | MOVE_PROMOTION << 14)
+            else:
+                append(move | flag << 14)
 
+    def get_all_legal_moves(self, color):
+        """Получить все возможные легальные ходы для указанного цвета"""
+        legal_moves = []
+        for from_pos, targets in self.get_legal_moves_by_origin(color).items():
+            for to_pos in targets:
+                legal_moves.append((from_pos, to_pos))
         return legal_moves
 
     def get_legal_moves_for_piece(self, pos):
@@ -424,23 +1439,28 @@ class ChessGame:
         if piece == ' ':
             return []
 
-        legal_moves = []
-        for to_row in range(8):
-            for to_col in range(8):
-                to_pos = (to_row, to_col)
-                if pos == to_pos:
-                    continue
+        return list(self.get_legal_moves_by_origin(self.current_player).get(pos, []))
 
-                valid, _ = self.is_valid_move(pos, to_pos)
-                if valid:
-                    legal_moves.append(to_pos)
+    def is_legal_move(self, from_pos, to_pos):
+        """Быстрая проверка легальности хода текущего игрока по кэшу"""
+        return to_pos in self.get_legal_moves_by_origin(self.current_player).get(from_pos, ())
 
-        return legal_moves
+    def get_attacked_squares(self, by_color):
+        """Множество клеток, атакованных фигурами цвета (с кэшированием)"""
+        cache = self._get_position_cache()
+        cache_key = ('attacked', by_color)
+        if cache_key not in cache:
+            cache[cache_key] = frozenset(
+                (row, col) for row in range(8) for col in range(8)
+                if self.is_square_attacked((row, col), by_color)
+            )
+        return cache[cache_key]
 
     def get_threatened_pieces(self, color):
         """Получить список угрожаемых фигур указанного цвета"""
         threatened = []
         enemy_color = 'black' if color == 'white' else 'white'
+        attacked = self.get_attacked_squares(enemy_color)
 
         for row in range(8):
             for col in range(8):
@@ -455,7 +1475,7 @@ class ChessGame:
                 if color == 'black' and not self.is_black_piece(piece):
                     continue
 
-                if self.is_square_attacked(pos, enemy_color):
+                if pos in attacked:
                     threatened.append(pos)
 
         return threatened
@@ -476,100 +1496,178 @@ class ChessGame:
         legal_moves = self.get_all_legal_moves(color)
         return len(legal_moves) == 0
 
+    def is_insufficient_material(self):
+        """Проверка недостатка материала для мата (K-K, K+лёгкая фигура-K, слоны одного цвета)"""
+        minors = []
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece == ' ' or piece.lower() == 'k':
+                    continue
+                if piece.lower() in 'prq':
+                    return False
+                minors.append((piece, (row + col) % 2))
+
+        if len(minors) <= 1:
+            return True
+        # Только слоны, и все на полях одного цвета
+        return all(piece.lower() == 'b' for piece, _ in minors) and len({color for _, color in minors}) == 1
+
+    def recompute_evaluation(self):
+        """Пересчитать оценку полным обходом доски (после прямых правок self.board)"""
+        self.mg_score = 0
+        self.eg_score = 0
+        self.phase = 0
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece != ' ':
+                    self._eval_add(piece, (row, col))
+
+    def _eval_add(self, piece, pos):
+        sq = pos[0] * 8 + pos[1]
+        self.mg_score += EVAL_MIDDLEGAME[piece][sq]
+        self.eg_score += EVAL_ENDGAME[piece][sq]
+        self.phase += PHASE_WEIGHTS[piece.lower()]
+
+    def _eval_remove(self, piece, pos):
+        sq = pos[0] * 8 + pos[1]
+        self.mg_score -= EVAL_MIDDLEGAME[piece][sq]
+        self.eg_score -= EVAL_ENDGAME[piece][sq]
+        self.phase -= PHASE_WEIGHTS[piece.lower()]
+
+    def evaluate(self):
+        """Оценка позиции за O(1) с точки зрения стороны, которая ходит (в сантипешках)"""
+        phase = min(self.phase, MAX_PHASE)
+        score = (self.mg_score * phase + self.eg_score * (MAX_PHASE - phase)) // MAX_PHASE
+        return score if self.current_player == 'white' else -score
+
     def save_state(self):
         """Сохранить текущее состояние игры"""
         return {
-            'board': deepcopy(self.board),
+            'position': self.get_position(),
             'current_player': self.current_player,
             'move_count': self.move_count,
+            'halfmove_clock': self.halfmove_clock,
             'white_king_pos': self.white_king_pos,
             'black_king_pos': self.black_king_pos,
-            'white_king_moved': self.white_king_moved,
-            'white_rook_a_moved': self.white_rook_a_moved,
-            'white_rook_h_moved': self.white_rook_h_moved,
-            'black_king_moved': self.black_king_moved,
-            'black_rook_a_moved': self.black_rook_a_moved,
-            'black_rook_h_moved': self.black_rook_h_moved,
+            'castling_rights': self.castling_rights,
             'en_passant_target': self.en_passant_target,
+            'mg_score': self.mg_score,
+            'eg_score': self.eg_score,
+            'phase': self.phase,
         }
 
-    def restore_state(self, state):
-        """Восстановить состояние игры"""
-        self.board = deepcopy(state['board'])
+    def restore_state(self, state, board=True):
+        """Восстановить состояние игры (board=False - доска уже восстановлена на месте)"""
+        if board:
+            self.board = state['position'].to_board()
         self.current_player = state['current_player']
         self.move_count = state['move_count']
+        self.halfmove_clock = state['halfmove_clock']
         self.white_king_pos = state['white_king_pos']
         self.black_king_pos = state['black_king_pos']
-        self.white_king_moved = state['white_king_moved']
-        self.white_rook_a_moved = state['white_rook_a_moved']
-        self.white_rook_h_moved = state['white_rook_h_moved']
-        self.black_king_moved = state['black_king_moved']
-        self.black_rook_a_moved = state['black_rook_a_moved']
-        self.black_rook_h_moved = state['black_rook_h_moved']
+        self.castling_rights = state['castling_rights']
         self.en_passant_target = state['en_passant_target']
+        self.mg_score = state['mg_score']
+        self.eg_score = state['eg_score']
+        self.phase = state['phase']
 
     def make_move(self, from_pos, to_pos, promotion_piece='Q'):
         """Выполнить ход"""
         if self.replay_mode:
             return
 
+        self._apply_move(from_pos, to_pos, promotion_piece)
+        # Новый ход закрывает ветку отмененных ходов
+        self.redo_stack = []
+        if self.move_log is not None:
+            self.move_log.record_move(self.move_history[-1])
+
+        self._check_game_end()
+
+    def _check_game_end(self):
+        """Проверить мат, пат и шах стороне, которая ходит, и сообщить о них"""
+        if self.is_checkmate(self.current_player):
+            self.game_over = True
+            winner = 'ЧЕРНЫЕ' if self.current_player == 'white' else 'БЕЛЫЕ'
+            print(f"\n{'=' * 40}")
+            print(f"МАТ! Победили {winner}!")
+            print(f"{'=' * 40}\n")
+        elif self.is_stalemate(self.current_player):
+            self.game_over = True
+            print(f"\n{'=' * 40}")
+            print("ПАТ! Ничья!")
+            print(f"{'=' * 40}\n")
+        elif self.is_in_check(self.current_player):
+            print(f"\nШАХ {'белому' if self.current_player == 'white' else 'черному'} королю!")
+
+    def _apply_move(self, from_pos, to_pos, promotion_piece='Q', state=None):
+        """Выполнить ход без проверки окончания игры и без вывода (для движков).
+
+        state - запись истории отмененного хода при повторе: состояние до хода уже в ней.
+        """
         # Сохраняем состояние для истории
-        state = self.save_state()
+        if state is None:
+            state = self.save_state()
         state['from_pos'] = from_pos
         state['to_pos'] = to_pos
         state['captured_piece'] = self.get_piece_at(to_pos)
 
         piece = self.board[from_pos[0]][from_pos[1]]
+        state['piece'] = piece
+        self._invalidate_position_cache()
 
         # Обработка взятия на проходе
         en_passant_capture = False
-        if piece.lower() == 'p' and to_pos == self.en_passant_target:
+        if piece.lower() == 'p' and to_pos == self.en_passant_target and from_pos[1] != to_pos[1]:
             en_passant_capture = True
-            direction = 1 if self.is_white_piece(piece) else -1
-            capture_pos = (to_pos[0] - direction, to_pos[1])
+            capture_pos = (from_pos[0], to_pos[1])
             state['en_passant_captured'] = self.board[capture_pos[0]][capture_pos[1]]
             state['en_passant_capture_pos'] = capture_pos
             self.board[capture_pos[0]][capture_pos[1]] = ' '
+            self._eval_remove(state['en_passant_captured'], capture_pos)
 
         # Сброс цели взятия на проходе
         self.en_passant_target = None
 
-        # Установка новой цели взятия на проходе
+        # Установка новой цели взятия на проходе - только если рядом стоит пешка соперника
+        # (как в FEN и Polyglot): иначе одна позиция получала бы разные ключи и хэши
         if piece.lower() == 'p' and abs(to_pos[0] - from_pos[0]) == 2:
-            direction = 1 if self.is_white_piece(piece) else -1
-            self.en_passant_target = (from_pos[0] + direction, from_pos[1])
-
-        # Обработка рокировки
-        if piece.lower() == 'k' and abs(to_pos[1] - from_pos[1]) == 2:
-            # Перемещаем ладью
-            if to_pos[1] > from_pos[1]:  # Короткая рокировка
-                rook_from = (from_pos[0], 7)
-                rook_to = (from_pos[0], 5)
-            else:  # Длинная рокировка
-                rook_from = (from_pos[0], 0)
-                rook_to = (from_pos[0], 3)
-
-            self.board[rook_to[0]][rook_to[1]] = self.board[rook_from[0]][rook_from[1]]
-            self.board[rook_from[0]][rook_from[1]] = ' '
+            row, col = to_pos
+            enemy = 'p' if piece == 'P' else 'P'
+            if (col > 0 and self.board[row][col - 1] == enemy) or (col < 7 and self.board[row][col + 1] == enemy):
+                self.en_passant_target = ((from_pos[0] + to_pos[0]) // 2, from_pos[1])
+
+        # Права на рокировку: ход с клетки или на клетку короля/ладьи снимает свои права
+        masks = self._castling_masks
+        castling_right = piece.lower() == 'k' and self._castling_right(from_pos, to_pos)
+        self.castling_rights &= masks[from_pos[0] * 8 + from_pos[1]] & masks[to_pos[0] * 8 + to_pos[1]]
+
+        if castling_right:
+            # Рокировка: король и ладья встают на вертикали g/f или c/d
+            # (в шахматах Фишера клетки могут совпадать с исходными)
+            row = from_pos[0]
+            rook_from = (row, self.castling_rook_files[CASTLING_RIGHTS.index(castling_right)])
+            rook_to = (row, CASTLING_ROOK_TARGET[castling_right])
+            rook = self.board[row][rook_from[1]]
+            to_pos = (row, CASTLING_KING_TARGET[castling_right])
+            state['captured_piece'] = ' '
+
+            self.board[row][from_pos[1]] = ' '
+            self.board[row][rook_from[1]] = ' '
+            self.board[row][rook_to[1]] = rook
+            self.board[row][to_pos[1]] = piece
+            self._eval_remove(rook, rook_from)
+            self._eval_add(rook, rook_to)
             state['castling'] = True
+            state['king_to'] = to_pos
             state['rook_from'] = rook_from
             state['rook_to'] = rook_to
-
-        # Обновляем флаги перемещения для рокировки
-        if piece == 'K':
-            self.white_king_moved = True
-        elif piece == 'k':
-            self.black_king_moved = True
-        elif piece == 'R':
-            if from_pos == (7, 0):
-                self.white_rook_a_moved = True
-            elif from_pos == (7, 7):
-                self.white_rook_h_moved = True
-        elif piece == 'r':
-            if from_pos == (0, 0):
-                self.black_rook_a_moved = True
-            elif from_pos == (0, 7):
-                self.black_rook_h_moved = True
+        else:
+            # Выполняем ход
+            self.board[to_pos[0]][to_pos[1]] = piece
+            self.board[from_pos[0]][from_pos[1]] = ' '
 
         # Обновляем позицию короля
         if piece.lower() == 'k':
@@ -578,10 +1676,6 @@ class ChessGame:
             else:
                 self.black_king_pos = to_pos
 
-        # Выполняем ход
-        self.board[to_pos[0]][to_pos[1]] = piece
-        self.board[from_pos[0]][from_pos[1]] = ' '
-
         # Превращение пешки
         if piece.lower() == 'p':
             promotion_row = 0 if self.is_white_piece(piece) else 7
@@ -592,27 +1686,24 @@ class ChessGame:
                     self.board[to_pos[0]][to_pos[1]] = promotion_piece.lower()
                 state['promotion'] = promotion_piece
 
+        # Обновляем оценку: взятая фигура уходит, ходившая (или превращенная) переезжает
+        if state['captured_piece'] != ' ':
+            self._eval_remove(state['captured_piece'], to_pos)
+        self._eval_remove(piece, from_pos)
+        self._eval_add(self.board[to_pos[0]][to_pos[1]], to_pos)
+
+        # Правило 50 ходов: счётчик сбрасывается ходом пешки или взятием
+        if piece.lower() == 'p' or state['captured_piece'] != ' ':
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+
         self.move_history.append(state)
         self.move_count += 1
         self.current_player = 'black' if self.current_player == 'white' else 'white'
 
-        # Проверяем окончание игры
-        if self.is_checkmate(self.current_player):
-            self.game_over = True
-            winner = 'ЧЕРНЫЕ' if self.current_player == 'white' else 'БЕЛЫЕ'
-            print(f"\n{'=' * 40}")
-            print(f"МАТ! Победили {winner}!")
-            print(f"{'=' * 40}\n")
-        elif self.is_stalemate(self.current_player):
-            self.game_over = True
-            print(f"\n{'=' * 40}")
-            print("ПАТ! Ничья!")
-            print(f"{'=' * 40}\n")
-        elif self.is_in_check(self.current_player):
-            print(f"\nШАХ {'белому' if self.current_player == 'white' else 'черному'} королю!")
-
     def undo_move(self, steps=1):
-        """Откатить ход(ы) назад"""
+        """Откатить ход(ы) назад; откаченные ходы можно повторить через redo"""
         if len(self.move_history) < steps:
             print(f"Недостаточно ходов для отката. Доступно: {len(self.move_history)}")
             return False
@@ -620,28 +1711,62 @@ class ChessGame:
         for _ in range(steps):
             if not self.move_history:
                 break
+            self.redo_stack.append(self._undo_last_move())
+        if self.move_log is not None:
+            self.move_log.record_undo(steps)
 
-            state = self.move_history.pop()
-
-            # Восстанавливаем рокировку
-            if 'castling' in state and state['castling']:
-                rook_from = state['rook_from']
-                rook_to = state['rook_to']
-                self.board[rook_from[0]][rook_from[1]] = self.board[rook_to[0]][rook_to[1]]
-                self.board[rook_to[0]][rook_to[1]] = ' '
+        self.game_over = False
+        print(f"Откачено {steps} ход(ов)")
+        return True
 
-            # Восстанавливаем взятие на проходе
-            if 'en_passant_captured' in state:
-                capture_pos = state['en_passant_capture_pos']
-                self.board[capture_pos[0]][capture_pos[1]] = state['en_passant_captured']
+    def redo(self, steps=1):
+        """Повторить ход(ы), откаченные через undo_move"""
+        if len(self.redo_stack) < steps:
+            print(f"Недостаточно ходов для повтора. Доступно: {len(self.redo_stack)}")
+            return False
 
-            # Восстанавливаем основное состояние
-            self.restore_state(state)
+        for _ in range(steps):
+            state = self.redo_stack.pop()
+            self._apply_move(state['from_pos'], state['to_pos'], state.get('promotion', 'Q'), state)
+        if self.move_log is not None:
+            self.move_log.record_redo(steps)
 
-        self.game_over = False
-        print(f"Откачено {steps} ход(ов)")
+        print(f"Повторено {steps} ход(ов)")
+        self._check_game_end()
         return True
 
+    def _apply_packed_move(self, move):
+        """Выполнить упакованный ход без проверки окончания игры (для движков)"""
+        promotion = PROMOTION_PIECES[move >> 12 & 3] if move >> 14 == MOVE_PROMOTION else 'Q'
+        self._apply_move(SQUARE_POS[move & 63], SQUARE_POS[move >> 6 & 63], promotion)
+
+    def _undo_last_move(self):
+        """Откатить последний ход без вывода (для движков)"""
+        state = self.move_history.pop()
+
+        # Ход отменяется на месте, без копирования доски из снимка позиции
+        board = self.board
+        from_row, from_col = state['from_pos']
+        if state.get('castling'):
+            # Сначала освобождаем конечные клетки: в шахматах Фишера они могут совпадать с исходными
+            rook = board[from_row][state['rook_to'][1]]
+            board[from_row][state['king_to'][1]] = ' '
+            board[from_row][state['rook_to'][1]] = ' '
+            board[from_row][state['rook_from'][1]] = rook
+            board[from_row][from_col] = state['piece']
+        else:
+            to_row, to_col = state['to_pos']
+            board[from_row][from_col] = state['piece']
+            board[to_row][to_col] = state['captured_piece']
+            if 'en_passant_capture_pos' in state:
+                row, col = state['en_passant_capture_pos']
+                board[row][col] = state['en_passant_captured']
+
+        # Счетчики, права, короли и оценка - из записи истории
+        self.restore_state(state, board=False)
+        self._invalidate_position_cache()
+        return state
+
     def move_to_notation(self, from_pos, to_pos, captured_piece='', check='', promotion=''):
         """Преобразовать ход в шахматную нотацию"""
         piece = self.get_piece_at(from_pos)
@@ -654,8 +1779,10 @@ class ChessGame:
         from_notation = self.position_to_notation(from_pos)
         to_notation = self.position_to_notation(to_pos)
 
-        # Рокировка
-        if piece.lower() == 'k' and abs(to_pos[1] - from_pos[1]) == 2:
+        # Рокировка: король на две клетки или на клетку своей ладьи (шахматы Фишера)
+        target = self.get_piece_at(to_pos)
+        if piece.lower() == 'k' and (abs(to_pos[1] - from_pos[1]) == 2 or
+                                     target == ('R' if piece == 'K' else 'r')):
             if to_pos[1] > from_pos[1]:
                 return "O-O" + check
             else:
@@ -669,64 +1796,65 @@ class ChessGame:
 
         return f"{piece_symbol}{capture_symbol}{to_notation}{promotion}{check}"
 
-    def save_game_to_file(self, filename):
-        """Сохранить партию в файл (полная нотация)"""
+    def get_move_notations(self):
+        """Ходы партии в нотации, восстановленные по снимкам позиций из истории"""
+        notations = []
+        temp_board = self.board
         try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                move_num = 1
-                for i in range(0, len(self.move_history), 2):
-                    white_state = self.move_history[i]
-
-                    # Восстанавливаем состояние для определения нотации
-                    temp_board = self.board
-                    temp_player = self.current_player
-
-                    self.board = white_state['board']
-                    from_pos = white_state['from_pos']
-                    to_pos = white_state['to_pos']
-                    piece = self.board[from_pos[0]][from_pos[1]]
-                    captured = white_state['captured_piece']
-
-                    promotion = f"={white_state['promotion']}" if 'promotion' in white_state else ''
-
-                    white_move = self.move_to_notation(from_pos, to_pos, captured, '', promotion)
-
-                    line = f"{move_num}. {white_move}"
-
-                    if i + 1 < len(self.move_history):
-                        black_state = self.move_history[i + 1]
-                        self.board = black_state['board']
-                        from_pos = black_state['from_pos']
-                        to_pos = black_state['to_pos']
-                        captured = black_state['captured_piece']
-                        promotion = f"={black_state['promotion']}" if 'promotion' in black_state else ''
-
-                        black_move = self.move_to_notation(from_pos, to_pos, captured, '', promotion)
-                        line += f" {black_move}"
+            for state in self.move_history:
+                self.board = state['position'].to_board()
+                captured = state['captured_piece'].strip() or state.get('en_passant_captured', '')
+                promotion = f"={state['promotion']}" if 'promotion' in state else ''
+                notations.append(self.move_to_notation(state['from_pos'], state['to_pos'], captured, '', promotion))
+        finally:
+            self.board = temp_board
+        return notations
+
+    def get_result(self):
+        """Результат партии: '1-0', '0-1', '1/2-1/2' или '*' (не завершена)"""
+        if self.is_checkmate(self.current_player):
+            return '0-1' if self.current_player == 'white' else '1-0'
+        if self.is_stalemate(self.current_player):
+            return '1/2-1/2'
+        return '*'
 
-                    f.write(line + "\n")
-                    move_num += 1
+    def save_game_to_file(self, filename, white=None, black=None):
+        """Сохранить партию в файл (полная нотация).
 
-                    self.board = temp_board
-                    self.current_player = temp_player
+        white и black - имена игроков для хранилища; по умолчанию white_player и black_player.
+        """
+        try:
+            notations = self.get_move_notations()
+            with open(filename, 'w', encoding='utf-8') as f:
+                for i in range(0, len(notations), 2):
+                    f.write(f"{i // 2 + 1}. {' '.join(notations[i:i + 2])}\n")
 
             print(f"Партия сохранена в файл: {filename}")
-            return True
         except Exception as e:
             print(f"Ошибка при сохранении: {e}")
             return False
 
+        if self.game_store is not None:
+            try:
+                game_id = self.game_store.add_game(self, white, black, source=os.path.abspath(filename))
+                print(f"Партия записана в хранилище (id {game_id})")
+            except Exception as e:
+                print(f"Ошибка при записи в хранилище: {e}")
+        return True
+
     def parse_move_notation(self, notation, color):
         """Парсинг хода из шахматной нотации"""
         notation = notation.strip().replace('+', '').replace('#', '').replace('!', '').replace('?', '')
 
         # Рокировка
-        if notation in ['O-O', '0-0']:
-            row = 7 if color == 'white' else 0
-            return ((row, 4), (row, 6))
-        if notation in ['O-O-O', '0-0-0']:
-            row = 7 if color == 'white' else 0
-            return ((row, 4), (row, 2))
+        if notation in ['O-O', '0-0', 'O-O-O', '0-0-0']:
+            kingside = len(notation) == 3
+            if color == 'white':
+                right = CASTLE_WHITE_KINGSIDE if kingside else CASTLE_WHITE_QUEENSIDE
+            else:
+                right = CASTLE_BLACK_KINGSIDE if kingside else CASTLE_BLACK_QUEENSIDE
+            move = self._castling_move(right)
+            return (move[0], move[1], None) if move is not None else None
 
         # Превращение пешки
         promotion = None
@@ -800,32 +1928,43 @@ class ChessGame:
 
         return None
 
+    @staticmethod
+    def parse_game_text(content):
+        """Список ходов в нотации из текста партии (1. e4 e5 2. ...); результат отбрасывается"""
+        import re
+
+        # Очищаем от комментариев и лишних символов
+        content = re.sub(r'\{[^}]*\}', '', content)
+        content = re.sub(r'\([^)]*\)', '', content)
+
+        moves = []
+        # Парсим ходы
+        pattern = r'\d+\.\s*([^\s]+)(?:\s+([^\s]+))?'
+        matches = re.findall(pattern, content)
+
+        for white_move, black_move in matches:
+            moves.append(white_move)
+            if black_move and black_move not in GAME_RESULTS:
+                moves.append(black_move)
+        return moves
+
     def load_game_from_file(self, filename):
         """Загрузить партию из файла (полная нотация)"""
         try:
             with open(filename, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            # Очищаем от комментариев и лишних символов
-            content = re.sub(r'\{[^}]*\}', '', content)
-            content = re.sub(r'\([^)]*\)', '', content)
-
-            moves = []
-            # Парсим ходы
-            pattern = r'\d+\.\s*([^\s]+)(?:\s+([^\s]+))?'
-            matches = re.findall(pattern, content)
-
-            for white_move, black_move in matches:
-                moves.append(white_move)
-                if black_move:
-                    moves.append(black_move)
+                moves = self.parse_game_text(f.read())
 
             self.replay_moves = moves
             self.replay_position = 0
             self.replay_mode = True
 
-            # Сбрасываем игру
+            # Сбрасываем игру (подключенные хранилище партий и журнал ходов сохраняем)
+            game_store, move_log = self.game_store, self.move_log
             self.__init__()
+            self.game_store = game_store
+            self.move_log = move_log
+            if move_log is not None:
+                move_log.record_reset(self)
             self.replay_moves = moves
             self.replay_mode = True
 
@@ -901,8 +2040,9 @@ class ChessGame:
         print("=" * 50)
         print("Ходы: e2 e4 - формат хода")
         print("hint [позиция] - показать доступные ходы для фигуры")
-        print("threats - показать угрожаемые фигуры")
+        print("threats - показать фигуры, которые соперник может выгодно взять")
         print("undo [N] - откатить N ходов назад (по умолчанию 1)")
+        print("redo [N] - повторить N откаченных ходов (по умолчанию 1)")
         print("save [файл] - сохранить партию")
         print("load [файл] - загрузить партию")
         print("next - следующий ход (в режиме просмотра)")
@@ -912,8 +2052,53 @@ class ChessGame:
         print("quit - выход")
         print("=" * 50 + "\n")
 
-    def play(self):
-        """Основной игровой цикл"""
+    def _flag(self, color):
+        """Поражение по времени"""
+        winner = 'ЧЕРНЫЕ' if color == 'white' else 'БЕЛЫЕ'
+        print(f"\nВремя истекло! Победили {winner}!")
+        self.game_over = True
+
+    def _play_engine_move(self, engines, clock):
+        """Ход движка за текущую сторону; после хода движок обдумывает ответ соперника"""
+        color = self.current_player
+        engine = engines[color]
+        remaining = clock.time_left(color)
+        move = engine.choose_move(self, remaining, clock.increment)
+        if move is None:
+            self.game_over = True
+            return
+        spent = remaining - clock.time_left(color)
+        if clock.flagged(color):
+            self._flag(color)
+            return
+
+        from_pos, to_pos, promotion = move
+        info = engine.last_info
+        text = self.position_to_notation(from_pos) + self.position_to_notation(to_pos)
+        if info is not None:
+            line = info['lines'][0]
+            score = f"мат в {line['mate']}" if line['mate'] is not None else f"{line['score']:+d}"
+            details = f"глубина {info['depth']}, оценка {score}, {info['nps']} узлов/с"
+        else:
+            details = "единственный ход"
+        if engine.last_ponderhit:
+            details += ", ход предсказан"
+        print(f"\nДвижок: {text} ({details}, {spent:.1f} с)")
+
+        self.make_move(from_pos, to_pos, promotion or 'Q')
+        clock.press()
+
+        # Обдумываем ответ только на времени человека: второй движок отнимал бы процессор
+        if not self.game_over and self.current_player not in engines:
+            engine.start_pondering(self)
+
+    def play(self, engines=None, clock=None):
+        """Основной игровой цикл.
+
+        engines - {цвет: движок} для сторон, за которые играет движок (см. engine_play.py),
+        clock - шахматные часы ChessClock; обязательны, если задан движок.
+        """
+        engines = engines or {}
         print("=" * 50)
         print("РАСШИРЕННЫЙ ШАХМАТНЫЙ СИМУЛЯТОР")
         print("=" * 50)
@@ -922,20 +2107,33 @@ class ChessGame:
         print("Черные: k-король, q-ферзь, r-ладья, b-слон, n-конь, p-пешка")
         print("\nВведите 'help' для справки по командам\n")
 
+        # После hint и threats на экране уже актуальный кадр с подсветкой
+        redraw = True
         while not self.game_over:
-            highlighted = []
-            threatened = []
-
-            self.print_board(highlighted, threatened)
+            if redraw:
+                self.print_board()
+            redraw = True
 
             if self.replay_mode:
                 print(f"РЕЖИМ ПРОСМОТРА - Ход {self.replay_position}/{len(self.replay_moves)}")
             else:
                 print(f"Ход #{self.move_count + 1}")
                 print(f"Ходят {'БЕЛЫЕ' if self.current_player == 'white' else 'ЧЕРНЫЕ'}")
+                if clock is not None:
+                    if clock.running != self.current_player:
+                        clock.start(self.current_player)
+                    print(f"Часы: белые {clock.format('white')}, черные {clock.format('black')}")
+
+            if self.current_player in engines and not self.replay_mode:
+                self._play_engine_move(engines, clock)
+                continue
 
             user_input = input("\nВведите команду: ").strip().lower()
 
+            if clock is not None and not self.replay_mode and clock.flagged(self.current_player):
+                self._flag(self.current_player)
+                break
+
             if user_input == 'quit':
                 print("Игра завершена!")
                 break
@@ -952,6 +2150,7 @@ class ChessGame:
                         legal_moves = self.get_legal_moves_for_piece(pos)
                         self.print_board(legal_moves, [])
                         print(f"Доступно ходов: {len(legal_moves)}")
+                        redraw = False
                     else:
                         print("Неверная позиция")
                 else:
@@ -959,11 +2158,12 @@ class ChessGame:
                 continue
 
             elif user_input == 'threats':
-                threatened = self.get_threatened_pieces(self.current_player)
+                threatened = self.get_hanging_pieces(self.current_player)
                 self.print_board([], threatened)
-                print(f"Угрожаемых фигур: {len(threatened)}")
+                print(f"Фигур под выгодным взятием: {len(threatened)}")
                 if self.is_in_check(self.current_player):
                     print("⚠️  ШАХ КОРОЛЮ!")
+                redraw = False
                 continue
 
             elif user_input.startswith('undo'):
@@ -972,6 +2172,12 @@ class ChessGame:
                 self.undo_move(steps)
                 continue
 
+            elif user_input.startswith('redo'):
+                parts = user_input.split()
+                steps = int(parts[1]) if len(parts) > 1 else 1
+                self.redo(steps)
+                continue
+
             elif user_input.startswith('save'):
                 parts = user_input.split()
                 filename = parts[1] if len(parts) > 1 else 'game.txt'
@@ -1016,8 +2222,8 @@ class ChessGame:
                 print("Ошибка! На указанной клетке нет фигуры.")
                 continue
 
-            valid, message = self.is_valid_move(from_pos, to_pos)
-            if not valid:
+            if not self.is_legal_move(from_pos, to_pos):
+                _, message = self.is_valid_move(from_pos, to_pos)
                 print(f"Ошибка! {message}")
                 continue
 
@@ -1031,8 +2237,13 @@ class ChessGame:
                         promotion = promo_input
 
             self.make_move(from_pos, to_pos, promotion)
+            if clock is not None:
+                clock.press()
 
+        for engine in engines.values():
+            engine.stop_pondering()
         self.print_board()
+        self.renderer.reset()
         print(f"Всего сделано ходов: {self.move_count}")
 
 
@@ -1161,6 +2372,653 @@ def run_tests():
     except:
         print("✗ Тест 8: Угрожаемые фигуры")
 
+    # Тест 9: Кэш легальных ходов
+    tests_total += 1
+    try:
+        game = ChessGame()
+        moves = game.get_legal_moves_for_piece((6, 4))
+        assert sorted(moves) == [(4, 4), (5, 4)]
+        assert game.get_legal_moves_for_piece((6, 4)) == moves
+        assert game.is_legal_move((6, 4), (4, 4))
+        assert len(game.get_all_legal_moves('white')) == 20
+        game.make_move((6, 4), (4, 4))
+        assert game.get_legal_moves_for_piece((6, 4)) == []
+        assert not game.is_legal_move((6, 4), (4, 4))
+        game.undo_move(1)
+        assert game.is_legal_move((6, 4), (4, 4))
+        print("✓ Тест 9: Кэш легальных ходов")
+        tests_passed += 1
+    except:
+        print("✗ Тест 9: Кэш легальных ходов")
+
+    # Тест 10: Счетчики инструментирования
+    tests_total += 1
+    try:
+        from instrumentation import Instrumentation
+
+        instrumentation = Instrumentation()
+        game = instrumentation.attach(ChessGame())
+        for from_pos, to_pos in [((6, 4), (4, 4)), ((1, 4), (3, 4)), ((7, 6), (5, 5))]:
+            game.make_move(from_pos, to_pos)
+        game.undo_move(2)
+        operations = instrumentation.snapshot()['operations']
+        assert operations['make_move']['count'] == 3 and operations['_apply_move']['count'] == 3
+        assert operations['undo_move']['count'] == 1 and operations['_undo_last_move']['count'] == 2
+        assert operations['make_move']['buckets']['+Inf'] == 3 and operations['make_move']['group'] == 'make_undo'
+        assert operations['save_game_to_file']['count'] == 0
+        assert instrumentation.snapshot()['history_plies'] == 1
+        assert 'chess_calls_total{op="make_move",group="make_undo"} 3' in instrumentation.export_prometheus()
+
+        instrumentation.reset()
+        game.make_move((1, 4), (3, 4))
+        assert instrumentation.snapshot()['operations']['make_move']['count'] == 1
+        # Копия инструментированной партии сериализуется без оберток
+        import pickle
+        copy = pickle.loads(pickle.dumps(game))
+        assert 'make_move' not in copy.__dict__ and copy.get_fen() == game.get_fen()
+        copy.make_move((7, 5), (4, 2))
+        assert instrumentation.snapshot()['operations']['make_move']['count'] == 1
+        # После отключения вызовы не считаются
+        instrumentation.detach(game)
+        game.undo_move(1)
+        assert 'undo_move' not in game.__dict__
+        assert instrumentation.snapshot()['operations']['undo_move']['count'] == 0
+        print("✓ Тест 10: Счетчики инструментирования")
+        tests_passed += 1
+    except:
+        print("✗ Тест 10: Счетчики инструментирования")
+
+    # Тест 11: Неизменяемая позиция
+    tests_total += 1
+    try:
+        import pickle
+        game = ChessGame()
+        position = game.get_position()
+        assert position == Position.initial()
+        game.make_move((6, 4), (4, 4))
+        after = position.apply(((6, 4), (4, 4)))
+        assert after == game.get_position() and hash(after) == hash(game.get_position())
+        assert after.en_passant_target is None and after.current_player == 'black'
+        # Перестановка ходов дает ту же позицию и тот же хэш
+        other = Position.initial()
+        for move in [((7, 6), (5, 5)), ((0, 1), (2, 2)), ((6, 4), (4, 4)), ((1, 4), (3, 4))]:
+            other = other.apply(move)
+        same = Position.initial()
+        for move in [((6, 4), (4, 4)), ((1, 4), (3, 4)), ((7, 6), (5, 5)), ((0, 1), (2, 2))]:
+            same = same.apply(move)
+        assert other == same and other.stable_hash() == same.stable_hash()
+        assert pickle.loads(pickle.dumps(after)) == after
+        game.set_position(position)
+        assert game.board[6][4] == 'P' and game.current_player == 'white'
+        print("✓ Тест 11: Неизменяемая позиция")
+        tests_passed += 1
+    except:
+        print("✗ Тест 11: Неизменяемая позиция")
+
+    # Тест 12: Оценка разменов (SEE)
+    tests_total += 1
+    try:
+        game = ChessGame()
+        game.board = [[' '] * 8 for _ in range(8)]
+        game.board[7][4], game.board[0][4] = 'K', 'k'
+        game.white_king_pos, game.black_king_pos = (7, 4), (0, 4)
+        game.board[4][4] = 'N'  # конь e4 защищен пешкой d3
+        game.board[5][3] = 'P'
+        game.board[2][4] = 'r'  # ладья e6 бьет коня
+        assert game.static_exchange_evaluation((4, 4), 'black') == 0
+        game.board[5][3] = ' '
+        assert game.static_exchange_evaluation((4, 4), 'black') == PIECE_VALUES['n']
+        assert game.get_hanging_pieces('white') == [(4, 4)]
+        assert game.static_exchange_evaluation((4, 4), 'black', first_attacker=(2, 4)) == PIECE_VALUES['n']
+        print("✓ Тест 12: Оценка разменов (SEE)")
+        tests_passed += 1
+    except:
+        print("✗ Тест 12: Оценка разменов (SEE)")
+
+    # Тест 13: Инкрементальная оценка
+    tests_total += 1
+    try:
+        game = ChessGame()
+        assert game.evaluate() == 0 and game.phase == MAX_PHASE
+        for from_pos, to_pos in [((6, 4), (4, 4)), ((1, 3), (3, 3)), ((4, 4), (3, 3)), ((0, 3), (3, 3))]:
+            game.make_move(from_pos, to_pos)
+        incremental = (game.mg_score, game.eg_score, game.phase)
+        game.recompute_evaluation()
+        assert incremental == (game.mg_score, game.eg_score, game.phase)
+        game.undo_move(4)
+        assert game.evaluate() == 0 and game.phase == MAX_PHASE
+        print("✓ Тест 13: Инкрементальная оценка")
+        tests_passed += 1
+    except:
+        print("✗ Тест 13: Инкрементальная оценка")
+
+    # Тест 14: Анализ с несколькими главными вариантами
+    tests_total += 1
+    try:
+        from analysis import analyse
+
+        game = ChessGame()
+        for from_pos, to_pos in [((6, 4), (4, 4)), ((1, 4), (3, 4)), ((7, 5), (4, 2)), ((0, 1), (2, 2)),
+                                 ((7, 3), (3, 7)), ((0, 6), (2, 5))]:
+            game._apply_move(from_pos, to_pos)
+        position = game.get_position()
+        results = list(analyse(game, multipv=3, max_depth=3))
+        assert [info['depth'] for info in results] == [1, 2, 3]
+        for info in results:
+            lines = info['lines']
+            assert len(lines) == 3
+            assert len({line['pv_notation'][0] for line in lines}) == 3
+            assert all(first['score'] >= second['score'] for first, second in zip(lines, lines[1:]))
+        assert results[-1]['lines'][0]['pv_notation'] == ['h5f7'] and results[-1]['lines'][0]['mate'] == 1
+        assert results[0]['nodes'] <= results[-1]['nodes']
+        # Позиция не изменилась: поиск шел на копии
+        assert game.get_position() == position
+
+        # Вариантов не больше, чем легальных ходов
+        board = [[' '] * 8 for _ in range(8)]
+        board[0][7], board[7][0] = 'k', 'K'
+        game.set_position(Position.from_board(board, castling=0))
+        lines = next(analyse(game, multipv=5, max_depth=1))['lines']
+        assert sorted(line['pv_notation'][0] for line in lines) == ['a1a2', 'a1b1', 'a1b2']
+        print("✓ Тест 14: Анализ multi-PV")
+        tests_passed += 1
+    except:
+        print("✗ Тест 14: Анализ multi-PV")
+
+    # Тест 15: FEN
+    tests_total += 1
+    try:
+        game = ChessGame()
+        start_fen = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+        assert game.get_fen() == start_fen
+        game.make_move((6, 4), (4, 4))
+        # Цель взятия на проходе - только если бить на проходе есть чем
+        assert game.get_fen() == "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+        game.make_move((1, 0), (2, 0))
+        game.make_move((4, 4), (3, 4))
+        game.make_move((1, 3), (3, 3))
+        assert game.get_fen() == "rnbqkbnr/1pp1pppp/p7/3pP3/8/8/PPPP1PPP/RNBQKBNR w KQkq d6 0 3"
+        game.load_fen("rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1")
+        assert game.en_passant_target is None
+        fen = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+        game.load_fen(fen)
+        assert game.get_fen() == fen and len(game.get_all_legal_moves('white')) == 48
+        assert game.parse_uci_move('e7e8q') == ((1, 4), (0, 4), 'Q')
+        print("✓ Тест 15: FEN")
+        tests_passed += 1
+    except:
+        print("✗ Тест 15: FEN")
+
+    # Тест 16: Упакованные ходы
+    tests_total += 1
+    try:
+        game = ChessGame()
+        move = encode_move((1, 4), (0, 4), 'N')
+        assert decode_move(move) == ((1, 4), (0, 4), 'N')
+        assert decode_move(move_from_tuple(((6, 4), (4, 4)))) == ((6, 4), (4, 4), None)
+        buffer = array('H')
+        assert game.generate_moves('white', buffer) is buffer and len(buffer) == 20
+        game.load_fen("4k3/1P6/8/8/8/8/8/4K3 w - - 0 1")
+        assert len(game.generate_moves('white', buffer)) == 9  # 4 превращения + 5 ходов короля
+        print("✓ Тест 16: Упакованные ходы")
+        tests_passed += 1
+    except:
+        print("✗ Тест 16: Упакованные ходы")
+
+    # Тест 17: Рокировка в шахматах Фишера и маска прав
+    tests_total += 1
+    try:
+        game = ChessGame()
+        game.load_fen("r4kr1/6p1/8/8/8/8/6P1/R4KR1 w GAga - 0 1")
+        assert game.castling_rook_files == (6, 0, 6, 0)
+        assert game.get_fen() == "r4kr1/6p1/8/8/8/8/6P1/R4KR1 w KQkq - 0 1"
+        assert game.is_legal_move((7, 5), (7, 6)) and game.is_legal_move((7, 5), (7, 0))
+        game._apply_move((7, 5), (7, 6))  # O-O: король на клетку своей ладьи
+        assert game.board[7][5:7] == ['R', 'K'] and game.white_king_pos == (7, 6)
+        assert game.get_castling_rights() == CASTLE_BLACK_KINGSIDE | CASTLE_BLACK_QUEENSIDE
+        game._undo_last_move()
+        game._apply_move((7, 5), (7, 0))  # O-O-O
+        assert game.board[7][:6] == [' ', ' ', 'K', 'R', ' ', ' ']
+        game.load_fen("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1")
+        # В классической позиции e1h1 - не рокировка, а ход на свою фигуру
+        assert game.is_valid_move((7, 4), (7, 7)) == (False, "На целевой клетке стоит ваша фигура!")
+        assert not game.is_legal_move((7, 4), (7, 7)) and game.is_valid_move((7, 4), (7, 6))[0]
+        game._apply_move((7, 0), (0, 0))  # взятие ладьи снимает права обеих сторон
+        assert game.get_fen().split()[2] == 'Kk'
+        print("✓ Тест 17: Рокировка в шахматах Фишера")
+        tests_passed += 1
+    except:
+        print("✗ Тест 17: Рокировка в шахматах Фишера")
+
+    # Тест 18: Отрисовка доски
+    tests_total += 1
+    try:
+        import io
+
+        game = ChessGame()
+        game.renderer = BoardRenderer(io.StringIO())
+        game.print_board([(5, 4)], [(6, 4)])
+        lines = game.renderer.output.getvalue().split("\n")
+        assert lines[1] == BOARD_HEADER and lines[8] == "2 P P P P [PP P P  2"
+        assert lines[7] == "3 . . . . *.. . .  3"
+        game.renderer = BoardRenderer(io.StringIO(), ansi=True)
+        game.print_board()
+        game.renderer.output = io.StringIO()
+        game._apply_move((6, 4), (4, 4))
+        game.print_board()
+        assert game.renderer.output.getvalue() == "\x1b7\x1b[7;11HP \x1b[9;11H. \x1b8"
+        print("✓ Тест 18: Отрисовка доски")
+        tests_passed += 1
+    except:
+        print("✗ Тест 18: Отрисовка доски")
+
+    # Тест 19: Распределение времени на ход
+    tests_total += 1
+    try:
+        from engine_play import allocate_time, should_continue
+
+        for remaining in (0.0, 0.05, 0.5, 3.0, 60.0, 300.0, 7200.0):
+            for increment in (0.0, 0.1, 2.0, 30.0):
+                for moves_to_go in (1, 5, 30):
+                    soft, hard = allocate_time(remaining, increment, moves_to_go)
+                    assert 0.0 <= soft <= hard <= remaining / 2
+        soft, hard = allocate_time(300.0, 2.0)
+        assert 5.0 < soft < hard
+        # Следующая итерация начинается, только если успеет до жесткого лимита
+        assert should_continue(0.1, 0.05, 0.02, soft, hard)
+        assert not should_continue(soft, 0.01, 0.01, soft, hard)
+        assert not should_continue(0.1, hard / 2, hard / 8, soft, hard)
+        print("✓ Тест 19: Распределение времени на ход")
+        tests_passed += 1
+    except:
+        print("✗ Тест 19: Распределение времени на ход")
+
+    # Тест 20: Сравнение бенчмарков с базовой линией
+    tests_total += 1
+    try:
+        import contextlib
+        import copy
+        import io
+        import json
+        import tempfile
+        from benchmark import MEMORY_NOISE, compare
+        from benchmark import main as bench_main
+
+        with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+            path = os.path.join(directory, 'baseline.json')
+            assert bench_main(['--only', 'fen', 'position_apply', '--warmup', '1', '--repeat', '2',
+                               '--save', path]) == 0
+            with open(path, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+
+            report = copy.deepcopy(baseline)
+            assert not any(entry['regression'] or entry['improvement']
+                           for entry in compare(report, baseline).values())
+            report['results']['fen']['normalized'] *= 1.5
+            report['results']['position_apply']['normalized'] *= 0.5
+            comparison = compare(report, baseline)
+            assert comparison['fen']['regression'] and not comparison['fen']['improvement']
+            assert comparison['position_apply']['improvement'] and not comparison['position_apply']['regression']
+            assert not compare(report, baseline, threshold=0.6)['fen']['regression']
+
+            # Память: рост в пределах шума не регрессия, большой рост - регрессия
+            report = copy.deepcopy(baseline)
+            baseline['results']['fen']['peak_memory'] = MEMORY_NOISE // 4
+            report['results']['fen']['peak_memory'] = MEMORY_NOISE // 2
+            assert not compare(report, baseline)['fen']['regression']
+            report['results']['fen']['peak_memory'] = MEMORY_NOISE * 4
+            assert compare(report, baseline)['fen']['regression']
+
+            # Базовая линия с заведомо более быстрыми результатами: код возврата 1
+            for result in baseline['results'].values():
+                result['normalized'] /= 10
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(baseline, f)
+            assert bench_main(['--only', 'fen', '--warmup', '1', '--repeat', '2', '--compare', path]) == 1
+        print("✓ Тест 20: Сравнение бенчмарков")
+        tests_passed += 1
+    except:
+        print("✗ Тест 20: Сравнение бенчмарков")
+
+    # Тест 21: Откат и повтор ходов на месте
+    tests_total += 1
+    try:
+        game = ChessGame()
+        game.load_fen("r3k2r/1P6/8/3pP3/8/8/8/R3K2R w KQkq d6 0 1")
+        start_fen = game.get_fen()
+        start_eval = game.evaluate()
+        # Взятие на проходе, рокировки, взятие с превращением
+        for from_pos, to_pos, promotion in [((3, 4), (2, 3), 'Q'), ((0, 4), (0, 6), 'Q'),
+                                            ((1, 1), (0, 0), 'N'), ((0, 6), (1, 7), 'Q'),
+                                            ((7, 4), (7, 2), 'Q')]:
+            game.make_move(from_pos, to_pos, promotion)
+        end_fen = game.get_fen()
+        end_eval = game.evaluate()
+        game.undo_move(5)
+        assert game.get_fen() == start_fen and game.evaluate() == start_eval
+        game.redo(2)
+        game.redo(3)
+        assert game.get_fen() == end_fen and game.evaluate() == end_eval
+        assert not game.redo(1) and len(game.move_history) == 5
+        game.undo_move(1)
+        game.make_move((7, 4), (7, 3))
+        assert game.redo_stack == []
+        print("✓ Тест 21: Откат и повтор ходов")
+        tests_passed += 1
+    except:
+        print("✗ Тест 21: Откат и повтор ходов")
+
+    # Тест 22: Решатель задач на мат
+    tests_total += 1
+    try:
+        from mate_solver import MateSolver
+
+        game = ChessGame()
+        game.load_fen("r1b2k1r/ppp1bppp/8/1B1Q4/5q2/2P5/PPP2PPP/R3R1K1 w - - 1 1")
+        result = MateSolver().solve(game, 2)
+        assert result['mate'] == 2 and result['pv_notation'] == ['d5d8', 'e7d8', 'e1e8']
+
+        # Мат в 2 с тихим первым ходом: только шахами он не находится
+        game.load_fen("8/8/8/8/8/8/5K1k/3R4 w - - 0 1")
+        assert MateSolver().solve(game, 2) is None
+        result = MateSolver(checks_only=False).solve(game, 2)
+        assert result['mate'] == 2 and result['pv_notation'][0] == 'f2f3'
+
+        game.load_fen("r2q1bnr/2p1p2p/8/5k2/p1p2P1P/2K5/PP1P4/RNB5 b - - 2 15")
+        assert MateSolver().solve(game, 2) is None
+        result = MateSolver().solve(game, 3)
+        assert result['mate'] == 3 and len(result['pv']) == 5 and result['pv_notation'][0] == 'd8d3'
+        print("✓ Тест 22: Решатель задач на мат")
+        tests_passed += 1
+    except:
+        print("✗ Тест 22: Решатель задач на мат")
+
+    # Тест 23: Поиск тактических задач
+    tests_total += 1
+    try:
+        import tempfile
+        from puzzle_miner import PuzzleMiner, confirm, iter_games
+
+        game = ChessGame()
+        game.load_fen("4k3/8/8/3q4/8/8/3R4/4K3 w - - 0 1")
+        line = confirm(game, 2, 5000)
+        assert line['pv'][0][:2] == ((6, 3), (3, 3)) and line['pv_notation'][0] == 'd2d5'
+        assert confirm(ChessGame(), 2, 5000) is None
+
+        with tempfile.TemporaryDirectory() as directory:
+            pgn = os.path.join(directory, 'games.pgn')
+            with open(pgn, 'w', encoding='utf-8') as f:
+                f.write('[FEN "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"]\n\n'
+                        '1... e5 2. Nf3 {комментарий} 2... Nc6 $1 3. Bb5 *\n\n'
+                        '[Event "тактика"]\n\n1. e4 e5 2. Nf3 Nc6 3. Bc4 Nd4 4. Nxe5 Qg5 5. Nxf7 Qxg2 '
+                        '6. Rf1 Qxe4+ 7. Be2 Nf3# 0-1\n\n'
+                        '[Event "спокойная"]\n\n1. e4 e5 2. Nf3 Nc6 3. Bb5 a6 4. Ba4 Nf6 5. O-O Be7 *\n')
+            tasks = list(iter_games([pgn]))
+            assert tasks[0]['moves'] == ['e5', 'Nf3', 'Nc6', 'Bb5'] and len(tasks) == 3
+
+            output = os.path.join(directory, 'puzzles.tsv')
+            summary = PuzzleMiner(output, depth=2, node_limit=5000).run([pgn])
+            assert summary['games'] == 3 and summary['puzzles'] == 1
+            with open(output, 'r', encoding='utf-8') as f:
+                assert f.read().split('\t')[2].startswith(f"{pgn}:1:")
+
+            # Прерванный запуск: последняя партия не успела попасть в контрольную точку
+            with open(output + '.checkpoint', 'r', encoding='utf-8') as f:
+                done = f.read().splitlines()
+            with open(output + '.checkpoint', 'w', encoding='utf-8') as f:
+                f.write('\n'.join(done[:-1]) + '\n')
+            assert PuzzleMiner(output, depth=2, node_limit=5000).run([pgn])['games'] == 1
+            assert PuzzleMiner(output).run([pgn])['games'] == 0
+            with open(output, 'r', encoding='utf-8') as f:
+                assert len(f.read().splitlines()) == 1
+        print("✓ Тест 23: Поиск тактических задач")
+        tests_passed += 1
+    except:
+        print("✗ Тест 23: Поиск тактических задач")
+
+    # Тест 24: Компактная сериализация партии
+    tests_total += 1
+    try:
+        for fen in ["r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                    "bqnb1rkr/pp3ppp/3ppn2/2p5/5P2/P2P4/NPP1P1PP/BQ1BNRKR w HFhf - 2 9"]:
+            game = ChessGame()
+            game.load_fen(fen)
+            data = game.serialize()
+            assert len(data) <= 40
+            assert ChessGame.deserialize(data).get_position() == game.get_position()
+
+        game = ChessGame()
+        for from_pos, to_pos in [((6, 4), (4, 4)), ((1, 3), (3, 3)), ((4, 4), (3, 3)), ((0, 3), (3, 3))]:
+            game.make_move(from_pos, to_pos)
+        copy = ChessGame.deserialize(game.serialize(moves=True))
+        assert copy.get_fen() == game.get_fen() and len(copy.move_history) == 4
+        assert len(game.serialize(moves=True)) == len(ChessGame().serialize()) + 8
+        print("✓ Тест 24: Компактная сериализация партии")
+        tests_passed += 1
+    except:
+        print("✗ Тест 24: Компактная сериализация партии")
+
+    # Тест 25: Партия, распакованная pickle в новом процессе (без вызова __init__)
+    tests_total += 1
+    try:
+        import pickle
+        import subprocess
+        # Класс из модуля chess, а не из __main__, чтобы его нашел другой процесс
+        from chess import ChessGame as ModuleGame
+
+        game = ModuleGame()
+        game.load_fen("4k3/8/8/8/8/8/8/R3K3 w Q - 0 1")
+        script = ("import pickle, sys; game = pickle.loads(sys.stdin.buffer.read()); "
+                  "print(game.is_valid_rook_move((7, 0), (0, 0)), game.is_valid_rook_move((7, 0), (7, 5)), "
+                  "len(game.get_all_legal_moves('white')))")
+        output = subprocess.run([sys.executable, '-c', script], input=pickle.dumps(game),
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, check=True).stdout.decode().split()
+        assert output == ['True', 'False', str(len(game.get_all_legal_moves('white')))]
+        print("✓ Тест 25: Распаковка партии в новом процессе")
+        tests_passed += 1
+    except:
+        print("✗ Тест 25: Распаковка партии в новом процессе")
+
+    # Тест 26: Сводка турнира движка с самим собой
+    tests_total += 1
+    try:
+        from tournament import build_tasks, summarize
+
+        tasks = build_tasks('random', 'random', 4)
+        results = []
+        for task, outcome in zip(tasks, ['0-1', '0-1', '0-1', '0-1']):
+            results.append(dict(task, result=outcome, reason='checkmate', plies=10,
+                                move_times={'white': [0.001] * 5, 'black': [0.002] * 5}))
+        summary = summarize(results, 1.0)
+        # A играет белыми в партиях 0 и 2, черными - в 1 и 3
+        assert (summary['wins'], summary['draws'], summary['losses']) == (2, 0, 2)
+        assert summary['score'] == 0.5
+        assert summary['move_time']['A']['moves'] == summary['move_time']['B']['moves'] == 20
+        print("✓ Тест 26: Сводка турнира")
+        tests_passed += 1
+    except:
+        print("✗ Тест 26: Сводка турнира")
+
+    # Тест 27: Протокол UCI
+    tests_total += 1
+    try:
+        import io
+        from uci import UCIEngine
+
+        output = io.StringIO()
+        engine = UCIEngine(output)
+        for line in ["uci", "isready", "position startpos moves e2e4 e7e5 g1f3"]:
+            assert engine.handle(line)
+        lines = output.getvalue().splitlines()
+        assert lines[-2:] == ["uciok", "readyok"]
+        assert engine.game.board[5][5] == 'N' and engine.game.current_player == 'black'
+
+        # Ход с пустой клетки и нелегальный ход: сообщение, остаток строки отбрасывается
+        engine.handle("position startpos moves e3e4 e2e4")
+        assert engine.game.get_fen() == ChessGame().get_fen()
+        engine.handle("position startpos moves e2e4 e7e5 e1e3 d2d4")
+        assert len(engine.game.move_history) == 2
+        assert output.getvalue().count("info string") == 2
+
+        engine.handle("position fen 6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1")
+        engine.handle("go depth 2")
+        engine.search_thread.join()
+        assert output.getvalue().splitlines()[-1] == "bestmove d1d8"
+        assert not engine.handle("quit")
+        print("✓ Тест 27: Протокол UCI")
+        tests_passed += 1
+    except:
+        print("✗ Тест 27: Протокол UCI")
+
+    # Тест 28: Хранилище партий
+    tests_total += 1
+    try:
+        import tempfile
+        from game_store import GameStore
+
+        with tempfile.TemporaryDirectory() as directory, GameStore(':memory:') as store:
+            game = ChessGame()
+            game.game_store = store
+            for notation in "e4 e5 Nf3 Nc6".split():
+                from_pos, to_pos, promotion = game.parse_move_notation(notation, game.current_player)
+                game.make_move(from_pos, to_pos, promotion or 'Q')
+            filename = os.path.join(directory, 'game.txt')
+            game.save_game_to_file(filename)
+            game.make_move((7, 5), (4, 2))
+            game.save_game_to_file(filename)
+            game.white_player, game.black_player = 'Иванов', 'Петров'
+            game.save_game_to_file(os.path.join(directory, 'copy.txt'))
+            game.save_game_to_file(os.path.join(directory, 'third.txt'), black='Сидоров')
+            # Повторное сохранение в тот же файл обновляет запись
+            assert store.count() == 3 and store.get_game(1)['plies'] == 5
+            # Имена игроков попадают в хранилище и через save_game_to_file
+            assert [row['id'] for row in store.find_games(player='Иванов')] == [2, 3]
+            assert [row['id'] for row in store.find_games(black='Сидоров')] == [3]
+            # Перестановка дебютных ходов находит те же партии
+            assert len(store.find_by_opening("Nf3 Nc6 e4 e5")) == 3
+            assert len(store.find_by_opening("e4 e5 Nf3 Nc6 Bc4")) == 3
+        print("✓ Тест 28: Хранилище партий")
+        tests_passed += 1
+    except:
+        print("✗ Тест 28: Хранилище партий")
+
+    # Тест 29: Граф позиций
+    tests_total += 1
+    try:
+        import sqlite3
+        import tempfile
+        import position_graph
+
+        flush_edges = position_graph.FLUSH_EDGES
+        position_graph.FLUSH_EDGES = 3
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'graph.sqlite3')
+                files = []
+                for index, text in enumerate(["1. e4 e5 2. Nf3 Nc6 3. Bb5 1-0", "1. Nf3 Nc6 2. e4 e5 3. Bc4 0-1"]):
+                    files.append(os.path.join(directory, f"{index}.txt"))
+                    with open(files[-1], 'w', encoding='utf-8') as f:
+                        f.write(text)
+
+                # Сбой посреди источника: ребра без отметки источника не записываются
+                crashed = position_graph.PositionGraph(path)
+                crashed._source = files[0]
+                crashed.add_text("1. e4 e5 2. Nf3 Nc6 3. Bb5 1-0")
+                check = sqlite3.connect(path)
+                assert check.execute("SELECT COUNT(*) FROM edges").fetchone()[0] == 0
+                crashed.connection.close()
+
+                with position_graph.PositionGraph(path) as graph:
+                    graph.add_file(files[0])
+                    assert check.execute("SELECT SUM(games) FROM edges").fetchone()[0] == 5
+                    assert check.execute("SELECT COUNT(*) FROM sources").fetchone()[0] == 1
+                    graph.add_file(files[1])
+                    assert not graph.add_file(files[0])
+                    # Перестановка ходов сходится в одну позицию
+                    game = ChessGame()
+                    for from_pos, to_pos in [((6, 4), (4, 4)), ((1, 4), (3, 4)), ((7, 6), (5, 5)), ((0, 1), (2, 2))]:
+                        game._apply_move(from_pos, to_pos)
+                    edges = graph.children(game.get_position())
+                    assert sorted(edge['move'] for edge in edges) == ['f1b5', 'f1c4']
+                    check.close()
+
+                # Партия хранилища, сохраненная заново под тем же id, заменяет прежнюю версию
+                from game_store import GameStore
+
+                with GameStore(os.path.join(directory, 'games.sqlite3')) as store, \
+                        position_graph.PositionGraph(':memory:') as graph:
+                    game = ChessGame()
+                    for from_pos, to_pos in [((6, 4), (4, 4)), ((1, 4), (3, 4))]:
+                        game._apply_move(from_pos, to_pos)
+                    store.add_game(game, result='1-0', source='game.txt')
+                    assert graph.add_store(store) == (1, 0, 0)
+                    game._apply_move((7, 6), (5, 5))
+                    store.add_game(game, result='0-1', source='game.txt')
+                    assert graph.add_store(store) == (0, 1, 0) and graph.add_store(store) == (0, 0, 0)
+                    assert graph.count() == 3
+                    edge, = graph.children(Position.initial())
+                    assert (edge['games'], edge['white_wins'], edge['black_wins']) == (1, 0, 1)
+                    store.connection.execute("DELETE FROM games")
+                    assert graph.add_store(store) == (0, 0, 1) and graph.count() == 0
+        finally:
+            position_graph.FLUSH_EDGES = flush_edges
+        print("✓ Тест 29: Граф позиций")
+        tests_passed += 1
+    except:
+        print("✗ Тест 29: Граф позиций")
+
+    # Тест 30: Журнал ходов и восстановление после сбоя
+    tests_total += 1
+    try:
+        import pickle
+        import tempfile
+        from move_log import RECORD, MoveLog
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'game.log')
+            game = ChessGame()
+            log = MoveLog.start(game, path)
+            for from_pos, to_pos in [((6, 4), (4, 4)), ((1, 4), (3, 4)), ((7, 6), (5, 5))]:
+                game.make_move(from_pos, to_pos)
+            game.undo_move(2)
+            game.redo(1)
+            game.load_fen("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 3 20")
+            game.make_move((7, 4), (7, 6))
+            game.make_move((0, 4), (0, 2))
+            game.undo_move(1)
+            # Копия партии не пишет в журнал оригинала
+            assert pickle.loads(pickle.dumps(game)).move_log is None
+            log.close()
+
+            recovered = MoveLog.recover(path)
+            assert recovered.get_fen() == game.get_fen()
+            assert len(recovered.move_history) == 1 and len(recovered.redo_stack) == 1
+            recovered.make_move((0, 4), (0, 6))
+            recovered.move_log.close()
+            complete = os.path.getsize(path)
+
+            # Недописанная запись отбрасывается и обрезается
+            with open(path, 'ab') as f:
+                f.write(b'M\x01')
+            assert MoveLog.recover(path).get_fen() == recovered.get_fen()
+            assert os.path.getsize(path) == complete
+
+            # Запись с неверным контрольным байтом и все за ней отбрасываются
+            with open(path, 'r+b') as f:
+                f.seek(complete - 1)
+                check = f.read(1)[0]
+                f.seek(complete - 1)
+                f.write(bytes([check ^ 0xFF]))
+            restored = MoveLog.recover(path)
+            assert restored.get_fen() == game.get_fen()
+            assert os.path.getsize(path) == complete - RECORD.size
+            restored.move_log.close()
+        print("✓ Тест 30: Журнал ходов")
+        tests_passed += 1
+    except:
+        print("✗ Тест 30: Журнал ходов")
+
     print("\n" + "=" * 50)
     print(f"РЕЗУЛЬТАТ: {tests_passed}/{tests_total} тестов пройдено")
     print("=" * 50 + "\n")
@@ -1169,10 +3027,66 @@ def run_tests():
 
 
 if __name__ == "__main__":
-    import sys
-
     if len(sys.argv) > 1 and sys.argv[1] == "--test":
         run_tests()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--profile":
+        from instrumentation import run_profile
+
+        run_profile(sys.argv[2] if len(sys.argv) > 2 else 'text')
+    elif len(sys.argv) > 1 and sys.argv[1] == "--bench":
+        from benchmark import main as bench_main
+
+        sys.exit(bench_main(sys.argv[2:]))
+    elif len(sys.argv) > 1 and sys.argv[1] == "--uci":
+        from uci import main as uci_main
+
+        uci_main()
+    elif len(sys.argv) > 2 and sys.argv[1] == "--engine":
+        # --engine white|black|both [секунд на партию [прибавка за ход]]
+        from engine_play import ChessClock, ClockedEngine
+
+        try:
+            if sys.argv[2] not in ('white', 'black', 'both'):
+                raise ValueError(sys.argv[2])
+            base = float(sys.argv[3]) if len(sys.argv) > 3 else 300.0
+            increment = float(sys.argv[4]) if len(sys.argv) > 4 else 2.0
+        except ValueError:
+            print("Использование: python chess.py --engine white|black|both [секунд на партию [прибавка за ход]]")
+            sys.exit(2)
+        colors = ('white', 'black') if sys.argv[2] == 'both' else (sys.argv[2],)
+        clock = ChessClock(base, increment)
+        game = ChessGame()
+        game.play({color: ClockedEngine() for color in colors}, clock)
+    elif len(sys.argv) > 1 and sys.argv[1] == "--ansi":
+        game = ChessGame()
+        game.renderer.ansi = True
+        game.play()
+    elif len(sys.argv) > 2 and sys.argv[1] == "--store":
+        # --store путь [белые черные]: без имен в командной строке они запрашиваются
+        from game_store import GameStore
+
+        game = ChessGame()
+        game.game_store = GameStore(sys.argv[2])
+        if len(sys.argv) > 4:
+            game.white_player, game.black_player = sys.argv[3], sys.argv[4]
+        else:
+            game.white_player = input("Имя игрока за белых: ").strip() or None
+            game.black_player = input("Имя игрока за черных: ").strip() or None
+        game.play()
+    elif len(sys.argv) > 2 and sys.argv[1] == "--log":
+        # Партия с журналом ходов: существующий журнал продолжается после сбоя
+        from move_log import MoveLog
+
+        if os.path.exists(sys.argv[2]):
+            game = MoveLog.recover(sys.argv[2])
+            print(f"Партия восстановлена из журнала: {len(game.move_history)} полуходов")
+        else:
+            game = ChessGame()
+            MoveLog.start(game, sys.argv[2])
+        try:
+            game.play()
+        finally:
+            game.move_log.close()
     else:
         game = ChessGame()
         game.play()
\ No newline at end of file
@@ -0,0 +1,263 @@
+"""Простые игроки-движки поверх ChessGame: случайный, жадный и перебор с альфа-бета."""
+import random
+import time
+
+from chess import MOVE_EN_PASSANT, MOVE_PROMOTION, PIECE_VALUES, SQUARE_POS, decode_move
+
+MATE_SCORE = 100000
+
+# Запас для отсечения по дельте в поиске взятий
+QUIESCENCE_MARGIN = 200
+
+
+def opponent(color):
+    """Цвет соперника"""
+    return 'black' if color == 'white' else 'white'
+
+
+def evaluate(game):
+    """Оценка позиции с точки зрения стороны, которая ходит (инкрементальная, за O(1))"""
+    return game.evaluate()
+
+
+def capture_value(game, move):
+    """Ценность фигуры, взятой упакованным ходом (0 для тихого хода)"""
+    if move >> 14 == MOVE_EN_PASSANT:
+        return PIECE_VALUES['p']
+    row, col = SQUARE_POS[move >> 6 & 63]
+    target = game.board[row][col]
+    return PIECE_VALUES[target.lower()] if target != ' ' else 0
+
+
+def capture_exchange_value(game, move):
+    """SEE взятия: материальный итог размена, начатого этим ходом"""
+    if move >> 14 == MOVE_EN_PASSANT:
+        # Взятие на проходе: пешка за пешку без учета ответа
+        return PIECE_VALUES['p']
+    return game.static_exchange_evaluation(SQUARE_POS[move >> 6 & 63], game.current_player,
+                                           first_attacker=SQUARE_POS[move & 63])
+
+
+def order_moves(game, moves):
+    """Упорядочить ходы: выгодные взятия по MVV-LVA и превращения в ферзя,
+    тихие ходы, затем проигрывающие взятия"""
+    board = game.board
+
+    def key(move):
+        bonus = 0
+        if move >> 14 == MOVE_PROMOTION:
+            if move >> 12 & 3 != 3:
+                return 2
+            bonus = PIECE_VALUES['q']
+        victim = capture_value(game, move)
+        if not victim:
+            return -bonus
+        if capture_exchange_value(game, move) < 0:
+            return 1
+        row, col = SQUARE_POS[move & 63]
+        attacker = PIECE_VALUES[board[row][col].lower()] or PIECE_VALUES['q']
+        return -(victim * 10 - attacker // 10) - bonus
+
+    return sorted(moves, key=key)
+
+
+class SearchStopped(Exception):
+    """Поиск остановлен по лимиту узлов, времени или внешнему сигналу"""
+
+
+class Searcher:
+    """Перебор negamax с альфа-бета отсечением на фиксированную глубину.
+
+    Внутри поиска ходы - упакованные числа; списки ходов генерируются в
+    переиспользуемые буферы array('H'), по одному на уровень дерева.
+    """
+
+    def __init__(self, node_limit=None, deadline=None, stop_event=None):
+        self.node_limit = node_limit
+        self.deadline = deadline
+        self.stop_event = stop_event
+        self.nodes = 0
+        self._buffers = []
+
+    def _check_limits(self):
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchStopped()
+        if self.nodes & 15 == 0:
+            if self.deadline is not None and time.perf_counter() >= self.deadline:
+                raise SearchStopped()
+            if self.stop_event is not None and self.stop_event.is_set():
+                raise SearchStopped()
+
+    def _generate(self, game, ply):
+        """Легальные ходы в буфер уровня ply"""
+        while len(self._buffers) <= ply:
+            self._buffers.append(None)
+        buffer = game.generate_moves(game.current_player, self._buffers[ply])
+        self._buffers[ply] = buffer
+        return buffer
+
+    def search(self, game, depth):
+        """Найти лучший ход; возвращает (оценка, (откуда, куда, превращение)) или (оценка, None)"""
+        lines = self.search_root(game, depth, multipv=1)
+        if not lines:
+            return self._terminal_score(game, 0), None
+        return lines[0]['score'], lines[0]['pv'][0]
+
+    def search_root(self, game, depth, multipv=1, root_moves=None):
+        """Перебор корня с несколькими главными вариантами.
+
+        Возвращает до multipv строк {'score', 'move', 'pv'}, отсортированных по убыванию
+        оценки: move - упакованный первый ход, pv - ходы кортежами (откуда, куда, превращение).
+        Ход, не попадающий в лучшие multipv, ищется с окном по худшей из них и отсекается.
+        """
+        if root_moves is None:
+            root_moves = order_moves(game, self._generate(game, 0))
+
+        lines = []
+        for move in root_moves:
+            # Нижняя граница: оценка худшей из уже найденных строк
+            alpha = lines[-1]['score'] if len(lines) >= multipv else -MATE_SCORE - 1
+            child_pv = []
+            game._apply_packed_move(move)
+            try:
+                score = -self.negamax(game, depth - 1, -MATE_SCORE - 1, -alpha, 1, child_pv)
+            finally:
+                game._undo_last_move()
+
+            if len(lines) < multipv or score > alpha:
+                lines.append({'score': score, 'move': move, 'pv': [move] + child_pv})
+                lines.sort(key=lambda line: -line['score'])
+                del lines[multipv:]
+
+        for line in lines:
+            line['pv'] = [decode_move(move) for move in line['pv']]
+        return lines
+
+    def negamax(self, game, depth, alpha, beta, ply, pv=None):
+        """Оценка позиции перебором negamax с альфа-бета отсечением; pv заполняется главным вариантом"""
+        self.nodes += 1
+        self._check_limits()
+
+        moves = self._generate(game, ply)
+        if not moves:
+            return self._terminal_score(game, ply)
+        if depth <= 0:
+            return self.quiesce(game, alpha, beta, ply, moves)
+
+        child_pv = [] if pv is not None else None
+        for move in order_moves(game, moves):
+            game._apply_packed_move(move)
+            try:
+                score = -self.negamax(game, depth - 1, -beta, -alpha, ply + 1, child_pv)
+            finally:
+                game._undo_last_move()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+                if pv is not None:
+                    pv[:] = [move] + child_pv
+            if child_pv:
+                child_pv.clear()
+        return alpha
+
+    def quiesce(self, game, alpha, beta, ply, moves=None):
+        """Поиск только по взятиям до спокойной позиции; проигрывающие по SEE взятия отсекаются"""
+        if moves is None:
+            self.nodes += 1
+            self._check_limits()
+            moves = self._generate(game, ply)
+            if not moves:
+                return self._terminal_score(game, ply)
+
+        stand_pat = evaluate(game)
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        captures = []
+        for move in moves:
+            victim = capture_value(game, move)
+            if not victim or stand_pat + victim + QUIESCENCE_MARGIN <= alpha:
+                continue
+            if move >> 14 == MOVE_PROMOTION and move >> 12 & 3 != 3:
+                continue
+            if capture_exchange_value(game, move) < 0:
+                continue
+            captures.append(move)
+
+        for move in order_moves(game, captures):
+            game._apply_packed_move(move)
+            try:
+                score = -self.quiesce(game, -beta, -alpha, ply + 1)
+            finally:
+                game._undo_last_move()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def _terminal_score(self, game, ply):
+        """Оценка позиции без ходов: мат (чем ближе, тем хуже) или пат"""
+        if game.is_in_check(game.current_player):
+            return -MATE_SCORE + ply
+        return 0
+
+
+class RandomPlayer:
+    """Игрок, выбирающий случайный легальный ход"""
+
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+
+    def choose_move(self, game):
+        moves = game.generate_moves(game.current_player)
+        return decode_move(self.rng.choice(moves)) if moves else None
+
+
+class GreedyCapturePlayer:
+    """Игрок, берущий самую ценную фигуру, а без взятий ходящий случайно"""
+
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+
+    def choose_move(self, game):
+        moves = game.generate_moves(game.current_player)
+        if not moves:
+            return None
+        best_value = max(capture_value(game, move) for move in moves)
+        best_moves = [move for move in moves if capture_value(game, move) == best_value]
+        return decode_move(self.rng.choice(best_moves))
+
+
+class SearchPlayer:
+    """Игрок, выбирающий ход перебором на фиксированную глубину"""
+
+    def __init__(self, depth=2, node_limit=None):
+        self.depth = depth
+        self.node_limit = node_limit
+
+    def choose_move(self, game):
+        searcher = Searcher(node_limit=self.node_limit)
+        try:
+            _, move = searcher.search(game, self.depth)
+        except SearchStopped:
+            move = None
+        if move is None:
+            moves = game.generate_moves(game.current_player)
+            move = decode_move(moves[0]) if moves else None
+        return move
+
+
+def create_player(spec, seed=None):
+    """Создать игрока по описанию: 'random', 'greedy' или 'search[:глубина]'"""
+    name, _, arg = spec.partition(':')
+    if name == 'random':
+        return RandomPlayer(seed)
+    if name == 'greedy':
+        return GreedyCapturePlayer(seed)
+    if name == 'search':
+        return SearchPlayer(int(arg) if arg else 2)
+    raise ValueError(f"Неизвестный игрок: {spec}")
@@ -0,0 +1,241 @@
+"""Игра движка под часами: распределение времени, мягкий и жесткий лимиты, обдумывание на времени соперника.
+
+    clock = ChessClock(300, 2)
+    bot = ClockedEngine()
+    move = bot.choose_move(game, clock.time_left('white'), clock.increment)
+    ...                          # ход сделан, часы переключены
+    bot.start_pondering(game)    # пока думает соперник
+
+Мягкий лимит: после него новая итерация углубления не начинается, как и итерация,
+которая по оценке не успеет завершиться до жесткого лимита. По жесткому лимиту поиск
+прерывается. Жесткий лимит не превышает половины оставшегося времени за вычетом запаса
+MOVE_OVERHEAD, поэтому при игре с прибавкой бот не просрочит; без прибавки запас тратится
+только на накладные расходы ходов, сделанных без перебора.
+"""
+import threading
+import time
+
+from analysis import analyse, copy_game
+from chess import decode_move
+from engine import order_moves
+
+# На сколько ходов вперед делится оставшееся время
+MOVES_TO_GO = 30
+
+# Запас на вывод хода и задержки между ходом и переключением часов (с)
+MOVE_OVERHEAD = 0.1
+
+# При меньшем жестком лимите поиск не запускается: ход по упорядочиванию без перебора
+MIN_SEARCH_TIME = 0.02
+
+# Во сколько раз жесткий лимит больше мягкого и какую долю оставшегося времени он не превышает
+HARD_LIMIT_FACTOR = 4
+HARD_LIMIT_SHARE = 0.5
+
+# Оценка роста времени итерации с глубиной, пока нет двух замеров, и ее границы
+DEFAULT_BRANCHING = 4.0
+MIN_BRANCHING = 2.0
+MAX_BRANCHING = 8.0
+
+
+def allocate_time(remaining, increment=0.0, moves_to_go=MOVES_TO_GO):
+    """Бюджет на ход в секундах: (мягкий лимит, жесткий лимит)"""
+    usable = max(0.0, remaining - MOVE_OVERHEAD)
+    hard = min((usable / moves_to_go + increment) * HARD_LIMIT_FACTOR, usable * HARD_LIMIT_SHARE)
+    soft = min(usable / moves_to_go + increment * 0.75, hard)
+    return soft, hard
+
+
+def estimate_next_iteration(iteration_time, previous_time):
+    """Ожидаемое время следующей итерации по двум последним"""
+    branching = DEFAULT_BRANCHING
+    if previous_time > 0:
+        branching = min(MAX_BRANCHING, max(MIN_BRANCHING, iteration_time / previous_time))
+    return iteration_time * branching
+
+
+def should_continue(elapsed, iteration_time, previous_time, soft, hard):
+    """Начинать ли следующую итерацию: до мягкого лимита и только если она успеет до жесткого"""
+    if elapsed >= soft:
+        return False
+    return elapsed + estimate_next_iteration(iteration_time, previous_time) <= hard
+
+
+class ChessClock:
+    """Шахматные часы: основное время и добавка за каждый сделанный ход (в секундах)"""
+
+    def __init__(self, base, increment=0.0):
+        self.remaining = {'white': float(base), 'black': float(base)}
+        self.increment = increment
+        self.running = None
+        self._started = None
+
+    def start(self, color):
+        """Запустить часы стороны color"""
+        self.running = color
+        self._started = time.perf_counter()
+
+    def time_left(self, color):
+        """Оставшееся время с учетом идущего хода"""
+        remaining = self.remaining[color]
+        if self.running == color:
+            remaining -= time.perf_counter() - self._started
+        return remaining
+
+    def flagged(self, color):
+        """Время стороны истекло"""
+        return self.time_left(color) <= 0
+
+    def press(self):
+        """Ход сделан: списать затраченное время, добавить прибавку и остановить часы"""
+        color = self.running
+        if color is None:
+            return
+        self.remaining[color] = self.time_left(color)
+        if self.remaining[color] > 0:
+            self.remaining[color] += self.increment
+        self.running = None
+
+    def format(self, color):
+        """Время в виде М:СС"""
+        seconds = max(0, int(self.time_left(color)))
+        return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+class ClockedEngine:
+    """Движок для игры под часами с обдумыванием на времени соперника.
+
+    После своего хода движок продолжает считать позицию после предсказанного ответа
+    (второй ход главного варианта). Если соперник сыграл этот ход, начатый поиск
+    продолжается уже под своими лимитами и все пройденные глубины засчитываются.
+    """
+
+    def __init__(self, max_depth=None, ponder=True):
+        self.max_depth = max_depth
+        self.ponder = ponder
+        self.last_info = None
+        self.last_ponderhit = False
+
+        self._lock = threading.Lock()
+        self._ponder_thread = None
+        self._ponder_stop = None
+        self._ponder_position = None
+        self._ponder_info = None
+        self._ponder_progress = None
+        self._ponder_budget = None
+
+    def choose_move(self, game, remaining, increment=0.0):
+        """Ход (откуда, куда, превращение) за отведенное часами время или None, если ходов нет"""
+        start = time.perf_counter()
+        soft, hard = allocate_time(remaining, increment)
+        self.last_ponderhit = False
+
+        moves = game.generate_moves(game.current_player)
+        if len(moves) <= 1:
+            # Единственный ход думать не требует
+            self.stop_pondering()
+            self.last_info = None
+            return decode_move(moves[0]) if moves else None
+
+        info = self._ponder_hit(game, start, soft, hard)
+        if info is not None:
+            self.last_ponderhit = True
+        elif hard >= MIN_SEARCH_TIME:
+            info = self._think(game, start, soft, hard)
+        self.last_info = info
+
+        if info is None:
+            # Времени нет или не успели закончить даже первую итерацию
+            return decode_move(order_moves(game, moves)[0])
+        return info['lines'][0]['pv'][0]
+
+    def _think(self, game, start, soft, hard):
+        """Итеративное углубление с мягким и жестким лимитами; последняя завершенная глубина"""
+        best = None
+        previous_time = 0.0
+        iterations = analyse(game, multipv=1, max_depth=self.max_depth,
+                             movetime=max(0.0, hard - (time.perf_counter() - start)))
+        try:
+            for info in iterations:
+                iteration_time = info['time'] - (best['time'] if best else 0.0)
+                best = info
+                if not should_continue(time.perf_counter() - start, iteration_time, previous_time, soft, hard):
+                    break
+                previous_time = iteration_time
+        finally:
+            iterations.close()
+        return best
+
+    def start_pondering(self, game):
+        """Начать обдумывание ответа на предсказанный ход соперника (вызывается после своего хода)"""
+        self.stop_pondering()
+        if not self.ponder or self.last_info is None:
+            return
+        pv = self.last_info['lines'][0]['pv']
+        if len(pv) < 2:
+            return
+
+        work = copy_game(game)
+        predicted = pv[1]
+        work._apply_move(predicted[0], predicted[1], predicted[2] or 'Q')
+        self._ponder_position = work.get_position()
+        self._ponder_stop = threading.Event()
+        self._ponder_info = None
+        self._ponder_progress = None
+        self._ponder_budget = None
+        self._ponder_thread = threading.Thread(target=self._ponder, args=(work, self._ponder_stop), daemon=True)
+        self._ponder_thread.start()
+
+    def stop_pondering(self):
+        """Прервать обдумывание"""
+        if self._ponder_thread is not None:
+            self._ponder_stop.set()
+            self._ponder_thread.join()
+            self._ponder_thread = None
+
+    def _ponder(self, work, stop_event):
+        """Фоновый поиск; после совпадения хода соперника подчиняется лимитам из _ponder_budget"""
+        previous_time = 0.0
+        last_time = 0.0
+        for info in analyse(work, multipv=1, max_depth=self.max_depth, stop_event=stop_event):
+            iteration_time = info['time'] - last_time
+            last_time = info['time']
+            with self._lock:
+                self._ponder_info = info
+                self._ponder_progress = (time.perf_counter(), iteration_time, previous_time)
+                budget = self._ponder_budget
+            if budget is not None:
+                start, soft, hard = budget
+                if not should_continue(time.perf_counter() - start, iteration_time, previous_time, soft, hard):
+                    return
+            previous_time = iteration_time
+
+    def _ponder_hit(self, game, start, soft, hard):
+        """Результат обдумывания, если соперник сыграл предсказанный ход, иначе None"""
+        if self._ponder_thread is None:
+            return None
+        if game.get_position() != self._ponder_position:
+            self.stop_pondering()
+            return None
+
+        with self._lock:
+            self._ponder_budget = (start, soft, hard)
+            progress = self._ponder_progress
+
+        # Идущая итерация не успеет до жесткого лимита - ходим с последней завершенной глубиной
+        if progress is not None:
+            finished_at, iteration_time, previous_time = progress
+            if finished_at + estimate_next_iteration(iteration_time, previous_time) > start + hard:
+                self.stop_pondering()
+                return self._ponder_info
+
+        # Мягкий лимит проверяет сам поток обдумывания после каждой глубины, жесткий - таймер
+        timer = threading.Timer(max(0.0, hard - (time.perf_counter() - start)), self._ponder_stop.set)
+        timer.daemon = True
+        timer.start()
+        try:
+            self._ponder_thread.join()
+        finally:
+            timer.cancel()
+            self._ponder_thread = None
+        return self._ponder_info
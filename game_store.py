@@ -0,0 +1,210 @@
+"""Хранилище завершенных партий на SQLite с индексами по игрокам, результату и позициям.
+
+Подключение к игре:
+    game.game_store = GameStore('games.sqlite3')
+после чего каждая партия, сохраненная через save_game_to_file, попадает в базу
+(повторное сохранение в тот же файл обновляет запись, а не добавляет новую).
+Поиск по позиции и дебюту идет по индексу хэшей позиций и не переигрывает партии.
+
+Командная строка:
+    python game_store.py games.sqlite3 --player Иван --result 1-0
+    python game_store.py games.sqlite3 --opening "e4 e5 Nf3"
+"""
+import argparse
+import sqlite3
+import sys
+import time
+
+from chess import ChessGame
+
+# Сколько первых полуходов индексируется по хэшам позиций
+DEFAULT_INDEXED_PLIES = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    white TEXT,
+    black TEXT,
+    result TEXT NOT NULL,
+    plies INTEGER NOT NULL,
+    moves TEXT NOT NULL,
+    source TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_white ON games (white);
+CREATE INDEX IF NOT EXISTS games_black ON games (black);
+CREATE INDEX IF NOT EXISTS games_result ON games (result);
+CREATE INDEX IF NOT EXISTS games_plies ON games (plies);
+CREATE INDEX IF NOT EXISTS games_source ON games (source);
+
+CREATE TABLE IF NOT EXISTS positions (
+    hash INTEGER NOT NULL,
+    game_id INTEGER NOT NULL REFERENCES games (id) ON DELETE CASCADE,
+    ply INTEGER NOT NULL,
+    PRIMARY KEY (hash, game_id, ply)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS positions_game ON positions (game_id);
+"""
+
+
+class GameStore:
+    """Локальная база партий с быстрым поиском по позициям первых N полуходов"""
+
+    def __init__(self, path, indexed_plies=DEFAULT_INDEXED_PLIES):
+        self.path = path
+        self.indexed_plies = indexed_plies
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_game(self, game, white=None, black=None, result=None, source=None):
+        """Сохранить партию; позиции берутся из истории ходов без переигрывания.
+
+        Источник (файл партии) задает ее идентичность: партия с уже известным источником
+        заменяет прежнюю запись под тем же id, чтобы повторное сохранение не давало дублей.
+        """
+        history = game.move_history
+        positions = [state['position'] for state in history[:self.indexed_plies]]
+        if len(history) <= self.indexed_plies:
+            positions.append(game.get_position())
+        values = (
+            white if white is not None else game.white_player,
+            black if black is not None else game.black_player,
+            result or game.get_result(),
+            len(history),
+            ' '.join(game.get_move_notations()),
+            source,
+            time.time(),
+        )
+
+        with self.connection:
+            row = None
+            if source is not None:
+                row = self.connection.execute(
+                    "SELECT id FROM games WHERE source = ? ORDER BY id LIMIT 1", (source,)).fetchone()
+            if row is not None:
+                game_id = row['id']
+                self.connection.execute(
+                    "UPDATE games SET white = ?, black = ?, result = ?, plies = ?, moves = ?, "
+                    "source = ?, created_at = ? WHERE id = ?", values + (game_id,))
+                self.connection.execute("DELETE FROM positions WHERE game_id = ?", (game_id,))
+            else:
+                cursor = self.connection.execute(
+                    "INSERT INTO games (white, black, result, plies, moves, source, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", values)
+                game_id = cursor.lastrowid
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO positions (hash, game_id, ply) VALUES (?, ?, ?)",
+                [(position.stable_hash(), game_id, ply) for ply, position in enumerate(positions)],
+            )
+        return game_id
+
+    def get_game(self, game_id):
+        """Запись партии по id (moves - список ходов) или None"""
+        row = self.connection.execute("SELECT * FROM games WHERE id = ?", (game_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def find_games(self, player=None, white=None, black=None, result=None,
+                   min_plies=None, max_plies=None, limit=None):
+        """Поиск партий по игрокам, результату и длине"""
+        conditions = []
+        params = []
+        if player is not None:
+            conditions.append("(white = ? OR black = ?)")
+            params += [player, player]
+        for column, value in (('white', white), ('black', black), ('result', result)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if min_plies is not None:
+            conditions.append("plies >= ?")
+            params.append(min_plies)
+        if max_plies is not None:
+            conditions.append("plies <= ?")
+            params.append(max_plies)
+
+        query = "SELECT * FROM games"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY id"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        return [self._row_to_dict(row) for row in self.connection.execute(query, params)]
+
+    def find_by_position(self, position, limit=None):
+        """Партии, в которых позиция встретилась среди первых indexed_plies полуходов"""
+        query = (
+            "SELECT games.*, MIN(positions.ply) AS ply FROM positions "
+            "JOIN games ON games.id = positions.game_id "
+            "WHERE positions.hash = ? GROUP BY games.id ORDER BY games.id"
+        )
+        params = [position.stable_hash()]
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        return [self._row_to_dict(row) for row in self.connection.execute(query, params)]
+
+    def find_by_opening(self, moves, limit=None):
+        """Партии, пришедшие в позицию после дебютных ходов (с учетом перестановок)"""
+        if isinstance(moves, str):
+            moves = moves.split()
+        game = ChessGame()
+        for notation in moves:
+            parsed = game.parse_move_notation(notation, game.current_player)
+            if parsed is None:
+                raise ValueError(f"Неверный ход: {notation}")
+            from_pos, to_pos, promotion = parsed
+            game._apply_move(from_pos, to_pos, promotion or 'Q')
+        return self.find_by_position(game.get_position(), limit)
+
+    def count(self):
+        """Число партий в базе"""
+        return self.connection.execute("SELECT COUNT(*) FROM games").fetchone()[0]
+
+    @staticmethod
+    def _row_to_dict(row):
+        record = dict(row)
+        record['moves'] = record['moves'].split() if record['moves'] else []
+        return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Поиск партий в хранилище")
+    parser.add_argument('database', help="файл базы SQLite")
+    parser.add_argument('--player')
+    parser.add_argument('--result', choices=['1-0', '0-1', '1/2-1/2', '*'])
+    parser.add_argument('--min-plies', type=int)
+    parser.add_argument('--max-plies', type=int)
+    parser.add_argument('--opening', help="дебютные ходы, например \"e4 e5 Nf3\"")
+    parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args(argv)
+
+    with GameStore(args.database) as store:
+        if args.opening:
+            games = store.find_by_opening(args.opening, args.limit)
+        else:
+            games = store.find_games(player=args.player, result=args.result, min_plies=args.min_plies,
+                                     max_plies=args.max_plies, limit=args.limit)
+        for record in games:
+            if args.player and record['white'] != args.player and record['black'] != args.player:
+                continue
+            if args.result and record['result'] != args.result:
+                continue
+            print(f"#{record['id']} {record['white'] or '?'} - {record['black'] or '?'} "
+                  f"{record['result']} ({record['plies']} полуходов) {record['source'] or ''}")
+        print(f"Всего партий в базе: {store.count()}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
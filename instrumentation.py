@@ -0,0 +1,263 @@
+"""Инструментирование ChessGame: счётчики вызовов и гистограммы времени.
+
+Слой подключается к конкретной партии через Instrumentation.attach(game) и
+оборачивает горячие методы. Пока он не подключён, ChessGame работает со своими
+исходными методами, поэтому выключенное инструментирование ничего не стоит.
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+from chess import ChessGame
+
+# Методы, за которыми ведётся наблюдение, и их группы в отчёте
+INSTRUMENTED_METHODS = {
+    'is_valid_move': 'validation',
+    'is_square_attacked': 'attack',
+    'would_be_in_check': 'attack',
+    '_generate_legal_moves_by_origin': 'movegen',
+    'is_checkmate': 'game_end',
+    'is_stalemate': 'game_end',
+    'make_move': 'make_undo',
+    'undo_move': 'make_undo',
+    '_apply_move': 'make_undo',
+    '_undo_last_move': 'make_undo',
+    'save_game_to_file': 'io',
+    'load_game_from_file': 'io',
+    'parse_move_notation': 'parsing',
+}
+
+# Верхние границы корзин гистограммы (секунды)
+HISTOGRAM_BUCKETS = (
+    1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 1e-2, 5e-2, 0.1, 0.5, 1.0, 5.0,
+)
+
+# Сценарные партии для режима --profile
+SCRIPTED_GAMES = {
+    'fools_mate': "1. f3 e5 2. g4 Qh4#",
+    'scholars_mate': "1. e4 e5 2. Bc4 Nc6 3. Qh5 Nf6 4. Qxf7#",
+    'opera_game': (
+        "1. e4 e5 2. Nf3 d6 3. d4 Bg4 4. dxe5 Bxf3 5. Qxf3 dxe5 6. Bc4 Nf6 "
+        "7. Qb3 Qe7 8. Nc3 c6 9. Bg5 b5 10. Nxb5 cxb5 11. Bxb5+ Nbd7 "
+        "12. O-O-O Rd8 13. Rxd7 Rxd7 14. Rd1 Qe6 15. Bxd7+ Nxd7 "
+        "16. Qb8+ Nxb8 17. Rd8#"
+    ),
+}
+
+
+class Histogram:
+    """Гистограмма длительностей с фиксированными корзинами"""
+
+    __slots__ = ('counts', 'total', 'count', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        """Учесть одно измерение"""
+        index = 0
+        for bound in HISTOGRAM_BUCKETS:
+            if seconds <= bound:
+                break
+            index += 1
+        self.counts[index] += 1
+        self.total += seconds
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def to_dict(self):
+        """Представление для снимка"""
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip(HISTOGRAM_BUCKETS + (float('inf'),), self.counts):
+            cumulative += count
+            buckets['+Inf' if bound == float('inf') else repr(bound)] = cumulative
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'max': self.max,
+            'mean': self.total / self.count if self.count else 0.0,
+            'buckets': buckets,
+        }
+
+
+def _deep_sizeof(obj, seen=None):
+    """Приблизительный размер объекта в байтах вместе с вложенными объектами"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += _deep_sizeof(key, seen) + _deep_sizeof(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += _deep_sizeof(item, seen)
+    return size
+
+
+class Instrumentation:
+    """Счётчики и гистограммы времени для горячих методов ChessGame"""
+
+    def __init__(self, methods=None):
+        self.methods = dict(INSTRUMENTED_METHODS if methods is None else methods)
+        self.histograms = {name: Histogram() for name in self.methods}
+        self._games = []
+
+    def attach(self, game):
+        """Подключить инструментирование к партии"""
+        for name in self.methods:
+            original = getattr(game, name)
+            setattr(game, name, self._wrap(name, original))
+        self._games.append(game)
+        return game
+
+    def detach(self, game):
+        """Отключить инструментирование и вернуть исходные методы"""
+        for name in self.methods:
+            game.__dict__.pop(name, None)
+        if game in self._games:
+            self._games.remove(game)
+
+    def _wrap(self, name, original):
+        histogram = self.histograms[name]
+        perf_counter = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                histogram.observe(perf_counter() - start)
+
+        wrapper.__name__ = name
+        wrapper.__doc__ = original.__doc__
+        return wrapper
+
+    def reset(self):
+        """Обнулить все счётчики"""
+        self.histograms = {name: Histogram() for name in self.methods}
+        for game in list(self._games):
+            self.detach(game)
+            self.attach(game)
+
+    def snapshot(self):
+        """Снимок метрик: вызовы, время и размер истории подключённых партий"""
+        operations = {}
+        for name, histogram in self.histograms.items():
+            data = histogram.to_dict()
+            data['group'] = self.methods[name]
+            operations[name] = data
+        return {
+            'operations': operations,
+            'history_plies': sum(len(game.move_history) for game in self._games),
+            'history_bytes': sum(_deep_sizeof(game.move_history) for game in self._games),
+        }
+
+    def export_json(self, indent=2):
+        """Экспорт снимка в JSON"""
+        return json.dumps(self.snapshot(), indent=indent, ensure_ascii=False)
+
+    def export_prometheus(self, prefix='chess'):
+        """Экспорт снимка в текстовом формате Prometheus"""
+        snapshot = self.snapshot()
+        lines = [
+            f"# HELP {prefix}_calls_total Number of calls per ChessGame operation.",
+            f"# TYPE {prefix}_calls_total counter",
+        ]
+        for name, data in snapshot['operations'].items():
+            lines.append(f'{prefix}_calls_total{{op="{name}",group="{data["group"]}"}} {data["count"]}')
+
+        lines.append(f"# HELP {prefix}_duration_seconds Inclusive duration of ChessGame operations.")
+        lines.append(f"# TYPE {prefix}_duration_seconds histogram")
+        for name, data in snapshot['operations'].items():
+            for bound, count in data['buckets'].items():
+                lines.append(f'{prefix}_duration_seconds_bucket{{op="{name}",le="{bound}"}} {count}')
+            lines.append(f'{prefix}_duration_seconds_sum{{op="{name}"}} {data["sum"]:.9f}')
+            lines.append(f'{prefix}_duration_seconds_count{{op="{name}"}} {data["count"]}')
+
+        lines.append(f"# HELP {prefix}_history_plies Plies stored in move_history.")
+        lines.append(f"# TYPE {prefix}_history_plies gauge")
+        lines.append(f"{prefix}_history_plies {snapshot['history_plies']}")
+        lines.append(f"# HELP {prefix}_history_bytes Approximate memory held by move_history.")
+        lines.append(f"# TYPE {prefix}_history_bytes gauge")
+        lines.append(f"{prefix}_history_bytes {snapshot['history_bytes']}")
+        return "\n".join(lines) + "\n"
+
+    def format_report(self):
+        """Текстовый отчёт: вызовы, время и число вызовов на один ход"""
+        snapshot = self.snapshot()
+        operations = snapshot['operations']
+        moves = operations.get('make_move', {}).get('count', 0)
+
+        lines = [
+            f"{'Операция':<32}{'Группа':<11}{'Вызовов':>10}{'На ход':>9}"
+            f"{'Всего, мс':>12}{'Сред., мкс':>12}{'Макс., мс':>11}",
+            "-" * 97,
+        ]
+        for name, data in sorted(operations.items(), key=lambda item: -item[1]['sum']):
+            per_move = f"{data['count'] / moves:.1f}" if moves else '-'
+            lines.append(
+                f"{name:<32}{data['group']:<11}{data['count']:>10}{per_move:>9}"
+                f"{data['sum'] * 1e3:>12.2f}{data['mean'] * 1e6:>12.1f}{data['max'] * 1e3:>11.2f}"
+            )
+        lines.append("-" * 97)
+        lines.append(f"Время включает вложенные вызовы. Ходов сделано: {moves}")
+        lines.append(
+            f"История: {snapshot['history_plies']} полуходов, "
+            f"~{snapshot['history_bytes'] / 1024:.1f} КБ"
+        )
+        return "\n".join(lines)
+
+
+def play_scripted_game(game, notation):
+    """Проиграть партию из нотации: загрузка, просмотр вперёд и назад, подсказки, сохранение"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = os.path.join(tmp_dir, 'source.txt')
+        with open(source, 'w', encoding='utf-8') as f:
+            f.write(notation + "\n")
+
+        game.load_game_from_file(source)
+        while game.replay_next():
+            game.get_threatened_pieces(game.current_player)
+        while game.replay_prev():
+            pass
+        while game.replay_next():
+            pass
+
+        game.exit_replay_mode()
+        game.save_game_to_file(os.path.join(tmp_dir, 'saved.txt'))
+
+
+def run_profile(output_format='text'):
+    """Режим --profile: сыграть сценарные партии и вывести распределение времени"""
+    instrumentation = Instrumentation()
+    game = instrumentation.attach(ChessGame())
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for notation in SCRIPTED_GAMES.values():
+            play_scripted_game(game, notation)
+    elapsed = time.perf_counter() - start
+
+    if output_format == 'json':
+        print(instrumentation.export_json())
+    elif output_format == 'prometheus':
+        print(instrumentation.export_prometheus(), end="")
+    else:
+        print("=" * 50)
+        print("ПРОФИЛИРОВАНИЕ СЦЕНАРНЫХ ПАРТИЙ")
+        print("=" * 50)
+        print(f"Партий: {len(SCRIPTED_GAMES)}, общее время: {elapsed:.2f} с\n")
+        print(instrumentation.format_report())
+    return instrumentation
@@ -0,0 +1,225 @@
+"""Решатель задач на мат в N ходов: поиск по числам доказательства (df-pn).
+
+Атакующая сторона (та, что ходит) перебирает только шахующие ходы, защищающаяся - все
+легальные; с checks_only=False атакующий перебирает и тихие ходы (кроме последнего хода,
+который может быть только шахом). Узел дерева - (позиция, оставшиеся полуходы), поэтому
+циклов нет и доказанный результат точен для своей глубины. Числа доказательства
+и опровержения хранятся в ограниченной таблице в памяти; поиск прерывается по лимиту узлов.
+
+    solver = MateSolver(node_limit=500000)
+    result = solver.solve(game, max_moves=5)
+    if result:
+        print(result['mate'], result['pv_notation'])
+
+Командная строка:
+    python mate_solver.py "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1" --moves 2
+"""
+import argparse
+import sys
+import time
+
+from analysis import copy_game, format_pv
+from chess import ChessGame, decode_move
+from engine import SearchStopped, opponent
+
+# «Бесконечность» для чисел доказательства: узел доказан или опровергнут
+INFINITY = 10 ** 9
+
+# Размер таблицы доказательств (записей) и лимит узлов по умолчанию
+DEFAULT_TABLE_SIZE = 1000000
+DEFAULT_NODE_LIMIT = 2000000
+
+
+class MateSolver:
+    """Поиск форсированного мата методом df-pn с ограниченной таблицей доказательств.
+
+    В таблице для ключа (позиция, оставшиеся полуходы) хранятся (pn, dn) с точки зрения
+    атакующего: pn = 0 - мат доказан, dn = 0 - мата в эти полуходы нет.
+    """
+
+    def __init__(self, node_limit=DEFAULT_NODE_LIMIT, table_size=DEFAULT_TABLE_SIZE, checks_only=True):
+        self.node_limit = node_limit
+        self.checks_only = checks_only
+        self.table_size = table_size
+        self.table = {}
+        self.nodes = 0
+        self._buffers = []
+
+    def solve(self, game, max_moves):
+        """Кратчайший форсированный мат не длиннее max_moves ходов за сторону, которая ходит.
+
+        Возвращает {'mate', 'pv', 'pv_notation', 'nodes', 'time'} или None, если мата нет
+        или не хватило лимита узлов.
+        """
+        work = copy_game(game)
+        self.attacker = work.current_player
+        self.nodes = 0
+        start = time.perf_counter()
+        try:
+            for moves in range(1, max_moves + 1):
+                if self._solved(work, 2 * moves - 1):
+                    pv = self._principal_variation(work, 2 * moves - 1)
+                    return {
+                        'mate': moves,
+                        'pv': [decode_move(move) for move in pv],
+                        'pv_notation': format_pv(game, [decode_move(move) for move in pv]),
+                        'nodes': self.nodes,
+                        'time': time.perf_counter() - start,
+                    }
+        except SearchStopped:
+            pass
+        return None
+
+    def _generate(self, game, remaining):
+        """Ходы узла: шахи (или все ходы) для атакующего, все легальные ходы для защищающегося"""
+        while len(self._buffers) <= remaining:
+            self._buffers.append(None)
+        moves = game.generate_moves(game.current_player, self._buffers[remaining])
+        self._buffers[remaining] = moves
+        if game.current_player != self.attacker or (not self.checks_only and remaining > 1):
+            return list(moves)
+        defender = opponent(self.attacker)
+        checks = []
+        for move in moves:
+            game._apply_packed_move(move)
+            if game.is_in_check(defender):
+                checks.append(move)
+            game._undo_last_move()
+        return checks
+
+    def _leaf(self, game, remaining):
+        """Начальные (pn, dn) нераскрытого узла; у защищающегося pn - число его ответов"""
+        if game.current_player == self.attacker:
+            return 1, 1
+        replies = len(game.generate_moves(game.current_player))
+        if not replies:
+            # Мат - доказано, пат - опровергнуто
+            return (0, INFINITY) if game.is_in_check(game.current_player) else (INFINITY, 0)
+        if remaining == 0:
+            return INFINITY, 0
+        return replies, 1
+
+    def _store(self, key, value):
+        if len(self.table) >= self.table_size:
+            # Переполнение: оставляем только решенные узлы, а если их слишком много - очищаем
+            self.table = {k: v for k, v in self.table.items() if not v[0] or not v[1]}
+            if len(self.table) >= self.table_size // 2:
+                self.table = {}
+        self.table[key] = value
+
+    def _solved(self, game, remaining):
+        """Доказан ли мат из текущей позиции за remaining полуходов"""
+        key = (game.get_position(), remaining)
+        value = self.table.get(key)
+        if value is None:
+            value = self._leaf(game, remaining)
+        if value[0] and value[1]:
+            value = self._mid(game, key, remaining, INFINITY, INFINITY)
+        return value[0] == 0
+
+    def _mid(self, game, key, remaining, threshold_pn, threshold_dn):
+        """Раскрытие узла до превышения одного из порогов; возвращает (pn, dn)"""
+        self.nodes += 1
+        if self.node_limit is not None and self.nodes > self.node_limit:
+            raise SearchStopped()
+
+        attacking = game.current_player == self.attacker
+        moves = self._generate(game, remaining)
+        if not moves:
+            value = self._leaf(game, remaining) if not attacking else (INFINITY, 0)
+            self._store(key, value)
+            return value
+
+        # Дети: [ход, ключ, pn, dn]; значения держим локально, чтобы не зависеть от вытеснения
+        children = []
+        for move in moves:
+            game._apply_packed_move(move)
+            child_key = (game.get_position(), remaining - 1)
+            value = self.table.get(child_key) or self._leaf(game, remaining - 1)
+            game._undo_last_move()
+            children.append([move, child_key, value[0], value[1]])
+
+        while True:
+            if attacking:
+                pn = min(child[2] for child in children)
+                dn = min(INFINITY, sum(child[3] for child in children))
+            else:
+                pn = min(INFINITY, sum(child[2] for child in children))
+                dn = min(child[3] for child in children)
+            if pn >= threshold_pn or dn >= threshold_dn:
+                break
+
+            # Атакующий раскрывает самый доказуемый ход, защищающийся - самый опровержимый
+            index = 2 if attacking else 3
+            children.sort(key=lambda child: child[index])
+            best = children[0]
+            second = children[1][index] if len(children) > 1 else INFINITY
+            if attacking:
+                child_pn = min(threshold_pn, second + 1)
+                child_dn = threshold_dn - dn + best[3]
+            else:
+                child_pn = threshold_pn - pn + best[2]
+                child_dn = min(threshold_dn, second + 1)
+
+            game._apply_packed_move(best[0])
+            try:
+                best[2], best[3] = self._mid(game, best[1], remaining - 1, child_pn, child_dn)
+            finally:
+                game._undo_last_move()
+
+        self._store(key, (pn, dn))
+        return pn, dn
+
+    def _mate_length(self, game, remaining, attacking):
+        """Наименьшее число полуходов (той же четности), за которое доказан мат"""
+        for plies in range(0 if not attacking else 1, remaining + 1, 2):
+            if self._solved(game, plies):
+                return plies
+        return None
+
+    def _principal_variation(self, game, remaining):
+        """Матовый вариант: атакующий выбирает кратчайший мат, защищающийся - самую долгую защиту"""
+        pv = []
+        while remaining > 0:
+            attacking = game.current_player == self.attacker
+            best = None
+            for move in self._generate(game, remaining):
+                game._apply_packed_move(move)
+                try:
+                    length = self._mate_length(game, remaining - 1, not attacking)
+                finally:
+                    game._undo_last_move()
+                if length is None:
+                    continue
+                if best is None or (length < best[0] if attacking else length > best[0]):
+                    best = (length, move)
+            if best is None:
+                break
+            remaining, move = best
+            game._apply_packed_move(move)
+            pv.append(move)
+        for _ in pv:
+            game._undo_last_move()
+        return pv
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Поиск форсированного мата (df-pn)")
+    parser.add_argument('fen', help="позиция в FEN; мат ищется за сторону, которая ходит")
+    parser.add_argument('--moves', type=int, default=3, help="мат не более чем в столько ходов")
+    parser.add_argument('--nodes', type=int, default=DEFAULT_NODE_LIMIT, help="лимит узлов")
+    parser.add_argument('--quiet-moves', action='store_true', help="атакующий может делать и тихие ходы")
+    args = parser.parse_args(argv)
+
+    game = ChessGame()
+    game.load_fen(args.fen)
+    result = MateSolver(node_limit=args.nodes, checks_only=not args.quiet_moves).solve(game, args.moves)
+    if result is None:
+        print(f"Мат не более чем в {args.moves} ход(ов) не найден")
+        return
+    print(f"Мат в {result['mate']}: {' '.join(result['pv_notation'])}")
+    print(f"Узлов: {result['nodes']}, время: {result['time']:.2f} с")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,198 @@
+"""Журнал ходов партии: только дописывание, сброс на диск пачками, восстановление после сбоя.
+
+Файл начинается с заголовка - компактной записи партии (ChessGame.serialize(moves=True)).
+Дальше каждый ход, откат и повтор - запись фиксированного размера (4 байта), поэтому
+стоимость записи не зависит от длины партии. Запись уходит в ОС сразу (падение процесса
+ее не теряет); fsync выполняется раз в SYNC_EVERY записей, на первой записи спустя
+SYNC_INTERVAL секунд после предыдущего fsync и при закрытии журнала.
+
+    log = MoveLog.start(game, 'games/42.log')    # новая партия, ходы пишутся в журнал
+    game = MoveLog.recover('games/42.log')       # после перезапуска: партия и журнал
+
+Командная строка:
+    python move_log.py games/42.log
+"""
+import argparse
+import os
+import struct
+import sys
+import time
+import zlib
+
+from chess import ChessGame, encode_move
+
+MAGIC = b'CHLG'
+LOG_VERSION = 1
+
+# Заголовок: сигнатура, версия, длина записи партии; за записью - ее CRC32
+HEADER = struct.Struct('<4sBH')
+CRC = struct.Struct('<I')
+
+# Запись: тип, значение (упакованный ход или число шагов), контрольный байт
+RECORD = struct.Struct('<BHB')
+RECORD_MOVE = ord('M')
+RECORD_UNDO = ord('U')
+RECORD_REDO = ord('R')
+# Сброс позиции (set_position, загрузка партии): значение - длина записи партии, за ней данные и CRC32
+RECORD_RESET = ord('S')
+
+SYNC_EVERY = 32
+SYNC_INTERVAL = 1.0
+
+
+def _check_byte(kind, value):
+    return (kind + value + (value >> 8) + 0x5A) & 0xFF
+
+
+class MoveLog:
+    """Журнал одной партии; подключается к ChessGame через атрибут move_log"""
+
+    def __init__(self, path, sync_every=SYNC_EVERY, sync_interval=SYNC_INTERVAL):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    @classmethod
+    def start(cls, game, path, **kwargs):
+        """Начать новый журнал для партии (файл перезаписывается) и подключить его"""
+        data = game.serialize(moves=True)
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, LOG_VERSION, len(data)) + data + CRC.pack(zlib.crc32(data)))
+            f.flush()
+            os.fsync(f.fileno())
+        log = cls(path, **kwargs)
+        game.move_log = log
+        return log
+
+    @classmethod
+    def recover(cls, path, attach=True, **kwargs):
+        """Восстановить партию из журнала.
+
+        Недописанная последняя запись (сбой во время записи) отбрасывается и обрезается.
+        При attach журнал подключается к партии для дальнейших ходов.
+        """
+        game, valid_length = cls.replay(path)
+        if attach:
+            if valid_length != os.path.getsize(path):
+                os.truncate(path, valid_length)
+            game.move_log = cls(path, **kwargs)
+        return game
+
+    @staticmethod
+    def _read_game(content, offset, length):
+        """Партия из записи длины length с CRC32 за ней: (партия или None, если запись
+        недописана или повреждена; смещение за записью)"""
+        end = offset + length + CRC.size
+        if end > len(content):
+            return None, offset
+        data = content[offset:offset + length]
+        if CRC.unpack_from(content, offset + length)[0] != zlib.crc32(data):
+            return None, offset
+        return ChessGame.deserialize(data), end
+
+    @classmethod
+    def replay(cls, path):
+        """Проиграть журнал без вывода: (партия, длина корректной части файла)"""
+        with open(path, 'rb') as f:
+            content = f.read()
+        if len(content) < HEADER.size:
+            raise ValueError(f"Журнал поврежден: {path}")
+        magic, version, length = HEADER.unpack_from(content)
+        if magic != MAGIC or version != LOG_VERSION:
+            raise ValueError(f"Не журнал ходов: {path}")
+        game, offset = cls._read_game(content, HEADER.size, length)
+        if game is None:
+            raise ValueError(f"Журнал поврежден: {path}")
+
+        while offset + RECORD.size <= len(content):
+            kind, value, check = RECORD.unpack_from(content, offset)
+            if check != _check_byte(kind, value):
+                break
+            end = offset + RECORD.size
+            if kind == RECORD_MOVE:
+                game._apply_packed_move(value)
+                game.redo_stack = []
+            elif kind == RECORD_UNDO:
+                for _ in range(min(value, len(game.move_history))):
+                    game.redo_stack.append(game._undo_last_move())
+            elif kind == RECORD_REDO:
+                for _ in range(min(value, len(game.redo_stack))):
+                    state = game.redo_stack.pop()
+                    game._apply_move(state['from_pos'], state['to_pos'], state.get('promotion', 'Q'), state)
+            elif kind == RECORD_RESET:
+                reset, end = cls._read_game(content, end, value)
+                if reset is None:
+                    break
+                game = reset
+            else:
+                break
+            offset = end
+
+        color = game.current_player
+        game.game_over = game.is_checkmate(color) or game.is_stalemate(color)
+        return game, offset
+
+    def _write(self, data):
+        os.write(self._fd, data)
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+
+    def _record(self, kind, value):
+        self._write(RECORD.pack(kind, value, _check_byte(kind, value)))
+
+    def record_move(self, state):
+        """Ход из записи истории (после make_move)"""
+        self._record(RECORD_MOVE, encode_move(state['from_pos'], state['to_pos'], state.get('promotion')))
+
+    def record_undo(self, steps):
+        self._record(RECORD_UNDO, steps)
+
+    def record_redo(self, steps):
+        self._record(RECORD_REDO, steps)
+
+    def record_reset(self, game):
+        """Новая позиция партии (история сброшена)"""
+        data = game.serialize(moves=True)
+        self._write(RECORD.pack(RECORD_RESET, len(data), _check_byte(RECORD_RESET, len(data)))
+                    + data + CRC.pack(zlib.crc32(data)))
+
+    def sync(self):
+        """Сбросить записанное на диск"""
+        if self._unsynced:
+            os.fsync(self._fd)
+            self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if self._fd is not None:
+            self.sync()
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Восстановление партии из журнала ходов")
+    parser.add_argument('log', help="файл журнала")
+    parser.add_argument('--save', metavar='FILE', help="сохранить восстановленную партию")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    game = MoveLog.recover(args.log, attach=False)
+    print(f"Восстановлено полуходов: {len(game.move_history)} за {time.perf_counter() - start:.3f} с")
+    print(f"FEN: {game.get_fen()}")
+    if args.save:
+        game.save_game_to_file(args.save)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
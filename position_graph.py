@@ -0,0 +1,340 @@
+"""Граф позиций по коллекции партий: дебютное дерево с учетом перестановок ходов.
+
+Узлы - позиции (Position.stable_hash()), ребра - ходы с частотой и результатами.
+Партии проигрываются без вывода и сливаются в граф за один проход; граф хранится
+в SQLite и дополняется новыми партиями без перестроения (партия хранилища, сохраненная
+заново, заменяет в графе свою прежнюю версию):
+
+    with PositionGraph('openings.sqlite3') as graph:
+        graph.add_file('game.txt')
+        for edge in graph.children(Position.initial()):
+            print(edge['move'], edge['games'], edge['score'])
+
+Командная строка:
+    python position_graph.py openings.sqlite3 --add partii/*.txt --store games.sqlite3
+    python position_graph.py openings.sqlite3 --show "e4 e5"
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+
+from chess import GAME_RESULTS, ChessGame, Position, decode_move, encode_move
+
+# Сколько первых полуходов партии попадает в граф (None - вся партия)
+DEFAULT_MAX_PLIES = 40
+
+# Сколько разных ребер копится в памяти перед записью в базу (запись - только на границе
+# источника, вместе с его отметкой, поэтому при сбое источник не добавится дважды)
+FLUSH_EDGES = 50000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS edges (
+    parent INTEGER NOT NULL,
+    move INTEGER NOT NULL,
+    child INTEGER NOT NULL,
+    games INTEGER NOT NULL,
+    white_wins INTEGER NOT NULL,
+    draws INTEGER NOT NULL,
+    black_wins INTEGER NOT NULL,
+    PRIMARY KEY (parent, move)
+) WITHOUT ROWID;
+
+-- Уже добавленные файлы партий (marker = 1)
+CREATE TABLE IF NOT EXISTS sources (
+    name TEXT PRIMARY KEY,
+    marker INTEGER NOT NULL
+);
+
+-- Партии хранилищ в графе: версия (created_at в хранилище) и добавленные ходы, чтобы
+-- при повторном сохранении или удалении партии вычесть ее прежние ребра
+CREATE TABLE IF NOT EXISTS store_games (
+    store TEXT NOT NULL,
+    game_id INTEGER NOT NULL,
+    version REAL NOT NULL,
+    result TEXT NOT NULL,
+    moves TEXT NOT NULL,
+    PRIMARY KEY (store, game_id)
+) WITHOUT ROWID;
+"""
+
+UPSERT_EDGE = """
+INSERT INTO edges (parent, move, child, games, white_wins, draws, black_wins)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (parent, move) DO UPDATE SET
+    games = games + excluded.games,
+    white_wins = white_wins + excluded.white_wins,
+    draws = draws + excluded.draws,
+    black_wins = black_wins + excluded.black_wins
+"""
+
+# Результат партии в конце текста
+RESULT_PATTERN = re.compile('(' + '|'.join(map(re.escape, GAME_RESULTS)) + r')\s*$')
+
+
+class PositionGraph:
+    """Граф позиций на SQLite: ребра (позиция, ход) -> позиция со статистикой партий"""
+
+    def __init__(self, path, max_plies=DEFAULT_MAX_PLIES):
+        self.path = path
+        self.max_plies = max_plies
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+        self._pending = {}
+        # Отметки источников и партий хранилищ (None - партия удалена), ребра которых еще
+        # в памяти, и источник, который сейчас добавляется
+        self._pending_sources = {}
+        self._pending_store_games = {}
+        self._source = None
+        # Были ли вычтены ребра: после записи удаляются ребра без партий
+        self._subtracted = False
+        self._game = ChessGame()
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def flush(self):
+        """Записать накопленные ребра и отметки источников одной транзакцией"""
+        with self.connection:
+            if self._pending:
+                self.connection.executemany(
+                    UPSERT_EDGE,
+                    [(parent, move) + tuple(stats) for (parent, move), stats in self._pending.items()],
+                )
+            if self._subtracted:
+                self.connection.execute("DELETE FROM edges WHERE games <= 0")
+            if self._pending_sources:
+                self.connection.executemany("INSERT OR REPLACE INTO sources (name, marker) VALUES (?, ?)",
+                                            self._pending_sources.items())
+            for (store, game_id), record in self._pending_store_games.items():
+                if record is None:
+                    self.connection.execute("DELETE FROM store_games WHERE store = ? AND game_id = ?",
+                                            (store, game_id))
+                else:
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO store_games (store, game_id, version, result, moves) "
+                        "VALUES (?, ?, ?, ?, ?)", (store, game_id) + record)
+        self._pending = {}
+        self._pending_sources = {}
+        self._pending_store_games = {}
+        self._subtracted = False
+
+    def _add_edge(self, parent, move, child, result, weight=1):
+        """Учесть ход в ребре; weight = -1 вычитает ранее добавленную партию"""
+        stats = self._pending.get((parent, move))
+        if stats is None:
+            stats = self._pending[(parent, move)] = [child, 0, 0, 0, 0]
+        stats[1] += weight
+        if result == '1-0':
+            stats[2] += weight
+        elif result == '1/2-1/2':
+            stats[3] += weight
+        elif result == '0-1':
+            stats[4] += weight
+        if weight < 0:
+            self._subtracted = True
+        # Посреди источника ребра не пишутся: их отметка появится только в конце
+        if len(self._pending) >= FLUSH_EDGES and self._source is None:
+            self.flush()
+
+    def add_game(self, game, result=None):
+        """Добавить сыгранную партию ChessGame: позиции берутся из истории без переигрывания"""
+        result = result or game.get_result()
+        history = game.move_history
+        plies = len(history) if self.max_plies is None else min(len(history), self.max_plies)
+        for ply in range(plies):
+            state = history[ply]
+            child = history[ply + 1]['position'] if ply + 1 < len(history) else game.get_position()
+            move = encode_move(state['from_pos'], state['to_pos'], state.get('promotion'))
+            self._add_edge(state['position'].stable_hash(), move, child.stable_hash(), result)
+        return plies
+
+    def add_notations(self, notations, result='*'):
+        """Проиграть ходы в нотации без вывода и добавить их в граф.
+
+        Возвращает число добавленных полуходов; на первом неразборчивом ходе партия обрывается.
+        """
+        return self._replay(notations, result, 1, self.max_plies)
+
+    def _replay(self, notations, result, weight, max_plies):
+        """Проиграть ходы и учесть их ребра с весом weight (см. add_notations)"""
+        game = self._game
+        game.set_position(Position.initial())
+        parent = game.get_position()
+        plies = 0
+        for notation in notations:
+            if max_plies is not None and plies >= max_plies:
+                break
+            parsed = game.parse_move_notation(notation, game.current_player)
+            if parsed is None:
+                break
+            from_pos, to_pos, promotion = parsed
+            game._apply_move(from_pos, to_pos, promotion or 'Q')
+            child = game.get_position()
+            self._add_edge(parent.stable_hash(), encode_move(from_pos, to_pos, promotion),
+                           child.stable_hash(), result, weight)
+            parent = child
+            plies += 1
+        return plies
+
+    def add_text(self, content):
+        """Добавить партию из текста (1. e4 e5 ... [результат])"""
+        match = RESULT_PATTERN.search(content)
+        return self.add_notations(ChessGame.parse_game_text(content), match.group(1) if match else '*')
+
+    def add_file(self, filename):
+        """Добавить партию из файла; уже добавленный файл пропускается. Возвращает True, если добавлен"""
+        name = os.path.abspath(filename)
+        if self._has_source(name):
+            return False
+        with open(filename, 'r', encoding='utf-8') as f:
+            content = f.read()
+        self._source = name
+        try:
+            self.add_text(content)
+        finally:
+            self._source = None
+        self._mark_source(name, 1)
+        return True
+
+    def add_store(self, store):
+        """Синхронизировать граф с GameStore: новые партии добавляются, сохраненные заново
+        (другой created_at) заменяют прежнюю версию, удаленные вычитаются.
+
+        Возвращает (добавлено, обновлено, удалено).
+        """
+        name = f"store:{os.path.abspath(store.path)}"
+        self.flush()
+        known = {row['game_id']: row for row in self.connection.execute(
+            "SELECT game_id, version, result, moves FROM store_games WHERE store = ?", (name,))}
+        versions = store.connection.execute("SELECT id, created_at FROM games ORDER BY id").fetchall()
+
+        added = updated = 0
+        # Каждая партия хранилища - отдельный источник: ее ребра (в том числе вычтенные
+        # ребра прежней версии) пишутся вместе с ее отметкой, запись возможна между партиями
+        for game_id, version in versions:
+            old = known.pop(game_id, None)
+            if old is not None and old['version'] == version:
+                continue
+            record = store.connection.execute("SELECT result, moves FROM games WHERE id = ?",
+                                              (game_id,)).fetchone()
+            notations = record['moves'].split()
+            self._source = name
+            try:
+                if old is not None:
+                    self._replay(old['moves'].split(), old['result'], -1, None)
+                plies = self.add_notations(notations, record['result'])
+            finally:
+                self._source = None
+            self._mark_store_game(name, game_id, (version, record['result'], ' '.join(notations[:plies])))
+            if old is None:
+                added += 1
+            else:
+                updated += 1
+
+        for game_id, old in known.items():
+            self._source = name
+            try:
+                self._replay(old['moves'].split(), old['result'], -1, None)
+            finally:
+                self._source = None
+            self._mark_store_game(name, game_id, None)
+        return added, updated, len(known)
+
+    def _source_marker(self, name):
+        """Отметка источника (в том числе еще не записанная) или None"""
+        if name in self._pending_sources:
+            return self._pending_sources[name]
+        row = self.connection.execute("SELECT marker FROM sources WHERE name = ?", (name,)).fetchone()
+        return row['marker'] if row else None
+
+    def _has_source(self, name):
+        return self._source_marker(name) is not None
+
+    def _mark_source(self, name, marker):
+        # Отметка пишется той же транзакцией, что и ребра источника: при сбое источник не добавится дважды
+        self._pending_sources[name] = marker
+        if len(self._pending) >= FLUSH_EDGES:
+            self.flush()
+
+    def _mark_store_game(self, name, game_id, record):
+        # Как _mark_source: версия партии пишется той же транзакцией, что и ее ребра
+        self._pending_store_games[(name, game_id)] = record
+        if len(self._pending) >= FLUSH_EDGES:
+            self.flush()
+
+    def children(self, position):
+        """Ходы из позиции по убыванию частоты:
+        [{'move', 'packed', 'child', 'games', 'white_wins', 'draws', 'black_wins', 'score'}]"""
+        self.flush()
+        rows = self.connection.execute(
+            "SELECT * FROM edges WHERE parent = ? ORDER BY games DESC, move", (position.stable_hash(),))
+        edges = []
+        for row in rows:
+            from_pos, to_pos, promotion = decode_move(row['move'])
+            text = self._game.position_to_notation(from_pos) + self._game.position_to_notation(to_pos)
+            edges.append({
+                'move': text + (promotion.lower() if promotion else ''),
+                'packed': row['move'],
+                'child': row['child'],
+                'games': row['games'],
+                'white_wins': row['white_wins'],
+                'draws': row['draws'],
+                'black_wins': row['black_wins'],
+                # Доля очков белых
+                'score': (row['white_wins'] + row['draws'] / 2) / row['games'],
+            })
+        return edges
+
+    def count(self):
+        """Число ребер графа"""
+        self.flush()
+        return self.connection.execute("SELECT COUNT(*) FROM edges").fetchone()[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Граф позиций по коллекции партий")
+    parser.add_argument('graph', help="файл графа SQLite")
+    parser.add_argument('--add', nargs='*', default=[], metavar='FILE', help="файлы партий")
+    parser.add_argument('--store', help="хранилище партий (game_store.py)")
+    parser.add_argument('--max-plies', type=int, default=DEFAULT_MAX_PLIES)
+    parser.add_argument('--show', metavar='MOVES', help="ходы из позиции после этих ходов, например \"e4 e5\"")
+    args = parser.parse_args(argv)
+
+    with PositionGraph(args.graph, args.max_plies) as graph:
+        added = sum(graph.add_file(filename) for filename in args.add)
+        if args.add:
+            print(f"Добавлено партий из файлов: {added} (пропущено {len(args.add) - added})")
+        if args.store:
+            from game_store import GameStore
+
+            with GameStore(args.store) as store:
+                added, updated, removed = graph.add_store(store)
+                print(f"Партии из хранилища: добавлено {added}, обновлено {updated}, удалено {removed}")
+
+        if args.show is not None:
+            game = ChessGame()
+            for notation in args.show.split():
+                parsed = game.parse_move_notation(notation, game.current_player)
+                if parsed is None:
+                    print(f"Неверный ход: {notation}")
+                    return
+                game._apply_move(parsed[0], parsed[1], parsed[2] or 'Q')
+            for edge in graph.children(game.get_position()):
+                print(f"{edge['move']:6} {edge['games']:6} партий  "
+                      f"+{edge['white_wins']} ={edge['draws']} -{edge['black_wins']}  "
+                      f"{edge['score'] * 100:.1f}%")
+        print(f"Ребер в графе: {graph.count()}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
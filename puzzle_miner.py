@@ -0,0 +1,268 @@
+"""Поиск тактических задач в архивах партий.
+
+Партии читаются потоком из файлов сохранения (1. e4 e5 ...) и PGN (несколько партий
+в файле) и проигрываются без вывода. Каждая позиция сначала проходит дешевый фильтр:
+выигрыш материала в следующих ходах партии или шах со взятием. Только отобранные
+позиции проверяются поиском движка: лучший ход должен выигрывать и быть единственным
+(второй ход заметно хуже). Партии обрабатываются в параллельных процессах.
+
+Задачи дописываются в файл по строке: FEN, решение в UCI и источник через табуляцию.
+Обработанные партии отмечаются в файле контрольной точки, поэтому прерванный запуск
+продолжается с того же места:
+
+    python puzzle_miner.py partii/*.txt archive.pgn --output puzzles.tsv --workers 4
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from multiprocessing import Pool
+
+from analysis import analyse
+from chess import PIECE_VALUES, ChessGame
+from engine import capture_value
+
+# Глубина и лимит узлов проверочного поиска
+DEFAULT_DEPTH = 3
+DEFAULT_NODE_LIMIT = 20000
+
+# Задачи ищутся начиная с этого полухода
+MIN_PLY = 8
+
+# Фильтр: выигрыш материала (сантипешки) за столько полуходов партии
+SWING_PLIES = 4
+SWING_THRESHOLD = 200
+
+# Лучший ход должен давать не меньше WIN_THRESHOLD и опережать второй на UNIQUE_MARGIN
+WIN_THRESHOLD = 150
+UNIQUE_MARGIN = 200
+
+# Сколько полуходов решения записывается и сколько полуходов пропускается после задачи
+SOLUTION_PLIES = 3
+PUZZLE_GAP = 4
+
+# Как часто (в партиях) задачи и контрольная точка сбрасываются на диск
+CHECKPOINT_EVERY = 20
+
+TAG_PATTERN = re.compile(r'^\[(\w+)\s+"(.*)"\]\s*$')
+
+# Текст ходов, начинающийся с хода черных (позиция из тега FEN): 1... e5 2. Nf3
+BLACK_FIRST_PATTERN = re.compile(r'^\s*(?:\{[^}]*\}\s*)*\d+\.\.\.\s*([^\s{]+)')
+
+
+def iter_pgn(filename):
+    """Партии из PGN: (номер, теги, текст ходов)"""
+    tags = {}
+    movetext = []
+    index = 0
+    with open(filename, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            match = TAG_PATTERN.match(line)
+            if match:
+                if movetext:
+                    yield index, tags, ' '.join(movetext)
+                    index += 1
+                    tags, movetext = {}, []
+                tags[match.group(1)] = match.group(2)
+            elif line.strip():
+                movetext.append(line.strip())
+    if movetext:
+        yield index, tags, ' '.join(movetext)
+
+
+def iter_games(paths):
+    """Задания на партии из файлов: {'id', 'fen', 'moves'}; PGN - по расширению .pgn"""
+    for path in paths:
+        if path.lower().endswith('.pgn'):
+            for index, tags, movetext in iter_pgn(path):
+                # Убираем числовые оценки ($1) и номера ходов черных (1...); первый ход черных
+                # без предшествующего хода белых разбор по номерам ходов не видит - добавляем его сами
+                movetext = re.sub(r'\$\d+', ' ', movetext)
+                first = BLACK_FIRST_PATTERN.match(movetext)
+                moves = ChessGame.parse_game_text(re.sub(r'\d+\.\.\.', ' ', movetext))
+                if first:
+                    moves.insert(0, first.group(1))
+                yield {
+                    'id': f"{path}:{index}",
+                    'fen': tags.get('FEN'),
+                    'moves': moves,
+                }
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                yield {'id': f"{path}:0", 'fen': None, 'moves': ChessGame.parse_game_text(f.read())}
+
+
+def material(position):
+    """Материал белых минус материал черных"""
+    board = position.board
+    return sum(value * (board.count(piece.upper().encode()) - board.count(piece.encode()))
+               for piece, value in PIECE_VALUES.items())
+
+
+def has_checking_capture(game):
+    """Есть ли у стороны, которая ходит, взятие с шахом"""
+    defender = 'black' if game.current_player == 'white' else 'white'
+    for move in game.generate_moves(game.current_player):
+        if not capture_value(game, move):
+            continue
+        game._apply_packed_move(move)
+        check = game.is_in_check(defender)
+        game._undo_last_move()
+        if check:
+            return True
+    return False
+
+
+def confirm(game, depth, node_limit):
+    """Проверка поиском: лучший вариант {'score', 'mate', 'pv', 'pv_notation'},
+    если лучший ход выигрывает и единственный, иначе None"""
+    info = None
+    for info in analyse(game, multipv=2, max_depth=depth, node_limit=node_limit):
+        pass
+    if info is None or len(info['lines']) < 2:
+        # Ходов нет, единственный легальный ход или поиск не завершил ни одной глубины
+        return None
+    best, second = info['lines']
+    if best['mate'] is not None and best['mate'] > 0:
+        if second['mate'] is not None and second['mate'] > 0:
+            return None
+    elif best['score'] < WIN_THRESHOLD or best['score'] - second['score'] < UNIQUE_MARGIN:
+        return None
+    return best
+
+
+def mine_game(task):
+    """Найти задачи в одной партии; выполняется в процессе-исполнителе"""
+    game = ChessGame()
+    if task['fen']:
+        game.load_fen(task['fen'])
+    for notation in task['moves']:
+        parsed = game.parse_move_notation(notation, game.current_player)
+        if parsed is None:
+            break
+        game._apply_move(parsed[0], parsed[1], parsed[2] or 'Q')
+
+    history = game.move_history
+    materials = [material(state['position']) for state in history] + [material(game.get_position())]
+    stats = {'id': task['id'], 'positions': 0, 'screened': 0, 'puzzles': []}
+    work = ChessGame()
+    next_ply = MIN_PLY
+    for ply in range(MIN_PLY, len(history)):
+        if ply < next_ply:
+            continue
+        state = history[ply]
+        stats['positions'] += 1
+        work.set_position(state['position'])
+        work.halfmove_clock = state['halfmove_clock']
+        work.move_count = state['move_count']
+
+        # Дешевый фильтр: партия выиграла материал или есть взятие с шахом
+        sign = 1 if work.current_player == 'white' else -1
+        future = materials[ply + 1:ply + 1 + SWING_PLIES]
+        swing = max(sign * (value - materials[ply]) for value in future)
+        if swing < SWING_THRESHOLD and not has_checking_capture(work):
+            continue
+        stats['screened'] += 1
+
+        line = confirm(work, task['depth'], task['node_limit'])
+        if line is None:
+            continue
+        # Размен, а не задача: лучший ход отыгрывает фигуру, только что взятую соперником
+        previous = history[ply - 1]
+        if previous['captured_piece'] != ' ' and line['pv'][0][1] == previous['to_pos']:
+            continue
+        solution = ' '.join(line['pv_notation'][:SOLUTION_PLIES])
+        stats['puzzles'].append((work.get_fen(), solution, f"{task['id']}:{ply}"))
+        next_ply = ply + PUZZLE_GAP
+    return stats
+
+
+class PuzzleMiner:
+    """Запуск поиска задач с контрольной точкой и дописыванием результатов"""
+
+    def __init__(self, output, checkpoint=None, depth=DEFAULT_DEPTH, node_limit=DEFAULT_NODE_LIMIT):
+        self.output = output
+        self.checkpoint = checkpoint or output + '.checkpoint'
+        self.depth = depth
+        self.node_limit = node_limit
+        self.done = self._load_done()
+
+    def _load_done(self):
+        """Уже обработанные партии: из контрольной точки и из источников записанных задач"""
+        done = set()
+        if os.path.exists(self.checkpoint):
+            with open(self.checkpoint, 'r', encoding='utf-8') as f:
+                done.update(line.rstrip('\n') for line in f if line.endswith('\n'))
+        # Задачи пишутся раньше отметки о партии: партия с записанными задачами уже обработана
+        if os.path.exists(self.output):
+            with open(self.output, 'r', encoding='utf-8') as f:
+                for line in f:
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) == 3:
+                        done.add(fields[2].rsplit(':', 1)[0])
+        return done
+
+    def tasks(self, paths):
+        for task in iter_games(paths):
+            if task['id'] not in self.done:
+                task['depth'] = self.depth
+                task['node_limit'] = self.node_limit
+                yield task
+
+    def run(self, paths, workers=1):
+        """Обработать партии; возвращает сводку {'games', 'positions', 'screened', 'puzzles', 'time'}"""
+        summary = {'games': 0, 'positions': 0, 'screened': 0, 'puzzles': 0}
+        start = time.perf_counter()
+        pool = Pool(workers) if workers > 1 else None
+        try:
+            results = pool.imap_unordered(mine_game, self.tasks(paths)) if pool else map(mine_game, self.tasks(paths))
+            # Контрольная точка - журнал обработанных партий, по строке на партию: запись
+            # не растет с числом партий; на диск оба файла сбрасываются раз в CHECKPOINT_EVERY партий
+            with open(self.output, 'a', encoding='utf-8') as out, \
+                    open(self.checkpoint, 'a', encoding='utf-8') as checkpoint:
+                for stats in results:
+                    for puzzle in stats['puzzles']:
+                        out.write('\t'.join(puzzle) + '\n')
+                    out.flush()
+                    checkpoint.write(stats['id'] + '\n')
+                    checkpoint.flush()
+                    self.done.add(stats['id'])
+
+                    summary['games'] += 1
+                    summary['puzzles'] += len(stats['puzzles'])
+                    for key in ('positions', 'screened'):
+                        summary[key] += stats[key]
+                    if summary['games'] % CHECKPOINT_EVERY == 0:
+                        os.fsync(out.fileno())
+                        os.fsync(checkpoint.fileno())
+                os.fsync(out.fileno())
+                os.fsync(checkpoint.fileno())
+        finally:
+            if pool:
+                pool.terminate()
+        summary['time'] = time.perf_counter() - start
+        return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Поиск тактических задач в партиях")
+    parser.add_argument('files', nargs='+', help="файлы партий (.pgn или формат сохранения)")
+    parser.add_argument('--output', default='puzzles.tsv', help="файл задач (FEN, решение, источник)")
+    parser.add_argument('--checkpoint', help="файл контрольной точки (по умолчанию <output>.checkpoint)")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--depth', type=int, default=DEFAULT_DEPTH, help="глубина проверочного поиска")
+    parser.add_argument('--nodes', type=int, default=DEFAULT_NODE_LIMIT, help="лимит узлов на позицию")
+    args = parser.parse_args(argv)
+
+    miner = PuzzleMiner(args.output, args.checkpoint, args.depth, args.nodes)
+    if miner.done:
+        print(f"Продолжение: уже обработано партий {len(miner.done)}")
+    summary = miner.run(args.files, args.workers)
+    print(f"Партий: {summary['games']}, позиций: {summary['positions']}, "
+          f"после фильтра: {summary['screened']}, задач: {summary['puzzles']}")
+    print(f"Время: {summary['time']:.1f} с")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,270 @@
+"""Турнир движков: множество партий в параллельных процессах со сводной статистикой.
+
+Пример:
+    python tournament.py --games 20 --players random greedy --workers 4
+"""
+import argparse
+import json
+import math
+import sys
+import time
+from multiprocessing import Pool
+
+from chess import ChessGame
+from engine import create_player
+
+# Набор дебютов: партии начинаются с этих ходов
+OPENINGS = {
+    'startpos': "",
+    'italian': "e4 e5 Nf3 Nc6 Bc4 Bc5",
+    'sicilian': "e4 c5 Nf3 d6 d4 cxd4 Nxd4 Nf6",
+    'queens_gambit': "d4 d5 c4 e6 Nc3 Nf6",
+    'french': "e4 e6 d4 d5 Nc3 Bb4",
+    'caro_kann': "e4 c6 d4 d5 Nc3 dxe4 Nxe4",
+    'kings_indian': "d4 Nf6 c4 g6 Nc3 Bg7 e4 d6",
+    'english': "c4 e5 Nc3 Nf6 g3 d5",
+}
+
+DEFAULT_MAX_PLIES = 300
+
+
+def a_color(index):
+    """Цвет игрока A в партии с этим номером: белые в четных партиях"""
+    return 'white' if index % 2 == 0 else 'black'
+
+
+def apply_opening(game, opening):
+    """Разыграть дебютные ходы из короткой нотации"""
+    for notation in opening.split():
+        parsed = game.parse_move_notation(notation, game.current_player)
+        if parsed is None:
+            raise ValueError(f"Неверный дебютный ход: {notation}")
+        from_pos, to_pos, promotion = parsed
+        game._apply_move(from_pos, to_pos, promotion or 'Q')
+
+
+def adjudicate(game, repetitions, max_plies):
+    """Результат партии по правилам или None, если партия продолжается"""
+    color = game.current_player
+    if game.is_checkmate(color):
+        return ('0-1' if color == 'white' else '1-0'), 'checkmate'
+    if game.is_stalemate(color):
+        return '1/2-1/2', 'stalemate'
+    if game.halfmove_clock >= 100:
+        return '1/2-1/2', 'fifty_moves'
+    if repetitions.get((game.get_position_key(), color), 0) >= 3:
+        return '1/2-1/2', 'repetition'
+    if game.is_insufficient_material():
+        return '1/2-1/2', 'insufficient_material'
+    if len(game.move_history) >= max_plies:
+        return '1/2-1/2', 'max_plies'
+    return None
+
+
+def play_game(task):
+    """Сыграть одну партию; task — словарь с описанием игроков, дебюта и зерна"""
+    game = ChessGame()
+    apply_opening(game, task['opening'])
+    players = {
+        'white': create_player(task['white'], task['seed']),
+        'black': create_player(task['black'], task['seed'] + 1),
+    }
+    move_times = {'white': [], 'black': []}
+    repetitions = {}
+
+    start = time.perf_counter()
+    while True:
+        key = (game.get_position_key(), game.current_player)
+        repetitions[key] = repetitions.get(key, 0) + 1
+
+        outcome = adjudicate(game, repetitions, task['max_plies'])
+        if outcome is not None:
+            break
+
+        color = game.current_player
+        move_start = time.perf_counter()
+        move = players[color].choose_move(game)
+        move_times[color].append(time.perf_counter() - move_start)
+        game._apply_move(move[0], move[1], move[2] or 'Q')
+
+    game.game_over = True
+    result, reason = outcome
+    return {
+        'index': task['index'],
+        'white': task['white'],
+        'black': task['black'],
+        'opening': task['opening_name'],
+        'result': result,
+        'reason': reason,
+        'plies': len(game.move_history),
+        'duration': time.perf_counter() - start,
+        'move_times': move_times,
+    }
+
+
+def build_tasks(player_a, player_b, games, openings=None, max_plies=DEFAULT_MAX_PLIES, seed=0):
+    """Задания на партии: дебюты по кругу, цвета меняются через партию"""
+    openings = openings or list(OPENINGS)
+    tasks = []
+    for index in range(games):
+        opening_name = openings[(index // 2) % len(openings)]
+        a_is_white = a_color(index) == 'white'
+        tasks.append({
+            'index': index,
+            'white': player_a if a_is_white else player_b,
+            'black': player_b if a_is_white else player_a,
+            'opening_name': opening_name,
+            'opening': OPENINGS[opening_name],
+            'max_plies': max_plies,
+            'seed': seed + index * 2,
+        })
+    return tasks
+
+
+def run_tournament(tasks, workers=1):
+    """Сыграть партии и отдавать результаты по мере готовности"""
+    if workers <= 1:
+        for task in tasks:
+            yield play_game(task)
+        return
+
+    with Pool(workers) as pool:
+        for result in pool.imap_unordered(play_game, tasks):
+            yield result
+
+
+def percentile(values, fraction):
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, math.ceil(fraction * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def elo_difference(score):
+    """Разница Эло по доле набранных очков; None при 0% или 100%"""
+    if score <= 0.0 or score >= 1.0:
+        return None
+    return 400 * math.log10(score / (1 - score))
+
+
+def summarize(results, elapsed):
+    """Сводная статистика турнира с точки зрения игрока A.
+
+    Игроки различаются по месту (цвет по номеру партии), а не по описанию:
+    в игре движка с самим собой описания совпадают.
+    """
+    points = []
+    times = {'A': [], 'B': []}
+    reasons = {}
+    for result in results:
+        color_a = a_color(result['index'])
+        color_b = 'black' if color_a == 'white' else 'white'
+        if result['result'] == '1/2-1/2':
+            points.append(0.5)
+        else:
+            winner = 'white' if result['result'] == '1-0' else 'black'
+            points.append(1.0 if winner == color_a else 0.0)
+        times['A'].extend(result['move_times'][color_a])
+        times['B'].extend(result['move_times'][color_b])
+        reasons[result['reason']] = reasons.get(result['reason'], 0) + 1
+
+    games = len(results)
+    score = sum(points) / games if games else 0.0
+    elo = elo_difference(score)
+    margin = None
+    if elo is not None and games > 1:
+        variance = sum((p - score) ** 2 for p in points) / (games - 1)
+        error = 1.96 * math.sqrt(variance / games)
+        low = elo_difference(max(score - error, 1e-6))
+        high = elo_difference(min(score + error, 1 - 1e-6))
+        margin = (high - low) / 2
+
+    return {
+        'games': games,
+        'elapsed': elapsed,
+        'games_per_second': games / elapsed if elapsed else 0.0,
+        'average_plies': sum(r['plies'] for r in results) / games if games else 0.0,
+        'score': score,
+        'wins': points.count(1.0),
+        'draws': points.count(0.5),
+        'losses': points.count(0.0),
+        'elo': elo,
+        'elo_margin': margin,
+        'reasons': reasons,
+        'move_time': {
+            seat: {
+                'p50': percentile(values, 0.50),
+                'p99': percentile(values, 0.99),
+                'moves': len(values),
+            }
+            for seat, values in times.items()
+        },
+    }
+
+
+def print_summary(summary, player_a, player_b):
+    """Вывести сводку турнира"""
+    print("\n" + "=" * 50)
+    print(f"ИТОГИ: {player_a} против {player_b}")
+    print("=" * 50)
+    print(f"Партий: {summary['games']} за {summary['elapsed']:.1f} с "
+          f"({summary['games_per_second']:.2f} партий/с)")
+    print(f"Средняя длина: {summary['average_plies']:.1f} полуходов")
+    print(f"+{summary['wins']} ={summary['draws']} -{summary['losses']} "
+          f"(очки A ({player_a}): {summary['score'] * 100:.1f}%)")
+    if summary['elo'] is None:
+        print("Эло: не определено (все партии с одним исходом)")
+    elif summary['elo_margin'] is None:
+        print(f"Эло: {summary['elo']:+.0f}")
+    else:
+        print(f"Эло: {summary['elo']:+.0f} ± {summary['elo_margin']:.0f}")
+    print("Окончания: " + ", ".join(f"{k}={v}" for k, v in sorted(summary['reasons'].items())))
+    names = {'A': player_a, 'B': player_b}
+    for seat, stats in summary['move_time'].items():
+        print(f"Время на ход {seat} ({names[seat]}): p50 {stats['p50'] * 1e3:.2f} мс, "
+              f"p99 {stats['p99'] * 1e3:.2f} мс ({stats['moves']} ходов)")
+    print("=" * 50)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Турнир шахматных движков")
+    parser.add_argument('--games', type=int, default=10, help="число партий")
+    parser.add_argument('--players', nargs=2, default=['random', 'greedy'],
+                        metavar=('A', 'B'), help="игроки: random, greedy, search[:глубина]")
+    parser.add_argument('--workers', type=int, default=1, help="число процессов")
+    parser.add_argument('--openings', nargs='*', choices=sorted(OPENINGS), help="набор дебютов")
+    parser.add_argument('--max-plies', type=int, default=DEFAULT_MAX_PLIES,
+                        help="ничья по достижении числа полуходов")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--jsonl', help="файл для потоковой записи результатов")
+    args = parser.parse_args(argv)
+
+    player_a, player_b = args.players
+    tasks = build_tasks(player_a, player_b, args.games, args.openings, args.max_plies, args.seed)
+    output = open(args.jsonl, 'a', encoding='utf-8') if args.jsonl else None
+
+    results = []
+    start = time.perf_counter()
+    try:
+        for result in run_tournament(tasks, args.workers):
+            results.append(result)
+            print(f"[{len(results)}/{len(tasks)}] #{result['index']} {result['white']} - "
+                  f"{result['black']} ({result['opening']}): {result['result']} "
+                  f"{result['reason']}, {result['plies']} полуходов")
+            if output:
+                record = {k: v for k, v in result.items() if k != 'move_times'}
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+    finally:
+        if output:
+            output.close()
+
+    summary = summarize(results, time.perf_counter() - start)
+    print_summary(summary, player_a, player_b)
+    return summary
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
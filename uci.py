@@ -0,0 +1,159 @@
+"""Интерфейс UCI для ChessGame (запуск: python chess.py --uci).
+
+Поддерживаются команды uci, isready, ucinewgame, setoption (MultiPV),
+position startpos/fen ... moves ..., go depth/movetime/nodes/infinite/wtime/btime,
+stop и quit. Поиск идет в фоновом потоке, поэтому stop срабатывает сразу.
+"""
+import sys
+import threading
+
+from analysis import analyse, format_move
+from chess import ChessGame, decode_move
+
+ENGINE_NAME = "ChessGame"
+ENGINE_AUTHOR = "katezuu"
+
+# Доля оставшегося времени на ход при игре с часами
+MOVES_TO_GO = 30
+
+
+class UCIEngine:
+    """Обработчик команд UCI поверх ChessGame"""
+
+    def __init__(self, output=None):
+        self.output = output or sys.stdout
+        self.game = ChessGame()
+        self.multipv = 1
+        self.search_thread = None
+        self.stop_event = threading.Event()
+        self.output_lock = threading.Lock()
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def handle(self, line):
+        """Обработать одну команду; возвращает False на quit"""
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+
+        if command == 'uci':
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send("option name MultiPV type spin default 1 min 1 max 32")
+            self.send("uciok")
+        elif command == 'isready':
+            self.send("readyok")
+        elif command == 'ucinewgame':
+            self.stop()
+            self.game = ChessGame()
+        elif command == 'setoption':
+            self.set_option(args)
+        elif command == 'position':
+            self.stop()
+            self.set_position(args)
+        elif command == 'go':
+            self.stop()
+            self.go(args)
+        elif command == 'stop':
+            self.stop()
+        elif command == 'quit':
+            self.stop()
+            return False
+        return True
+
+    def set_option(self, args):
+        """setoption name <имя> value <значение>"""
+        if 'name' not in args:
+            return
+        name_end = args.index('value') if 'value' in args else len(args)
+        name = ' '.join(args[args.index('name') + 1:name_end]).lower()
+        value = ' '.join(args[name_end + 1:])
+        if name == 'multipv' and value.isdigit():
+            self.multipv = max(1, min(32, int(value)))
+
+    def set_position(self, args):
+        """position startpos|fen <FEN> [moves <ход>...]"""
+        moves_index = args.index('moves') if 'moves' in args else len(args)
+        game = ChessGame()
+        try:
+            if args and args[0] == 'fen':
+                game.load_fen(' '.join(args[1:moves_index]))
+            elif not args or args[0] != 'startpos':
+                return
+        except ValueError as e:
+            self.send(f"info string {e}")
+            return
+
+        # Ходы от GUI применяются без проверки мата и пата, но только корректные: ход с пустой
+        # клетки или чужой фигурой сломал бы доску. Проверяется один ход (is_valid_move), а не
+        # генерация всех легальных ходов на каждом полуходе. Остаток строки после неверного хода
+        # отбрасывается
+        for text in args[moves_index + 1:]:
+            parsed = game.parse_uci_move(text)
+            if parsed is None or not game.is_valid_move(parsed[0], parsed[1])[0]:
+                self.send(f"info string Неверный ход: {text}")
+                break
+            from_pos, to_pos, promotion = parsed
+            game._apply_move(from_pos, to_pos, promotion or 'Q')
+        self.game = game
+
+    def go(self, args):
+        """go depth N | movetime MS | nodes N | infinite | wtime/btime/winc/binc"""
+        params = {}
+        for index, token in enumerate(args):
+            if token in ('depth', 'movetime', 'nodes', 'wtime', 'btime', 'winc', 'binc') \
+                    and index + 1 < len(args) and args[index + 1].lstrip('-').isdigit():
+                params[token] = int(args[index + 1])
+
+        movetime = params.get('movetime')
+        if movetime is None and 'infinite' not in args:
+            side = 'w' if self.game.current_player == 'white' else 'b'
+            remaining = params.get(f'{side}time')
+            if remaining is not None:
+                movetime = max(1, remaining // MOVES_TO_GO + params.get(f'{side}inc', 0) // 2)
+
+        self.stop_event = threading.Event()
+        self.search_thread = threading.Thread(
+            target=self._search,
+            args=(self.game, params.get('depth'), params.get('nodes'),
+                  movetime / 1000 if movetime is not None else None, self.stop_event),
+            daemon=True,
+        )
+        self.search_thread.start()
+
+    def _search(self, game, depth, nodes, movetime, stop_event):
+        """Фоновый поиск: строки info по глубинам, в конце bestmove"""
+        best_move = None
+        for info in analyse(game, multipv=self.multipv, max_depth=depth, node_limit=nodes,
+                            movetime=movetime, stop_event=stop_event):
+            for index, line in enumerate(info['lines'], 1):
+                score = f"mate {line['mate']}" if line['mate'] is not None else f"cp {line['score']}"
+                self.send(f"info depth {info['depth']} multipv {index} score {score} "
+                          f"nodes {info['nodes']} nps {info['nps']} time {int(info['time'] * 1000)} "
+                          f"pv {' '.join(line['pv_notation'])}")
+            if info['lines']:
+                best_move = info['lines'][0]['pv_notation'][0]
+
+        if best_move is None:
+            moves = game.generate_moves(game.current_player)
+            best_move = format_move(game, decode_move(moves[0])) if moves else '0000'
+        self.send(f"bestmove {best_move}")
+
+    def stop(self):
+        """Остановить текущий поиск и дождаться bestmove"""
+        if self.search_thread is not None:
+            self.stop_event.set()
+            self.search_thread.join()
+            self.search_thread = None
+
+
+def main(input_stream=None):
+    engine = UCIEngine()
+    for line in input_stream or sys.stdin:
+        if not engine.handle(line.strip()):
+            break
+    engine.stop()